@@ -1,25 +1,135 @@
 """
 Django admin configuration for chat application.
 
-This module configures the Django admin interface for chat models.
-Currently no models are registered for admin access, but this can be
-extended to provide admin management of chats and messages if needed.
+Chats and messages are the largest tables of the project, so both admins
+are built on ``LargeTableAdmin`` (estimated counts, primary key and
+prefix search) and never render selects over users, chats or messages.
+
+Denormalized counters and pointers are read-only, and messages cannot be
+edited or hard-deleted here: changes have to go through the message
+manager so versions, counters and broadcasts stay consistent. Messages
+are soft-deleted with the "Delete selected messages" action instead.
 """
 
-from django.contrib import admin
-
-# Register your models here.
-# 
-# To enable admin management of chat models, uncomment and customize:
-# 
-# from .models import Chat, Message
-# 
-# @admin.register(Chat)
-# class ChatAdmin(admin.ModelAdmin):
-#     list_display = ['id', 'created_at', 'updated_at']
-#     filter_horizontal = ['participants']
-# 
-# @admin.register(Message) 
-# class MessageAdmin(admin.ModelAdmin):
-#     list_display = ['id', 'chat', 'sender', 'created_at']
-#     list_filter = ['created_at']
+from django.contrib import admin, messages
+from django.urls import reverse
+from django.utils.html import format_html
+from django.utils.text import Truncator
+
+from chat_backend.admin_tools import LargeTableAdmin
+
+from .models import Chat, Message
+
+
+@admin.register(Chat)
+class ChatAdmin(LargeTableAdmin):
+    """
+    Admin interface for chats.
+
+    Search takes a chat ID or the start of a group title.
+    """
+
+    list_display = (
+        "id",
+        "kind",
+        "title",
+        "member_count",
+        "message_count",
+        "last_activity_at",
+        "created_at",
+        "messages_link",
+    )
+    list_filter = ("kind",)
+    search_fields = ("^title",)
+    search_help_text = "Chat ID or the start of a group title"
+    ordering = ("-id",)
+
+    fields = (
+        "kind",
+        "title",
+        "retention_days",
+        "created_by",
+        "member_count",
+        "message_count",
+        "last_seq",
+        "last_message",
+        "last_activity_at",
+        "created_at",
+        "updated_at",
+    )
+    readonly_fields = (
+        "kind",
+        "created_by",
+        "member_count",
+        "message_count",
+        "last_seq",
+        "last_message",
+        "last_activity_at",
+        "created_at",
+        "updated_at",
+    )
+
+    def has_add_permission(self, request):
+        # Chats are created through the API, which also adds the members
+        return False
+
+    @admin.display(description="Messages")
+    def messages_link(self, obj):
+        """Link to the chat's messages in the message admin."""
+        url = reverse("admin:chat_message_changelist")
+        return format_html('<a href="{}?chat__id__exact={}">View</a>', url, obj.id)
+
+
+@admin.register(Message)
+class MessageAdmin(LargeTableAdmin):
+    """
+    Read-only admin interface for messages.
+
+    Search takes a message ID; open a chat's messages from the chat admin.
+    """
+
+    list_display = ("id", "chat", "sender", "preview", "created_at", "deleted_at")
+    list_select_related = ("chat", "sender")
+    search_fields = ("=id",)
+    search_help_text = "Message ID"
+    # Served by the created_at index, or chat_created_idx within a chat
+    ordering = ("-created_at",)
+    raw_id_fields = ("chat", "sender")
+    actions = ("soft_delete",)
+
+    def get_search_results(self, request, queryset, search_term):
+        """Only search by ID; message content is not indexed for search."""
+        if search_term.strip() and not search_term.strip().isdigit():
+            return queryset.none(), False
+        return super().get_search_results(request, queryset, search_term)
+
+    def get_actions(self, request):
+        actions = super().get_actions(request)
+        # Hard deletes would skip the counters, tombstones and broadcasts
+        actions.pop("delete_selected", None)
+        return actions
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+    @admin.display(description="Content")
+    def preview(self, obj):
+        """First characters of the message content."""
+        return Truncator(obj.content).chars(80)
+
+    @admin.action(description="Delete selected messages (leave tombstones)")
+    def soft_delete(self, request, queryset):
+        """Soft-delete messages like their senders would."""
+        deleted = 0
+        for message_id in queryset.values_list("id", flat=True):
+            if Message.objects.delete_message(message_id) is not None:
+                deleted += 1
+        self.message_user(
+            request, f"Deleted {deleted} messages.", messages.SUCCESS
+        )
@@ -0,0 +1,237 @@
+"""
+Local disk storage for message attachments.
+
+Files live under ``ATTACHMENT_ROOT``:
+
+- ``uploads/<attachment id>`` holds an upload in progress. Each chunk is
+  streamed from the request body to a part file next to it, one block at a
+  time, then copied to its offset in the upload when it is recorded, so an
+  upload is never held in memory and an interrupted one resumes from the
+  last recorded offset.
+- ``blobs/<ab>/<cd>/<sha256>`` holds completed content. A completed upload
+  is hashed (again block by block); when a blob with the same digest
+  exists the upload file is dropped, otherwise it is moved into place. Each
+  distinct file is stored once, however often it is uploaded.
+
+Downloads stream whole files or a single ``Range`` of bytes.
+"""
+
+import hashlib
+import os
+import re
+import shutil
+import uuid
+from pathlib import Path
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+from django.utils import timezone
+
+from .models import Attachment, AttachmentBlob
+
+# Bytes read or written per step when streaming files
+BLOCK_SIZE = 64 * 1024
+
+_RANGE_RE = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+
+class UploadConflict(Exception):
+    """Raised when a chunk does not start at the upload's current offset."""
+
+    def __init__(self, received):
+        super().__init__(f"Upload is at offset {received}")
+        self.received = received
+
+
+def upload_path(attachment_id) -> Path:
+    """Return the path of an upload in progress."""
+    return Path(settings.ATTACHMENT_ROOT) / "uploads" / str(attachment_id)
+
+
+def blob_path(sha256: str) -> Path:
+    """Return the path of a blob's content."""
+    root = Path(settings.ATTACHMENT_ROOT) / "blobs"
+    return root / sha256[:2] / sha256[2:4] / sha256
+
+
+def write_chunk(attachment_id, offset: int, stream, length: int):
+    """
+    Append a chunk to an upload and complete the upload with its last chunk.
+
+    The body is streamed to a part file of its own with no transaction
+    open and the pooled connections released, so a slow or stalled client
+    never holds a database connection.
+    The chunk is then committed in a short transaction: a conditional
+    update moves ``received`` from ``offset`` to the end of the chunk, and
+    only if it matched are the bytes copied into the upload. Concurrent
+    chunks for one offset are applied once; the others are rejected with
+    their part files dropped, leaving the upload untouched.
+
+    Args:
+        attachment_id: ID of the attachment being uploaded
+        offset (int): Offset of the chunk, which must equal ``received``
+        stream: File-like request body
+        length (int): Number of bytes to read from ``stream``
+
+    Returns:
+        Attachment: The attachment after the chunk
+
+    Raises:
+        UploadConflict: If ``offset`` is not the upload's current offset
+        ValueError: If the body is shorter than ``length``, or the completed
+            file does not match the declared digest (the upload restarts)
+    """
+    uploads = Attachment.objects.using(DEFAULT_DB_ALIAS)
+    attachment = uploads.get(id=attachment_id)
+    # Fail fast, before reading the body
+    if attachment.is_complete or offset != attachment.received:
+        raise UploadConflict(attachment.received)
+
+    path = upload_path(attachment_id)
+    part = path.with_name(f"{path.name}.{uuid.uuid4().hex}.part")
+    path.parent.mkdir(parents=True, exist_ok=True)
+    _release_connections()
+    try:
+        with open(part, "wb") as f:
+            remaining = length
+            while remaining:
+                block = stream.read(min(BLOCK_SIZE, remaining))
+                if not block:
+                    raise ValueError("Request body is shorter than Content-Length")
+                f.write(block)
+                remaining -= len(block)
+
+        with transaction.atomic():
+            # The update locks the row until commit, so a concurrent chunk
+            # for the same offset waits here, then matches nothing
+            claimed = uploads.filter(
+                id=attachment_id, received=offset, blob__isnull=True
+            ).update(received=offset + length)
+            if not claimed:
+                raise UploadConflict(
+                    uploads.values_list("received", flat=True).get(id=attachment_id)
+                )
+
+            mode = "r+b" if path.exists() else "wb"
+            with open(part, "rb") as src, open(path, mode) as dst:
+                dst.seek(offset)
+                shutil.copyfileobj(src, dst, BLOCK_SIZE)
+
+            attachment = uploads.get(id=attachment_id)
+            if attachment.received < attachment.size:
+                return attachment
+            completed = _complete(attachment, path)
+    finally:
+        part.unlink(missing_ok=True)
+
+    if not completed:
+        raise ValueError("Uploaded content does not match sha256; upload restarted")
+    return attachment
+
+
+def _release_connections():
+    """
+    Hand this thread's pooled database connections back to their pools.
+
+    Called before waiting on a client: the next query checks a connection
+    out again. Connections in a transaction are kept, since closing them
+    would break it.
+    """
+    for connection in connections.all(initialized_only=True):
+        if getattr(connection, "pool", None) and not connection.in_atomic_block:
+            connection.close()
+
+
+def _complete(attachment, path) -> bool:
+    """
+    Hash a fully received upload and store it as a (shared) blob.
+
+    Returns:
+        bool: False if the content did not match the declared digest, in
+        which case the upload is reset to offset 0
+    """
+    # Drop bytes past the end left behind by a chunk that was rolled back
+    os.truncate(path, attachment.size)
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(BLOCK_SIZE), b""):
+            digest.update(block)
+    sha256 = digest.hexdigest()
+
+    if attachment.expected_sha256 and sha256 != attachment.expected_sha256:
+        path.unlink()
+        attachment.received = 0
+        attachment.save(update_fields=["received"])
+        return False
+
+    blob, _ = AttachmentBlob.objects.get_or_create(
+        sha256=sha256, defaults={"size": attachment.size}
+    )
+    target = blob_path(sha256)
+    if target.exists():
+        path.unlink()
+    else:
+        target.parent.mkdir(parents=True, exist_ok=True)
+        os.replace(path, target)
+
+    attachment.blob = blob
+    attachment.completed_at = timezone.now()
+    attachment.save(update_fields=["received", "blob", "completed_at"])
+    return True
+
+
+def parse_range(header: str, size: int):
+    """
+    Parse a ``Range`` header against a file of ``size`` bytes.
+
+    Only single byte ranges are served; other forms are ignored, which
+    means the whole file is sent (as HTTP allows).
+
+    Args:
+        header (str): Value of the Range header
+        size (int): Size of the file
+
+    Returns:
+        tuple: Inclusive ``(start, end)`` offsets, or None for the whole file
+
+    Raises:
+        ValueError: If the range cannot be satisfied (HTTP 416)
+    """
+    match = _RANGE_RE.match(header.strip())
+    if match is None:
+        return None
+    first, last = match.groups()
+    if not first:
+        if not last:
+            return None
+        suffix = int(last)
+        if suffix == 0:
+            raise ValueError("Empty suffix range")
+        return max(0, size - suffix), size - 1
+
+    start = int(first)
+    if start >= size:
+        raise ValueError("Range starts past the end of the file")
+    end = min(int(last), size - 1) if last else size - 1
+    if end < start:
+        return None
+    return start, end
+
+
+def iter_range(path, start: int, length: int):
+    """
+    Yield ``length`` bytes of a file from ``start``, one block at a time.
+
+    Args:
+        path: File to read
+        start (int): Offset of the first byte
+        length (int): Number of bytes to yield
+    """
+    with open(path, "rb") as f:
+        f.seek(start)
+        while length > 0:
+            block = f.read(min(BLOCK_SIZE, length))
+            if not block:
+                return
+            length -= len(block)
+            yield block
@@ -1,25 +1,38 @@
 """
 WebSocket consumers for real-time chat functionality.
 
-This module provides WebSocket support for live cha        if msg_type == "message.send":
-            # Extract message content and metadata
-            text = (content.get("content") or "").strip()  # Fixed: was getting "metadata" instead of "content"
-            metadata = content.get("metadata") or {}atures using Django Channels.
+This module provides WebSocket support for live chat features using Django Channels.
 Handles user authentication, chat room management, and real-time message broadcasting.
 """
 
+import asyncio
+import sys
+import time
+import uuid
+
 import jwt
 from channels.generic.websocket import AsyncJsonWebsocketConsumer
 from django.conf import settings
-from django.contrib.auth import get_user_model
+from django.core.cache import cache
 from django.utils.module_loading import import_string
 from urllib.parse import parse_qs
-from asgiref.sync import sync_to_async
+from channels.db import database_sync_to_async
+from chat_backend.db_router import routing_context
+from chat_backend.profiling import capture, is_admin, traced
+from users.cache import get_profile
+from users.models import ClaimsUser
+from . import drain
 from .models import Chat, Message
-from .serializers import MessageSerializer
+from .replay import events_since
 
-# Get the user model configured in Django settings
-User = get_user_model()
+
+def group_name(chat_id: int) -> str:
+    """
+    Return the channel layer group of a chat.
+
+    The name is interned, so every connection to a chat shares one string.
+    """
+    return sys.intern(f"chat_{chat_id}")
 
 
 class ChatConsumer(AsyncJsonWebsocketConsumer):
@@ -28,7 +41,22 @@ class ChatConsumer(AsyncJsonWebsocketConsumer):
     
     Manages individual chat room connections, user authentication via JWT tokens,
     and real-time message broadcasting to all connected participants.
+    
+    A node holds one instance per open socket, so the per-connection state
+    is kept small: the user is stored as ``user_id`` and ``role`` (see
+    ``get_user``), the group name is shared per chat, and attributes that
+    idle connections never change keep their class defaults. Measure the
+    cost of an idle connection with ``manage.py soak_websockets``.
     """
+
+    # WebSocket subprotocol with which clients opt into batched frames
+    BATCH_SUBPROTOCOL = "chat.batch"
+
+    # Defaults until a connection first needs its own value
+    batching = False
+    batch = None
+    batch_flush = None
+    typing_at = None
     
     async def connect(self):
         """
@@ -37,15 +65,30 @@ class ChatConsumer(AsyncJsonWebsocketConsumer):
         Authenticates the user via JWT token, verifies chat participation,
         and adds the connection to the appropriate chat group.
         
+        A client resuming a dropped session passes the sequence number of
+        the last event it received as ``last_seq`` next to the token, and
+        gets the events it missed before any live ones (see ``resume``).
+        
+        A client offering the ``BATCH_SUBPROTOCOL`` WebSocket subprotocol
+        gets its frames in batches (see ``send_json``).
+        
         Connection will be closed with specific codes if:
         - 4401: Authentication failed (missing/invalid token)
         - 4403: User is not a participant in the requested chat
+        
+        A draining process (see ``chat.drain``) refuses the handshake before
+        any of these checks.
         """
+        if drain.is_draining():
+            await self.close()
+            return
+
         # Extract chat ID from the URL route
         self.chat_id = int(self.scope["url_route"]["kwargs"]["chat_id"])
         
         # Extract JWT token from query parameters
-        token = parse_qs(self.scope["query_string"].decode()).get("token", [None])[0]
+        query = parse_qs(self.scope["query_string"].decode())
+        token = query.get("token", [None])[0]
         if not token:
             await self.close(code=4401)  # Unauthorized
             return
@@ -55,29 +98,106 @@ class ChatConsumer(AsyncJsonWebsocketConsumer):
             payload = jwt.decode(
                 token, settings.SIMPLE_JWT["SIGNING_KEY"], algorithms=["HS256"]
             )
-            user_id = payload.get("user_id")
-            # Get the user from the database
-            self.user = await sync_to_async(User.objects.get)(id=user_id)
+            user_id = int(payload["user_id"])
+            # Check the user against the profile cache, like REST requests
+            # (see users.authentication). database_sync_to_async runs in the
+            # shared thread-sensitive executor and closes stale or expired
+            # connections around each call, so CONN_MAX_AGE and the pool mode
+            # apply to consumers the same way they apply to requests.
+            with routing_context(user_id=user_id):
+                profile = await database_sync_to_async(get_profile)(user_id)
         except Exception:
-            # Token is invalid or user doesn't exist
+            # Token is invalid or the user could not be loaded
+            await self.close(code=4401)  # Unauthorized
+            return
+        if profile is None or not profile["is_active"]:
             await self.close(code=4401)  # Unauthorized
             return
 
-        # Verify the user is a participant in this chat
-        is_participant = await sync_to_async(
-            Chat.objects.filter(id=self.chat_id, participants=self.user).exists
-        )()
+        # Only the ID and role are kept. The role comes from the profile, like
+        # for REST requests (the token's claim may predate a demotion), and
+        # the role string is shared
+        self.user_id = user_id
+        self.role = sys.intern(profile["role"])
+
+        # Verify the user is a participant in this chat (on the primary if
+        # the user just wrote, e.g. created this chat)
+        with routing_context(user_id=self.user_id):
+            is_participant = await database_sync_to_async(Chat.has_participant)(
+                self.chat_id, self.user_id
+            )
 
         if not is_participant:
             await self.close(code=4403)  # Forbidden
             return
 
-        # Create a unique group name for this chat
-        self.group_name = f"chat_{self.chat_id}"
+        # Group name of this chat (shared by its connections)
+        self.group_name = group_name(self.chat_id)
+
+        # Sequence number of the last event sent to this client
+        self.last_seq = 0
+
+        # Frames waiting to be sent as one batch, if the client opted in.
+        # typing_at (monotonic time of the last typing frame accepted from
+        # this client) and batch_flush keep their class defaults until used.
+        if self.BATCH_SUBPROTOCOL in self.scope.get("subprotocols", []):
+            self.batching = True
+            self.batch = []
 
         # Add this connection to the chat group for broadcasting
         await self.channel_layer.group_add(self.group_name, self.channel_name)
-        await self.accept()
+        await self.accept(self.BATCH_SUBPROTOCOL if self.batching else None)
+        drain.register(self)
+
+        last_seq = query.get("last_seq")
+        if last_seq:
+            await self.resume(last_seq[0])
+
+    def get_user(self):
+        """
+        Build the connection's user for model and permission calls.
+
+        Returns:
+            ClaimsUser: The user, with only the ID and role loaded
+        """
+        return ClaimsUser.from_claims(self.user_id, self.role)
+
+    async def resume(self, last_seq):
+        """
+        Replay the events a reconnecting client missed.
+        
+        Runs before the consumer handles any group message, and after it
+        joined the group: every event is either in the replay buffer or
+        arrives live afterwards, and live events the replay already covered
+        are skipped by their sequence number.
+        
+        Sends ``{"type": "resumed"}`` after the missed events, or
+        ``{"type": "resync"}`` when they are no longer all buffered and the
+        client should reload the chat over the REST API instead.
+        
+        Args:
+            last_seq: Last sequence number the client received
+        """
+        try:
+            last_seq = int(last_seq)
+        except ValueError:
+            last_seq = -1
+        if last_seq < 0:
+            await self.send_json({"type": "resync"})
+            return
+
+        with routing_context(user_id=self.user_id):
+            events = await database_sync_to_async(events_since)(
+                self.chat_id, last_seq
+            )
+        if events is None:
+            await self.send_json({"type": "resync"})
+            return
+
+        self.last_seq = last_seq
+        for event in events:
+            await self.dispatch(event)
+        await self.send_json({"type": "resumed", "data": {"seq": self.last_seq}})
 
     async def disconnect(self, close_code):
         """
@@ -89,6 +209,9 @@ class ChatConsumer(AsyncJsonWebsocketConsumer):
         Args:
             close_code: WebSocket close code indicating reason for disconnection
         """
+        drain.unregister(self)
+        if self.batch_flush is not None:
+            self.batch_flush.cancel()
         if hasattr(self, "group_name"):
             await self.channel_layer.group_discard(self.group_name, self.channel_name)
 
@@ -96,14 +219,39 @@ class ChatConsumer(AsyncJsonWebsocketConsumer):
         """
         Handle incoming JSON messages from the client.
         
-        Processes different message types and performs corresponding actions.
-        Currently supports sending new messages to the chat.
+        Admins may add ``"profile": true`` to any frame to profile its
+        handling (see ``chat_backend.profiling``); the client then gets a
+        ``{"type": "profile", "data": {"id": ...}}`` frame with the ID of
+        the stored profile, unless a frame of another connection was being
+        profiled on the same event loop.
+        
+        Args:
+            content: Parsed JSON content from the client
+        """
+        if content.get("profile") is True and is_admin(self.get_user()):
+            target = f"WS chat {self.chat_id} {content.get('type')}"
+            with capture(self.user_id, target) as profile:
+                await self.handle_frame(content)
+            if profile is not None:
+                await self.send_json({"type": "profile", "data": {"id": profile.id}})
+            return
+
+        await self.handle_frame(content)
+
+    async def handle_frame(self, content):
+        """
+        Process a client frame.
+        
+        Supports sending new messages to the chat (``message.send``) and
+        typing notifications (``{"type": "typing"}``, see ``typing``).
         
         Expected message format:
         {
             "type": "message.send",
             "content": "message text",
-            "metadata": {...}  // optional
+            "metadata": {...},  // optional
+            "client_key": "...",  // optional idempotency key for retries
+            "attachment_ids": ["..."]  // optional completed uploads
         }
         
         Args:
@@ -111,31 +259,97 @@ class ChatConsumer(AsyncJsonWebsocketConsumer):
         """
         msg_type = content.get("type")
 
-        if msg_type == "message.send":
+        if msg_type == "typing":
+            await self.typing()
+
+        elif msg_type == "message.send":
             # Extract message content and metadata
             text = (content.get("content") or "").strip()
             metadata = content.get("metadata") or {}
+            client_key = content.get("client_key")
+            attachment_ids = content.get("attachment_ids") or []
             
-            # Don't process empty messages
+            # Don't process empty messages, metadata claiming to be
+            # enrichment results, or malformed idempotency keys and
+            # attachment lists
             if not text:
                 return
+            if not isinstance(metadata, dict) or Message.ENRICHMENT_KEY in metadata:
+                return
+            if client_key is not None and (
+                not isinstance(client_key, str) or not 0 < len(client_key) <= 64
+            ):
+                return
+            if not isinstance(attachment_ids, list) or (
+                len(attachment_ids) > settings.CHAT_MESSAGE_MAX_ATTACHMENTS
+            ):
+                return
+            try:
+                attachment_ids = [uuid.UUID(str(i)) for i in attachment_ids]
+            except ValueError:
+                return
                 
-            # Create the message in the database
-            msg = await sync_to_async(Message.objects.create)(
-                chat_id=self.chat_id, 
-                sender=self.user, 
-                content=text, 
-                metadata=metadata
-            )
+            # Create the message in the database and bump the chat's activity.
+            # The broadcast to this chat group (including this connection) is
+            # queued in the same transaction and sent by the outbox dispatcher.
+            with routing_context(user_id=self.user_id):
+                try:
+                    await database_sync_to_async(
+                        traced(Message.objects.create_message)
+                    )(
+                        chat_id=self.chat_id,
+                        sender=self.get_user(),
+                        content=text,
+                        metadata=metadata,
+                        client_key=client_key,
+                        attachment_ids=attachment_ids,
+                    )
+                except ValueError:
+                    # Unknown, incomplete or foreign attachments
+                    return
 
-            # Serialize the message for broadcasting
-            data = MessageSerializer(msg).data
-            
-            # Broadcast the new message to all connections in this chat group
-            await self.channel_layer.group_send(
-                self.group_name, 
-                {"type": "chat.message", "message": data}
-            )
+    async def typing(self):
+        """
+        Tell the other participants that this user is typing.
+        
+        Typing notifications are never stored. Each user is announced at
+        most once per ``CHAT_TYPING_INTERVAL_SECONDS`` per chat: frames
+        within the interval are dropped here, and the shared cache
+        coalesces the user's other connections. Clients keep showing the
+        indicator for ``CHAT_TYPING_TTL_SECONDS`` after the last notification,
+        so no "stopped typing" frame is needed.
+        """
+        interval = settings.CHAT_TYPING_INTERVAL_SECONDS
+        now = time.monotonic()
+        if self.typing_at is not None and now - self.typing_at < interval:
+            return
+        self.typing_at = now
+
+        key = f"chat:{self.chat_id}:typing:{self.user_id}"
+        if not await cache.aadd(key, 1, interval):
+            return
+        await self.channel_layer.group_send(
+            self.group_name, {"type": "chat.typing", "user_id": self.user_id}
+        )
+
+    async def chat_typing(self, event):
+        """
+        Handle a participant typing, except for this connection's own user.
+        
+        Args:
+            event: Dictionary containing the ID of the typing user
+        """
+        if event["user_id"] == self.user_id:
+            return
+        await self.send_json(
+            {
+                "type": "typing",
+                "data": {
+                    "user_id": event["user_id"],
+                    "expires_in": settings.CHAT_TYPING_TTL_SECONDS,
+                },
+            }
+        )
 
     async def chat_message(self, event):
         """
@@ -148,4 +362,173 @@ class ChatConsumer(AsyncJsonWebsocketConsumer):
             event: Dictionary containing the message data to send
         """
         # Send the message to the WebSocket client
-        await self.send_json({"type": "message", "data": event["message"]})
+        await self.send_event(event, {"type": "message", "data": event["message"]})
+
+    async def chat_message_edited(self, event):
+        """
+        Handle a message being edited.
+        
+        Args:
+            event: Dictionary containing the message's changed fields
+        """
+        await self.send_event(
+            event, {"type": "message.edited", "data": event["message"]}
+        )
+
+    async def chat_message_deleted(self, event):
+        """
+        Handle a message being deleted (replaced by a tombstone).
+        
+        Args:
+            event: Dictionary containing the tombstone's fields
+        """
+        await self.send_event(
+            event, {"type": "message.deleted", "data": event["message"]}
+        )
+
+    async def chat_message_enriched(self, event):
+        """
+        Handle enrichment results being added to a message's metadata.
+        
+        Args:
+            event: Dictionary containing the changed result keys (null for
+                removed keys), which clients merge into the message's
+                ``metadata.enrichment``
+        """
+        await self.send_event(
+            event, {"type": "message.enriched", "data": event["message"]}
+        )
+
+    async def chat_messages_purged(self, event):
+        """
+        Handle old messages being removed by the retention policy.
+        
+        Args:
+            event: Dictionary with ``before``, the time before which the
+                chat's messages were deleted
+        """
+        await self.send_event(
+            event, {"type": "messages.purged", "data": {"before": event["before"]}}
+        )
+
+    async def chat_members_added(self, event):
+        """
+        Handle members being added to a group chat.
+        
+        Args:
+            event: Dictionary containing the IDs of the added users
+        """
+        await self.send_event(
+            event, {"type": "members.added", "data": {"user_ids": event["user_ids"]}}
+        )
+
+    async def chat_member_removed(self, event):
+        """
+        Handle a member being removed from a group chat.
+        
+        Notifies the client, and closes the connection if the removed member
+        is the user of this connection.
+        
+        Args:
+            event: Dictionary containing the ID of the removed user
+        """
+        await self.send_event(
+            event, {"type": "member.removed", "data": {"user_id": event["user_id"]}}
+        )
+        if event["user_id"] == self.user_id:
+            await self.close(code=4403)  # Forbidden
+
+    async def chat_drain(self, event):
+        """
+        Ask the client to reconnect later, then close the connection.
+        
+        Sent by ``chat.drain`` while the process drains before a deploy.
+        The client should reconnect after ``after_ms`` milliseconds, passing
+        the ``last_seq`` it received so the session resumes.
+        
+        Args:
+            event: Dictionary containing the client's reconnect delay
+        """
+        await self.send_json(
+            {"type": "reconnect", "data": {"after_ms": event["after_ms"]}}
+        )
+        await self.close(code=1012)  # Service Restart
+
+    async def send_json(self, content, close=False):
+        """
+        Send a frame to the client, batching frames when negotiated.
+        
+        With batching, frames are held for up to ``CHAT_WS_BATCH_WINDOW_MS``
+        (or until ``CHAT_WS_BATCH_MAX_FRAMES`` are waiting) and sent in order
+        as one ``{"type": "batch", "data": [frame, ...]}`` frame, so a burst
+        of events costs one encode call and one WebSocket frame per client
+        instead of one each. The window starts at the first held frame,
+        which bounds the added latency.
+        
+        Args:
+            content: JSON frame to send
+            close: Close the connection after sending
+        """
+        if not self.batching:
+            await super().send_json(content, close=close)
+            return
+
+        self.batch.append(content)
+        if close or len(self.batch) >= settings.CHAT_WS_BATCH_MAX_FRAMES:
+            await self.flush_batch(close=close)
+        elif self.batch_flush is None:
+            self.batch_flush = asyncio.create_task(self.flush_batch_later())
+
+    async def flush_batch_later(self):
+        """Flush the held frames once the batching window has passed."""
+        await asyncio.sleep(settings.CHAT_WS_BATCH_WINDOW_MS / 1000)
+        self.batch_flush = None
+        await self.flush_batch()
+
+    async def flush_batch(self, close=False):
+        """
+        Send the held frames as one batch frame.
+        
+        Args:
+            close: Close the connection after sending
+        """
+        if self.batch_flush is not None:
+            self.batch_flush.cancel()
+            self.batch_flush = None
+        frames, self.batch = self.batch, []
+        if frames:
+            await super().send_json({"type": "batch", "data": frames}, close=close)
+        elif close:
+            await super().close()
+
+    async def close(self, code=None, reason=None):
+        """
+        Close the connection, sending any held frames first.
+        
+        Args:
+            code: WebSocket close code
+            reason: Close reason
+        """
+        if self.batching:
+            await self.flush_batch()
+        await super().close(code=code, reason=reason)
+
+    async def send_event(self, event, frame):
+        """
+        Send a broadcast event to the client, at most once.
+        
+        Tags the frame with the event's sequence number and drops events the
+        client already has: outbox delivery is at-least-once, and a resumed
+        session may see live copies of replayed events.
+        
+        Args:
+            event: Channel layer message carrying ``seq``
+            frame: JSON frame to send to the client
+        """
+        seq = event.get("seq")
+        if seq is not None:
+            if seq <= self.last_seq:
+                return
+            self.last_seq = seq
+            frame["seq"] = seq
+        await self.send_json(frame)
@@ -0,0 +1,190 @@
+"""
+Graceful drain of a process's WebSocket connections before a deploy.
+
+Dropping every socket of a worker at once makes all its clients reconnect
+in the same second, each repeating the JWT decode, user lookup and
+membership check. A draining process spreads that out instead:
+
+- New WebSocket handshakes are refused before any work is done, so clients
+  retry against the other workers.
+- Open connections are closed one at a time, evenly spaced over
+  ``CHAT_DRAIN_WINDOW_SECONDS`` in random order. Each client first gets a
+  ``{"type": "reconnect", "data": {"after_ms": n}}`` frame, where ``n`` is
+  a random delay of up to ``CHAT_DRAIN_RECONNECT_SPREAD_MS``, and the
+  connection is closed with code 1012 (service restart). Clients reconnect
+  with ``last_seq`` and resume where they stopped (see ``ChatConsumer``).
+
+A drain is started by the ``CHAT_DRAIN_SIGNAL`` signal, sent to the ASGI
+server process, or by an admin through ``POST /api/chats/drain/``. The
+endpoint drains every process started before the request: processes with
+connections poll the shared cache every ``CHAT_DRAIN_POLL_SECONDS``, and
+processes started afterwards (the new release) keep serving.
+
+A drain cannot be cancelled; the process is expected to be stopped once
+its connections are gone.
+"""
+
+import asyncio
+import logging
+import random
+import signal
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from redis import RedisError
+
+logger = logging.getLogger(__name__)
+
+# Shared cache key of the latest drain request
+DRAIN_KEY = "chat:drain"
+
+# Wall-clock start of this process, compared with drain requests
+STARTED_AT = time.time()
+
+# Consumers with an accepted connection in this process
+_connections = set()
+
+_draining = False
+_watcher = None
+_drain_task = None
+
+
+def is_draining() -> bool:
+    """Return whether this process is draining its connections."""
+    return _draining
+
+
+def register(consumer):
+    """
+    Track an accepted connection, and start watching for drain requests.
+
+    Must be called from the event loop serving the connection.
+
+    Args:
+        consumer: The ChatConsumer of the connection
+    """
+    _connections.add(consumer)
+    _ensure_watcher()
+
+
+def unregister(consumer):
+    """
+    Stop tracking a closed connection.
+
+    Args:
+        consumer: The ChatConsumer of the connection
+    """
+    _connections.discard(consumer)
+
+
+def request_drain(window=None) -> dict:
+    """
+    Ask every process started before now to drain its connections.
+
+    Args:
+        window (int, optional): Seconds over which each process closes its
+            connections (default: CHAT_DRAIN_WINDOW_SECONDS)
+
+    Returns:
+        dict: The stored request, with ``before`` and ``window``
+    """
+    if window is None:
+        window = settings.CHAT_DRAIN_WINDOW_SECONDS
+    request = {"before": time.time(), "window": window}
+    # Kept long enough for every process to see it at least twice
+    cache.set(DRAIN_KEY, request, window + 2 * settings.CHAT_DRAIN_POLL_SECONDS)
+    return request
+
+
+def start_drain(window=None) -> bool:
+    """
+    Start draining this process's connections.
+
+    Must be called from the event loop serving the connections (signal
+    handlers installed by ``register`` are).
+
+    Args:
+        window (int, optional): Seconds over which the connections are
+            closed (default: CHAT_DRAIN_WINDOW_SECONDS)
+
+    Returns:
+        bool: False if the process was already draining
+    """
+    global _draining, _drain_task
+    if _draining:
+        return False
+    _draining = True
+    if window is None:
+        window = settings.CHAT_DRAIN_WINDOW_SECONDS
+    logger.info(
+        "Draining %d WebSocket connections over %ss", len(_connections), window
+    )
+    _drain_task = asyncio.get_running_loop().create_task(_drain(window))
+    return True
+
+
+async def _drain(window):
+    """Close the connections one by one, evenly spaced over ``window``."""
+    consumers = list(_connections)
+    random.shuffle(consumers)
+    interval = window / len(consumers) if consumers else 0
+    closed = set()
+    for consumer in consumers:
+        await asyncio.sleep(interval)
+        await _close(consumer)
+        closed.add(consumer)
+
+    # Connections whose handshake was already past the drain check
+    for consumer in list(_connections - closed):
+        await _close(consumer)
+    logger.info("Drained %d WebSocket connections", len(closed))
+
+
+async def _close(consumer):
+    """Have a consumer send its reconnect frame and close."""
+    if consumer not in _connections:
+        return
+    spread = settings.CHAT_DRAIN_RECONNECT_SPREAD_MS
+    try:
+        # Delivered through the consumer's own dispatch loop, so it never
+        # interleaves with a handler running on the connection
+        await consumer.channel_layer.send(
+            consumer.channel_name,
+            {"type": "chat.drain", "after_ms": random.randint(0, spread)},
+        )
+    except Exception:
+        logger.warning("Failed to drain a WebSocket connection", exc_info=True)
+
+
+def _ensure_watcher():
+    """Start polling for drain requests and install the drain signal."""
+    global _watcher
+    loop = asyncio.get_running_loop()
+    if _watcher is not None and not _watcher.done() and _watcher.get_loop() is loop:
+        return
+    _watcher = loop.create_task(_watch())
+
+    if settings.CHAT_DRAIN_SIGNAL:
+        try:
+            loop.add_signal_handler(
+                getattr(signal, settings.CHAT_DRAIN_SIGNAL), start_drain
+            )
+        except (AttributeError, NotImplementedError, RuntimeError, ValueError):
+            # Unknown signal, or the loop is not in the main thread
+            logger.warning(
+                "Cannot drain on %s", settings.CHAT_DRAIN_SIGNAL, exc_info=True
+            )
+
+
+async def _watch():
+    """Drain this process once a drain request newer than it is stored."""
+    while not _draining:
+        await asyncio.sleep(settings.CHAT_DRAIN_POLL_SECONDS)
+        try:
+            request = await cache.aget(DRAIN_KEY)
+        except RedisError:
+            logger.warning("Failed to read drain requests", exc_info=True)
+            continue
+        if request is not None and request["before"] > STARTED_AT:
+            start_drain(request["window"])
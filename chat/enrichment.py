@@ -0,0 +1,301 @@
+"""
+Background enrichment of messages (mentions, links, content flags, ...).
+
+Enrichment never runs while a message is sent. The outbox dispatcher adds
+the ID of every created or edited message to the Redis stream
+``chat:enrichment`` (``feed_events``), and ``enrich_messages`` workers
+read it through the ``enrichment`` consumer group:
+
+- Entries are read in batches of ``CHAT_ENRICHMENT_BATCH_SIZE``; the
+  messages of a batch are loaded in one query and enriched on a pool of
+  ``CHAT_ENRICHMENT_CONCURRENCY`` threads. A processor can cap its own
+  share of the pool with ``Processor.concurrency`` (e.g. to be gentle with
+  an external service).
+- Each processor's result is stored under its ``key`` in
+  ``Message.metadata["enrichment"]`` (``Message.ENRICHMENT_KEY``, which
+  clients cannot write) by ``MessageManager.enrich_message``, which
+  broadcasts the changed keys as a ``chat.message_enriched`` event.
+- Messages are read from the primary database: a replica may not have a
+  just-sent message yet, and its entry would be dropped as deleted.
+- An entry is acknowledged once every processor succeeded. Entries whose
+  processing failed (or whose worker died) stay pending and are claimed
+  again after ``CHAT_ENRICHMENT_RETRY_SECONDS``, by any worker, until they
+  were delivered ``CHAT_ENRICHMENT_MAX_ATTEMPTS`` times.
+
+Processors are listed as dotted paths in ``CHAT_ENRICHMENT_PROCESSORS``;
+see ``chat.processors`` for the built-in ones. Processing is at-least-once,
+so processors must be idempotent; unchanged results are not rewritten.
+"""
+
+import logging
+import os
+import socket
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db import DEFAULT_DB_ALIAS, close_old_connections
+from django.utils.module_loading import import_string
+from redis import RedisError, ResponseError
+
+from .models import Message
+from .utils import get_redis
+
+logger = logging.getLogger(__name__)
+
+STREAM_KEY = "chat:enrichment"
+GROUP = "enrichment"
+
+# Outbox events whose message needs (re-)enriching
+_FED_EVENT_TYPES = {"chat.message", "chat.message_edited"}
+
+
+class Processor:
+    """
+    Base class of enrichment processors.
+
+    Subclasses set ``key`` and implement ``process``. Processors run on
+    worker threads and may block (on the database or the network).
+    """
+
+    # Key the result is stored under, in metadata["enrichment"]
+    key = None
+
+    # Messages this processor may work on at once (None: the pool size)
+    concurrency = None
+
+    def process(self, message: dict):
+        """
+        Compute the enrichment of one message.
+
+        Args:
+            message (dict): ``id``, ``chat_id``, ``sender_id``, ``content``
+                and ``metadata`` of the message
+
+        Returns:
+            The JSON-serializable value to store, or None to store nothing
+            (removing a value stored for an earlier version of the message)
+        """
+        raise NotImplementedError
+
+
+@lru_cache(maxsize=None)
+def get_processors():
+    """
+    Instantiate the processors listed in ``CHAT_ENRICHMENT_PROCESSORS``.
+
+    Returns:
+        tuple: Processor instances, in configuration order
+
+    Raises:
+        ImproperlyConfigured: If two processors share a key
+    """
+    processors = tuple(
+        import_string(path)() for path in settings.CHAT_ENRICHMENT_PROCESSORS
+    )
+    keys = [processor.key for processor in processors]
+    if len(set(keys)) != len(keys):
+        raise ImproperlyConfigured(
+            f"Enrichment processors must have unique keys: {keys}"
+        )
+    return processors
+
+
+def feed_events(events):
+    """
+    Queue the messages announced by outbox events for enrichment.
+
+    Called by the outbox dispatcher for each claimed batch. Feeding a
+    message twice (e.g. when its broadcast is retried) only costs a
+    redundant run.
+
+    Args:
+        events (list): ``(chat_id, payload)`` tuples of outbox events
+    """
+    if not settings.CHAT_ENRICHMENT_ENABLED:
+        return
+
+    message_ids = [
+        payload["message"]["id"]
+        for _, payload in events
+        if payload.get("type") in _FED_EVENT_TYPES
+    ]
+    if not message_ids:
+        return
+
+    pipe = get_redis().pipeline(transaction=False)
+    for message_id in message_ids:
+        pipe.xadd(
+            STREAM_KEY,
+            {"message_id": message_id},
+            maxlen=settings.CHAT_ENRICHMENT_STREAM_MAXLEN,
+            approximate=True,
+        )
+    try:
+        pipe.execute()
+    except RedisError:
+        logger.warning("Failed to queue messages for enrichment", exc_info=True)
+
+
+class EnrichmentWorker:
+    """
+    Loop that enriches the messages queued in the enrichment stream.
+    """
+
+    def __init__(self, processors=None, batch_size=None, concurrency=None):
+        self.processors = processors or get_processors()
+        self.batch_size = batch_size or settings.CHAT_ENRICHMENT_BATCH_SIZE
+        self.concurrency = concurrency or settings.CHAT_ENRICHMENT_CONCURRENCY
+        self.consumer = f"{socket.gethostname()}-{os.getpid()}"
+        self.redis = get_redis()
+        self.executor = ThreadPoolExecutor(
+            max_workers=self.concurrency, thread_name_prefix="enrichment"
+        )
+        self.limits = {
+            processor.key: threading.BoundedSemaphore(processor.concurrency)
+            for processor in self.processors
+            if processor.concurrency
+        }
+
+    def run(self):
+        """Enrich forever, blocking on the stream when it is empty."""
+        self.ensure_group()
+        while True:
+            self.retry_pending()
+            entries = self.redis.xreadgroup(
+                GROUP,
+                self.consumer,
+                {STREAM_KEY: ">"},
+                count=self.batch_size,
+                block=int(settings.CHAT_ENRICHMENT_POLL_SECONDS * 1000),
+            )
+            for _, batch in entries:
+                self.process_entries(batch)
+
+    def ensure_group(self):
+        """Create the consumer group (and stream) unless they exist."""
+        try:
+            self.redis.xgroup_create(STREAM_KEY, GROUP, id="0", mkstream=True)
+        except ResponseError as e:
+            if "BUSYGROUP" not in str(e):
+                raise
+
+    def retry_pending(self):
+        """
+        Claim entries that stayed unacknowledged for the retry interval.
+
+        Entries delivered ``CHAT_ENRICHMENT_MAX_ATTEMPTS`` times are dropped
+        (acknowledged and logged) instead.
+        """
+        idle_ms = settings.CHAT_ENRICHMENT_RETRY_SECONDS * 1000
+        pending = self.redis.xpending_range(
+            STREAM_KEY, GROUP, min="-", max="+", count=self.batch_size, idle=idle_ms
+        )
+        retry, dropped = [], []
+        for entry in pending:
+            if entry["times_delivered"] >= settings.CHAT_ENRICHMENT_MAX_ATTEMPTS:
+                dropped.append(entry["message_id"])
+            else:
+                retry.append(entry["message_id"])
+
+        if dropped:
+            logger.error("Dropping enrichment entries %s", dropped)
+            self.redis.xack(STREAM_KEY, GROUP, *dropped)
+        if retry:
+            # Claiming counts as a delivery, and fails for entries another
+            # worker claimed first
+            batch = self.redis.xclaim(STREAM_KEY, GROUP, self.consumer, idle_ms, retry)
+            self.process_entries(batch)
+
+    def process_entries(self, batch) -> int:
+        """
+        Enrich the messages of a batch of stream entries.
+
+        Args:
+            batch (list): ``(entry_id, fields)`` tuples read from the stream
+
+        Returns:
+            int: Number of entries acknowledged
+        """
+        entries = {
+            entry_id: int(fields[b"message_id"])
+            for entry_id, fields in batch
+            if fields
+        }
+        # Entries trimmed from the stream while pending have no fields
+        done = [entry_id for entry_id, fields in batch if not fields]
+
+        # Read from the primary, which always has the queued messages
+        rows = (
+            Message.objects.using(DEFAULT_DB_ALIAS)
+            .filter(id__in=set(entries.values()), deleted_at__isnull=True)
+            .values("id", "chat_id", "sender_id", "content", "metadata")
+        )
+        messages = {message["id"]: message for message in rows}
+
+        futures = {}
+        submitted = set()
+        for entry_id, message_id in entries.items():
+            message = messages.get(message_id)
+            if message is None or message_id in submitted:
+                # Deleted since it was queued, or queued twice in one batch
+                done.append(entry_id)
+            else:
+                submitted.add(message_id)
+                futures[entry_id] = self.executor.submit(self.enrich, message)
+
+        for entry_id, future in futures.items():
+            if future.result():
+                done.append(entry_id)
+
+        if done:
+            self.redis.xack(STREAM_KEY, GROUP, *done)
+        close_old_connections()
+        return len(done)
+
+    def enrich(self, message) -> bool:
+        """
+        Run every processor on a message and store the results.
+
+        Runs on a pool thread. The results of processors that succeeded are
+        stored even when another one failed.
+
+        Returns:
+            bool: True if every processor succeeded
+        """
+        patch = {}
+        ok = True
+        for processor in self.processors:
+            limit = self.limits.get(processor.key)
+            try:
+                if limit is None:
+                    patch[processor.key] = processor.process(message)
+                else:
+                    with limit:
+                        patch[processor.key] = processor.process(message)
+            except Exception:
+                ok = False
+                logger.warning(
+                    "Enrichment processor %s failed for message %s",
+                    processor.key,
+                    message["id"],
+                    exc_info=True,
+                )
+
+        try:
+            if patch:
+                Message.objects.enrich_message(
+                    message["id"], message["content"], patch
+                )
+        except Exception:
+            ok = False
+            logger.warning(
+                "Failed to store enrichment of message %s",
+                message["id"],
+                exc_info=True,
+            )
+        finally:
+            close_old_connections()
+        return ok
@@ -0,0 +1,212 @@
+"""
+Per-user inbox index kept in Redis sorted sets.
+
+Each user has a sorted set ``inbox:{user_id}`` whose members are chat IDs
+scored by the chat's last activity time. The sets are maintained from the
+message write path and let ``list_chats`` page through a user's inbox
+without asking Postgres to order anything.
+
+A set only exists once it has been built from the database (lazily on the
+first paginated read, or by the ``rebuild_inbox`` management command), and
+activity updates never create a set on their own. This keeps a set from
+looking complete after Redis was flushed while only holding the chats
+that saw new messages since.
+
+Redis is treated as a cache: every failure is logged and the caller falls
+back to the ``chat_participant_inbox_idx`` scan in Postgres.
+"""
+
+import logging
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS
+from redis import RedisError
+
+from .models import Chat, ChatParticipant
+from .serializers import member_preview_prefetch
+from .utils import get_redis
+
+logger = logging.getLogger(__name__)
+
+# Add a chat to every existing inbox set in KEYS and trim each set to its cap.
+# ZADD GT keeps a late-arriving update from moving a chat backwards.
+_RECORD_SCRIPT = """
+for _, key in ipairs(KEYS) do
+    if redis.call('EXISTS', key) == 1 then
+        redis.call('ZADD', key, 'GT', ARGV[1], ARGV[2])
+        redis.call('ZREMRANGEBYRANK', key, 0, -(tonumber(ARGV[3]) + 1))
+    end
+end
+return 0
+"""
+
+
+def inbox_key(user_id: int) -> str:
+    """Return the Redis key of a user's inbox sorted set."""
+    return f"inbox:{user_id}"
+
+
+def record_activity(chat_id: int, when, user_ids=None):
+    """
+    Move a chat to the top of its participants' cached inboxes.
+
+    Args:
+        chat_id (int): ID of the chat that saw activity
+        when (datetime): Activity time, used as the sorted set score
+        user_ids (list, optional): Participant IDs (loaded when omitted)
+    """
+    if user_ids is None:
+        user_ids = list(
+            ChatParticipant.objects.filter(chat_id=chat_id).values_list(
+                "user_id", flat=True
+            )
+        )
+    if not user_ids:
+        return
+
+    try:
+        get_redis().eval(
+            _RECORD_SCRIPT,
+            len(user_ids),
+            *[inbox_key(uid) for uid in user_ids],
+            when.timestamp(),
+            chat_id,
+            settings.CHAT_INBOX_MAX_ENTRIES,
+        )
+    except RedisError:
+        logger.warning("Failed to update inboxes for chat %s", chat_id, exc_info=True)
+
+
+def remove_chat(chat_id: int, user_ids):
+    """
+    Drop a chat from the cached inboxes of users who left it.
+
+    Args:
+        chat_id (int): ID of the chat
+        user_ids (list): IDs of the users that are no longer participants
+    """
+    try:
+        pipe = get_redis().pipeline(transaction=False)
+        for uid in user_ids:
+            pipe.zrem(inbox_key(uid), chat_id)
+        pipe.execute()
+    except RedisError:
+        logger.warning("Failed to remove chat %s from inboxes", chat_id, exc_info=True)
+
+
+def rebuild(user_id: int) -> int:
+    """
+    Rebuild one user's inbox set from Postgres.
+
+    Reads the newest ``CHAT_INBOX_MAX_ENTRIES`` memberships off the inbox
+    index on the primary database and replaces the sorted set in a single
+    MULTI/EXEC block.
+
+    Args:
+        user_id (int): ID of the user whose inbox to rebuild
+
+    Returns:
+        int: Number of chats written to the set
+    """
+    # Read from the primary: a lagging replica could miss a chat the user
+    # just created or joined, and record_activity only updates inboxes that
+    # already hold a chat, so it would stay missing until its next message
+    rows = (
+        ChatParticipant.objects.using(DEFAULT_DB_ALIAS)
+        .filter(user_id=user_id)
+        .order_by("-last_activity_at", "-chat_id")
+        .values_list("chat_id", "chat__last_activity_at")[
+            : settings.CHAT_INBOX_MAX_ENTRIES
+        ]
+    )
+    mapping = {chat_id: when.timestamp() for chat_id, when in rows}
+
+    key = inbox_key(user_id)
+    pipe = get_redis().pipeline(transaction=True)
+    pipe.delete(key)
+    if mapping:
+        pipe.zadd(key, mapping)
+    pipe.execute()
+    return len(mapping)
+
+
+class InboxIndex:
+    """
+    Read-only sequence over a user's cached inbox, newest chat first.
+
+    Implements just enough of the sequence protocol (``len`` and slicing)
+    for Django's ``Paginator``, so ``DefaultPagination`` can page over the
+    sorted set exactly like it pages over a queryset. Each slice hydrates
+    its chats in one batched query. If Redis fails after the inbox was
+    opened, the slice is read from the ``chat_participant_inbox_idx`` scan
+    in Postgres instead.
+    """
+
+    def __init__(self, user_id: int, size: int):
+        self.user_id = user_id
+        self.key = inbox_key(user_id)
+        self.size = size
+
+    def __len__(self):
+        return self.size
+
+    def __getitem__(self, item):
+        if not isinstance(item, slice):
+            raise TypeError("InboxIndex only supports slicing")
+
+        start = item.start or 0
+        stop = self.size if item.stop is None else item.stop
+        if stop <= start:
+            return []
+
+        try:
+            chat_ids = [
+                int(i) for i in get_redis().zrevrange(self.key, start, stop - 1)
+            ]
+        except RedisError:
+            logger.warning(
+                "Inbox cache unavailable for user %s", self.user_id, exc_info=True
+            )
+            chat_ids = list(
+                ChatParticipant.objects.using(DEFAULT_DB_ALIAS)
+                .filter(user_id=self.user_id)
+                .order_by("-last_activity_at", "-chat_id")
+                .values_list("chat_id", flat=True)[start:stop]
+            )
+        chats = (
+            Chat.objects.filter(id__in=chat_ids)
+            .select_related("last_message")
+            .prefetch_related(
+                member_preview_prefetch(), "last_message__attachments"
+            )
+        )
+
+        # Restore the sorted set order; chats deleted since are skipped
+        by_id = {chat.id: chat for chat in chats}
+        return [by_id[i] for i in chat_ids if i in by_id]
+
+
+def open_inbox(user_id: int):
+    """
+    Return the cached inbox of a user, building it if it is missing.
+
+    Args:
+        user_id (int): ID of the user
+
+    Returns:
+        InboxIndex or None: The cached inbox, or None when the caller should
+        read from Postgres instead (Redis unavailable, user has no chats, or
+        the set is at its cap and may be missing older chats)
+    """
+    try:
+        client = get_redis()
+        size = client.zcard(inbox_key(user_id))
+        if not size:
+            size = rebuild(user_id)
+    except RedisError:
+        logger.warning("Inbox cache unavailable for user %s", user_id, exc_info=True)
+        return None
+
+    if not size or size >= settings.CHAT_INBOX_MAX_ENTRIES:
+        return None
+    return InboxIndex(user_id, size)
@@ -0,0 +1,235 @@
+"""
+Management command to benchmark channel layer fan-out across Redis shards.
+
+Starts local ``redis-server`` processes (or uses ``--urls``), then for each
+backend and shard count runs ``--processes`` worker subprocesses at once.
+Each worker joins ``--groups`` chat groups with ``--members`` channels
+apiece, keeps one sender per group calling ``group_send`` for
+``--seconds``, and counts the messages its channels receive. The table
+shows delivered messages per second summed over the workers, so the gain
+from spreading groups over more Redis processes is visible directly.
+
+Usage:
+    python manage.py bench_channel_layer
+    python manage.py bench_channel_layer --shards 1,2,4 --backends core,pubsub
+    python manage.py bench_channel_layer --urls redis://a:6379/0,redis://b:6379/0
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.module_loading import import_string
+from redis import Redis, RedisError
+
+
+class Command(BaseCommand):
+    help = "Benchmark channel layer messages/sec against the number of Redis shards."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--shards",
+            default="1,2,4",
+            help="Comma-separated shard counts to compare (default: 1,2,4).",
+        )
+        parser.add_argument(
+            "--backends",
+            default="core,pubsub",
+            help="Comma-separated CHANNEL_LAYER_BACKEND values (default: core,pubsub).",
+        )
+        parser.add_argument(
+            "--urls",
+            help=(
+                "Comma-separated Redis URLs to use instead of starting local "
+                "redis-server processes."
+            ),
+        )
+        parser.add_argument(
+            "--redis-server",
+            default="redis-server",
+            help="redis-server binary used to start local shards.",
+        )
+        parser.add_argument(
+            "--base-port",
+            type=int,
+            default=6400,
+            help="Port of the first local shard (default: 6400).",
+        )
+        parser.add_argument(
+            "--processes",
+            type=int,
+            default=4,
+            help="Concurrent worker processes (default: 4).",
+        )
+        parser.add_argument(
+            "--groups",
+            type=int,
+            default=20,
+            help="Chat groups per worker (default: 20).",
+        )
+        parser.add_argument(
+            "--members",
+            type=int,
+            default=5,
+            help="Channels per group (default: 5).",
+        )
+        parser.add_argument(
+            "--seconds",
+            type=float,
+            default=5,
+            help="Sending time per run (default: 5).",
+        )
+        # Internal: run one worker of a configuration and print its counts
+        parser.add_argument("--worker", type=int, help=argparse.SUPPRESS)
+        parser.add_argument("--hosts", help=argparse.SUPPRESS)
+        parser.add_argument("--backend", help=argparse.SUPPRESS)
+
+    def handle(self, *args, **options):
+        if options["worker"] is not None:
+            result = asyncio.run(self._work(options))
+            self.stdout.write(json.dumps(result))
+            return
+
+        shard_counts = [int(n) for n in options["shards"].split(",")]
+        servers = []
+        if options["urls"]:
+            urls = options["urls"].split(",")
+            if max(shard_counts) > len(urls):
+                raise CommandError("--shards needs at most as many shards as --urls")
+        else:
+            urls, servers = self._start_servers(options, max(shard_counts))
+
+        try:
+            self.stdout.write(
+                f"{'backend':<10}{'shards':>8}{'sent/s':>12}{'received/s':>12}"
+            )
+            for backend in options["backends"].split(","):
+                for count in shard_counts:
+                    self._flush(urls[:count])
+                    sent, received = self._run(backend, urls[:count], options)
+                    self.stdout.write(
+                        f"{backend:<10}{count:>8}{sent:>12.0f}{received:>12.0f}"
+                    )
+        finally:
+            for server in servers:
+                server.terminate()
+                server.wait()
+
+    def _start_servers(self, options, count):
+        """Start ``count`` throwaway redis-server processes."""
+        servers, urls = [], []
+        workdir = tempfile.mkdtemp(prefix="bench_channel_layer")
+        for i in range(count):
+            port = options["base_port"] + i
+            try:
+                servers.append(
+                    subprocess.Popen(
+                        [
+                            options["redis_server"],
+                            "--port", str(port),
+                            "--save", "",
+                            "--appendonly", "no",
+                            "--dir", workdir,
+                        ],
+                        stdout=subprocess.DEVNULL,
+                    )
+                )
+            except FileNotFoundError:
+                raise CommandError(
+                    f"{options['redis_server']} not found; pass --redis-server or --urls"
+                )
+            urls.append(f"redis://127.0.0.1:{port}/0")
+
+        for url in urls:
+            client = Redis.from_url(url)
+            for _ in range(50):
+                try:
+                    client.ping()
+                    break
+                except RedisError:
+                    time.sleep(0.1)
+        return urls, servers
+
+    def _flush(self, urls):
+        for url in urls:
+            Redis.from_url(url).flushdb()
+
+    def _run(self, backend, urls, options):
+        """Run the worker processes for one configuration."""
+        workers = [
+            subprocess.Popen(
+                [
+                    sys.executable,
+                    sys.argv[0],
+                    "bench_channel_layer",
+                    f"--worker={i}",
+                    f"--hosts={','.join(urls)}",
+                    f"--backend={backend}",
+                    f"--groups={options['groups']}",
+                    f"--members={options['members']}",
+                    f"--seconds={options['seconds']}",
+                ],
+                env=os.environ,
+                stdout=subprocess.PIPE,
+                text=True,
+            )
+            for i in range(options["processes"])
+        ]
+        results = [
+            json.loads(worker.communicate()[0].strip().splitlines()[-1])
+            for worker in workers
+        ]
+        seconds = options["seconds"]
+        return (
+            sum(r["sent"] for r in results) / seconds,
+            sum(r["received"] for r in results) / seconds,
+        )
+
+    async def _work(self, options):
+        """Send to and receive from this worker's groups for a while."""
+        layer_class = import_string(settings.CHANNEL_LAYER_BACKENDS[options["backend"]])
+        layer = layer_class(hosts=options["hosts"].split(","))
+        groups = [
+            f"chat_{options['worker'] * options['groups'] + i}"
+            for i in range(options["groups"])
+        ]
+
+        channels = []
+        for group in groups:
+            for _ in range(options["members"]):
+                channel = await layer.new_channel()
+                await layer.group_add(group, channel)
+                channels.append(channel)
+
+        sent = received = 0
+        deadline = time.monotonic() + options["seconds"]
+
+        async def send(group):
+            nonlocal sent
+            while time.monotonic() < deadline:
+                await layer.group_send(group, {"type": "chat.message", "seq": sent})
+                sent += 1
+
+        async def receive(channel):
+            nonlocal received
+            while True:
+                await layer.receive(channel)
+                received += 1
+
+        receivers = [asyncio.create_task(receive(channel)) for channel in channels]
+        await asyncio.gather(*(send(group) for group in groups))
+        # Count only what was delivered within the sending window
+        counted = received
+        for task in receivers:
+            task.cancel()
+        await asyncio.gather(*receivers, return_exceptions=True)
+        await layer.flush()
+        return {"sent": sent, "received": counted}
+
@@ -0,0 +1,136 @@
+"""
+Management command to benchmark Postgres connection handling under ASGI.
+
+Simulates a connect storm: many concurrent "requests" arrive at once and
+each runs a few queries through ``database_sync_to_async``. Every simulated
+request gets its own ``ThreadSensitiveContext``, exactly like Django's ASGI
+handler does, so each one runs in its own thread with its own connection.
+
+Each ``DB_POOL_MODE`` is measured in a fresh subprocess (settings are read
+once at startup) and the results are printed side by side:
+
+- connections: distinct Postgres backends that served the queries
+- errors: queries that failed (e.g. "too many clients", pool timeouts)
+- p50/p99: per-query latency including connection setup
+
+Usage:
+    python manage.py bench_db_connections
+    python manage.py bench_db_connections --clients 500 --modes none,pool
+"""
+
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import time
+
+from asgiref.sync import ThreadSensitiveContext
+from channels.db import database_sync_to_async
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import DatabaseError, connection
+
+
+class Command(BaseCommand):
+    help = "Benchmark connect-storm behavior for each DB_POOL_MODE."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--clients",
+            type=int,
+            default=200,
+            help="Concurrent simulated requests (default: 200).",
+        )
+        parser.add_argument(
+            "--queries",
+            type=int,
+            default=5,
+            help="Queries per simulated request (default: 5).",
+        )
+        parser.add_argument(
+            "--modes",
+            default="none,persistent,pool",
+            help="Comma-separated DB_POOL_MODE values to compare.",
+        )
+        parser.add_argument(
+            "--worker",
+            action="store_true",
+            help=(
+                "Internal: run one storm with the current settings and print "
+                "the result as JSON."
+            ),
+        )
+
+    def handle(self, *args, clients, queries, modes, worker, **options):
+        if worker:
+            result = asyncio.run(self._storm(clients, queries))
+            self.stdout.write(json.dumps(result))
+            return
+
+        self.stdout.write(
+            f"{'mode':<12}{'connections':>12}{'errors':>8}"
+            f"{'wall s':>9}{'p50 ms':>9}{'p99 ms':>9}"
+        )
+        for mode in modes.split(","):
+            result = self._run_mode(mode.strip(), clients, queries)
+            self.stdout.write(
+                f"{mode:<12}{result['connections']:>12}{result['errors']:>8}"
+                f"{result['wall']:>9.2f}{result['p50']:>9.1f}{result['p99']:>9.1f}"
+            )
+
+    def _run_mode(self, mode, clients, queries):
+        """Run one storm in a subprocess configured for ``mode``."""
+        env = {**os.environ, "DB_POOL_MODE": mode}
+        out = subprocess.run(
+            [
+                sys.executable,
+                sys.argv[0],
+                "bench_db_connections",
+                "--worker",
+                f"--clients={clients}",
+                f"--queries={queries}",
+            ],
+            env=env,
+            check=True,
+            capture_output=True,
+            text=True,
+        ).stdout
+        return json.loads(out.strip().splitlines()[-1])
+
+    async def _storm(self, clients, queries):
+        """Fire ``clients`` concurrent request-like tasks at the database."""
+        pids = set()
+        latencies = []
+        errors = 0
+
+        @database_sync_to_async
+        def backend_pid():
+            with connection.cursor() as cursor:
+                cursor.execute("SELECT pg_backend_pid()")
+                return cursor.fetchone()[0]
+
+        async def request():
+            nonlocal errors
+            async with ThreadSensitiveContext():
+                for _ in range(queries):
+                    started = time.perf_counter()
+                    try:
+                        pids.add(await backend_pid())
+                    except DatabaseError:
+                        errors += 1
+                    latencies.append((time.perf_counter() - started) * 1000)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(request() for _ in range(clients)))
+        wall = time.perf_counter() - started
+
+        latencies.sort()
+        return {
+            "mode": settings.DB_POOL_MODE,
+            "connections": len(pids),
+            "errors": errors,
+            "wall": wall,
+            "p50": latencies[len(latencies) // 2],
+            "p99": latencies[int(len(latencies) * 0.99)],
+        }
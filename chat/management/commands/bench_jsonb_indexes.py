@@ -0,0 +1,162 @@
+"""
+Management command to check that JSONB filters use their GIN indexes.
+
+Seeds synthetic messages and users inside a transaction that is rolled back
+at the end, so it can run against any database. It then:
+
+- compares the size of a ``jsonb_ops`` and a ``jsonb_path_ops`` GIN index
+  over the seeded ``metadata`` and ``other_info`` columns;
+- runs ``EXPLAIN (ANALYZE)`` for the containment and key-existence filters
+  of ``messages_view`` and ``list_users``, built with the same helper the
+  views use, and reports the indexes each plan used.
+
+Usage:
+    python manage.py bench_jsonb_indexes
+    python manage.py bench_jsonb_indexes --messages 500000 --users 100000
+"""
+
+import json
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.http import QueryDict
+
+from chat.models import Chat, Message
+from chat_backend.json_filters import json_filter
+from users.models import User
+
+# (label, model, query string, JSON field)
+_QUERIES = [
+    ("metadata contains", Message, 'metadata={"flagged":true}', "metadata"),
+    ("metadata has key", Message, "metadata_has=attachment", "metadata"),
+    ("other_info contains", User, 'other_info={"plan":"pro"}', "other_info"),
+    ("other_info has key", User, "other_info_has=company", "other_info"),
+]
+
+
+class Command(BaseCommand):
+    help = "EXPLAIN the JSONB filters on seeded data and compare GIN index sizes."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--messages",
+            type=int,
+            default=200000,
+            help="Messages to seed (default: 200000).",
+        )
+        parser.add_argument(
+            "--users",
+            type=int,
+            default=50000,
+            help="Users to seed (default: 50000).",
+        )
+
+    def handle(self, *args, messages, users, **options):
+        with transaction.atomic():
+            self._seed(messages, users)
+            self._compare_sizes()
+            self._explain()
+            transaction.set_rollback(True)
+
+    def _seed(self, messages, users):
+        """Insert synthetic rows; about 1% match each filter."""
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"""
+                INSERT INTO {User._meta.db_table}
+                    (email, password, full_name, nickname, role, other_info,
+                     is_active, is_staff, is_superuser, date_joined)
+                SELECT 'bench-' || i || '@example.invalid', '!', 'Bench ' || i, '',
+                       'user',
+                       jsonb_build_object(
+                           'plan', CASE WHEN i %% 100 = 0 THEN 'pro' ELSE 'free' END,
+                           'city', 'city-' || (i %% 50)
+                       ) || CASE WHEN i %% 97 = 0
+                                 THEN '{{"company": "acme"}}'::jsonb
+                                 ELSE '{{}}'::jsonb END,
+                       true, false, false, now()
+                FROM generate_series(1, %s) AS i
+                """,
+                [users],
+            )
+            sender_id = (
+                User.objects.filter(email="bench-1@example.invalid")
+                .values_list("id", flat=True)
+                .get()
+            )
+            chat = Chat.objects.create(kind=Chat.Kinds.GROUP, title="bench")
+            cursor.execute(
+                f"""
+                INSERT INTO {Message._meta.db_table}
+                    (chat_id, sender_id, content, metadata, created_at)
+                SELECT %s, %s, 'bench ' || i,
+                       jsonb_build_object(
+                           'type', (ARRAY['text', 'image', 'file'])[1 + i %% 3],
+                           'n', i
+                       ) || CASE WHEN i %% 100 = 0
+                                 THEN '{{"flagged": true}}'::jsonb
+                                 ELSE '{{}}'::jsonb END
+                         || CASE WHEN i %% 97 = 0
+                                 THEN '{{"attachment": {{"kind": "image"}}}}'::jsonb
+                                 ELSE '{{}}'::jsonb END,
+                       now() - i * interval '1 second'
+                FROM generate_series(1, %s) AS i
+                """,
+                [chat.id, sender_id, messages],
+            )
+            # Check the deferred foreign keys now; indexes cannot be built on
+            # tables with pending trigger events
+            cursor.execute("SET CONSTRAINTS ALL IMMEDIATE")
+            cursor.execute(f"ANALYZE {User._meta.db_table}")
+            cursor.execute(f"ANALYZE {Message._meta.db_table}")
+        self.stdout.write(f"Seeded {messages} messages and {users} users")
+
+    def _compare_sizes(self):
+        """Build both GIN operator classes over each column and compare sizes."""
+        self.stdout.write(f"\n{'index':<28}{'jsonb_ops':>12}{'jsonb_path_ops':>16}")
+        for model, column in ((Message, "metadata"), (User, "other_info")):
+            table = model._meta.db_table
+            sizes = []
+            with connection.cursor() as cursor:
+                for opclass in ("jsonb_ops", "jsonb_path_ops"):
+                    name = f"bench_{column}_{opclass}"
+                    cursor.execute(
+                        f"CREATE INDEX {name} ON {table} USING gin ({column} {opclass})"
+                    )
+                    cursor.execute("SELECT pg_relation_size(%s::regclass)", [name])
+                    sizes.append(cursor.fetchone()[0])
+                    cursor.execute(f"DROP INDEX {name}")
+            self.stdout.write(
+                f"{table + '.' + column:<28}"
+                f"{sizes[0] / 1024 / 1024:>10.1f}MB{sizes[1] / 1024 / 1024:>14.1f}MB"
+            )
+
+    def _explain(self):
+        """EXPLAIN each API filter and report the indexes it used."""
+        self.stdout.write(f"\n{'filter':<22}{'rows':>8}{'ms':>9}  indexes")
+        for label, model, query, field in _QUERIES:
+            params = QueryDict(query)
+            param = next(iter(params)).removesuffix("_has")
+            queryset = model.objects.filter(json_filter(params, param, field))
+            sql, sql_params = queryset.query.sql_with_params()
+            with connection.cursor() as cursor:
+                cursor.execute(f"EXPLAIN (ANALYZE, FORMAT JSON) {sql}", sql_params)
+                plan = cursor.fetchone()[0]
+            if isinstance(plan, str):
+                plan = json.loads(plan)
+            root = plan[0]["Plan"]
+            indexes = sorted(_index_names(root)) or ["none (sequential scan)"]
+            self.stdout.write(
+                f"{label:<22}{root['Actual Rows']:>8}"
+                f"{plan[0]['Execution Time']:>9.1f}  {', '.join(indexes)}"
+            )
+
+
+def _index_names(node):
+    """Collect the names of the indexes used anywhere in a plan tree."""
+    names = set()
+    if "Index Name" in node:
+        names.add(node["Index Name"])
+    for child in node.get("Plans", []):
+        names |= _index_names(child)
+    return names
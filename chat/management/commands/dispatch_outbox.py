@@ -0,0 +1,57 @@
+"""
+Management command to run the outbox dispatcher.
+
+Delivers queued ``OutboxEvent`` broadcasts to the channel layer. Run at
+least one instance next to the ASGI workers; with ``--partitions N`` run N
+instances, one per ``--partition`` index.
+
+Usage:
+    python manage.py dispatch_outbox
+    python manage.py dispatch_outbox --partitions 4 --partition 0
+"""
+
+import asyncio
+
+from channels.layers import get_channel_layer
+from django.core.management.base import BaseCommand, CommandError
+
+from chat.outbox import OutboxDispatcher
+
+
+class Command(BaseCommand):
+    help = "Deliver queued outbox events to the channel layer."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            help="Events claimed per round (default: CHAT_OUTBOX_BATCH_SIZE).",
+        )
+        parser.add_argument(
+            "--partitions",
+            type=int,
+            default=1,
+            help="Total number of dispatcher instances (default: 1).",
+        )
+        parser.add_argument(
+            "--partition",
+            type=int,
+            default=0,
+            help="Index of this instance, from 0 to partitions - 1 (default: 0).",
+        )
+
+    def handle(self, *args, batch_size=None, partitions=1, partition=0, **options):
+        if not 0 <= partition < partitions:
+            raise CommandError("--partition must be between 0 and --partitions - 1")
+
+        dispatcher = OutboxDispatcher(
+            get_channel_layer(),
+            batch_size=batch_size,
+            partition=partition,
+            partitions=partitions,
+        )
+        self.stdout.write(f"Dispatching outbox partition {partition}/{partitions}")
+        try:
+            asyncio.run(dispatcher.run())
+        except KeyboardInterrupt:
+            pass
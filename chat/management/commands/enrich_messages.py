@@ -0,0 +1,44 @@
+"""
+Management command to run a message enrichment worker.
+
+Enriches the messages the outbox dispatcher queues in the enrichment
+stream with the ``CHAT_ENRICHMENT_PROCESSORS``. Any number of workers can
+run side by side; they share the stream through a Redis consumer group.
+
+Usage:
+    python manage.py enrich_messages
+    python manage.py enrich_messages --concurrency 16
+"""
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from chat.enrichment import EnrichmentWorker
+
+
+class Command(BaseCommand):
+    help = "Enrich queued messages with the configured processors."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            help="Entries read per round (default: CHAT_ENRICHMENT_BATCH_SIZE).",
+        )
+        parser.add_argument(
+            "--concurrency",
+            type=int,
+            help="Messages enriched at once (default: CHAT_ENRICHMENT_CONCURRENCY).",
+        )
+
+    def handle(self, *args, batch_size=None, concurrency=None, **options):
+        if not settings.CHAT_ENRICHMENT_ENABLED:
+            raise CommandError("Enrichment is disabled (CHAT_ENRICHMENT_ENABLED=0)")
+
+        worker = EnrichmentWorker(batch_size=batch_size, concurrency=concurrency)
+        keys = ", ".join(processor.key for processor in worker.processors)
+        self.stdout.write(f"Enriching messages as {worker.consumer} ({keys})")
+        try:
+            worker.run()
+        except KeyboardInterrupt:
+            pass
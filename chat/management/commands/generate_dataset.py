@@ -0,0 +1,579 @@
+"""
+Management command to generate a large, skewed synthetic dataset.
+
+Loads users, chats, memberships and messages with Postgres ``COPY`` so that
+benchmarks and partitioning work can run against production-like volumes;
+10M messages load in minutes rather than the hours ``bulk_create`` takes.
+
+The data is skewed the way real chat traffic is:
+
+- chat activity follows a power law (``--skew``, a Pareto shape: lower is
+  more skewed), so a few long chats hold a large share of the messages
+  while most chats only see a handful;
+- users are equally skewed: active users belong to more chats and send
+  more of the messages in them;
+- group sizes are power-law distributed up to ``CHAT_GROUP_MAX_MEMBERS``;
+- message bodies range from one word to long paragraphs, and most
+  ``metadata`` is empty while the rest carries attachments, mentions,
+  reactions or link previews of realistic size.
+
+Messages are written in daily slices sorted by time, so rows of different
+chats are interleaved on disk as they would be in production. The
+denormalized columns (``member_count``, ``message_count``, ``last_seq``,
+``last_message`` and the chat and inbox activity times) are filled in, and
+each chat's messages get the versions 1..n, so the API serves the data as
+if it had been written through it. Generated
+users share the password ``--password``; their emails end in
+``@<tag>.example.invalid``.
+
+Each stage (and each daily slice of messages) commits separately, which
+keeps deferred foreign key checks small. Run ``rebuild_inbox`` afterwards
+to warm the Redis inboxes, or let them rebuild lazily.
+
+Usage:
+    python manage.py generate_dataset
+    python manage.py generate_dataset --users 200000 --chats 100000 \\
+        --messages 10000000 --seed 1
+"""
+
+import json
+import random
+import time
+from datetime import datetime, timedelta
+from datetime import timezone as dt_timezone
+
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.utils import timezone
+
+from chat.models import Chat, ChatParticipant, Message
+from chat.utils import pair_key_for_users
+from users.models import User
+
+_WORDS = (
+    "hey hi ok yes no maybe thanks sure lol great cool nice sounds good see you "
+    "tomorrow today tonight later soon meeting call lunch coffee project deploy "
+    "review branch release ticket bug fix test build server client api data "
+    "please could you send me the file link doc notes update status plan week "
+    "weekend monday friday morning evening time late early done working on it "
+    "just now again thing idea question answer problem issue works broken"
+).split()
+_FIRST_NAMES = (
+    "Ada Alan Amir Ana Ben Chen Chloe Dan Dana Eli Emma Eva Farah Hana Ivan Jin "
+    "Jonas Kai Lea Leo Li Lucia Maya Mei Nia Noah Omar Priya Ravi Sara Sofia "
+    "Tom Uma Yara Yusuf Zoe"
+).split()
+_LAST_NAMES = (
+    "Adams Ahmed Berg Costa Diaz Evans Fischer Garcia Hansen Ito Jensen Kim "
+    "Khan Lopez Meyer Nakamura Novak Okafor Patel Rossi Silva Smith Tanaka "
+    "Wang Weber Wilson Yilmaz"
+).split()
+_CITIES = (
+    "Berlin Cairo Delhi Lagos Lima London Madrid Oslo Paris Seoul Sydney "
+    "Tokyo Toronto Warsaw"
+).split()
+_MIME_TYPES = [
+    ("image", "image/jpeg", "jpg"),
+    ("image", "image/png", "png"),
+    ("file", "application/pdf", "pdf"),
+    ("file", "application/zip", "zip"),
+    ("video", "video/mp4", "mp4"),
+]
+_EMOJI = ["👍", "❤️", "😂", "🎉", "😮", "🙏"]
+
+# Share of messages with non-empty metadata
+_METADATA_RATE = 0.3
+# Distinct message bodies and metadata documents drawn from while loading
+_POOL_SIZE = 20000
+
+
+class _ChatPlan:
+    """Generation state of one chat."""
+
+    __slots__ = ("id", "members", "cum_weights", "created", "target", "count", "last")
+
+    def __init__(self, chat_id, members, cum_weights, created, target):
+        self.id = chat_id
+        self.members = members
+        self.cum_weights = cum_weights
+        self.created = created
+        self.target = target
+        self.count = 0
+        self.last = created
+
+
+class Command(BaseCommand):
+    help = "Generate skewed users, chats and messages with COPY for benchmarks."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--users",
+            type=int,
+            default=10000,
+            help="Users to create (default: 10000).",
+        )
+        parser.add_argument(
+            "--chats",
+            type=int,
+            default=5000,
+            help="Chats to create (default: 5000).",
+        )
+        parser.add_argument(
+            "--messages",
+            type=int,
+            default=1000000,
+            help="Approximate number of messages to create (default: 1000000).",
+        )
+        parser.add_argument(
+            "--group-ratio",
+            type=float,
+            default=0.3,
+            help="Share of chats that are groups (default: 0.3).",
+        )
+        parser.add_argument(
+            "--skew",
+            type=float,
+            default=1.2,
+            help=(
+                "Pareto shape of chat and user activity; lower values "
+                "concentrate activity in fewer chats (default: 1.2)."
+            ),
+        )
+        parser.add_argument(
+            "--days",
+            type=int,
+            default=90,
+            help="Days of history to spread messages over (default: 90).",
+        )
+        parser.add_argument(
+            "--password",
+            default="password",
+            help="Password of every generated user (default: password).",
+        )
+        parser.add_argument(
+            "--tag",
+            help="Name of this run, used in generated emails (default: random).",
+        )
+        parser.add_argument(
+            "--seed",
+            type=int,
+            help="Random seed, for reproducible datasets.",
+        )
+
+    def handle(
+        self,
+        *args,
+        users,
+        chats,
+        messages,
+        group_ratio,
+        skew,
+        days,
+        password,
+        tag,
+        seed,
+        **options,
+    ):
+        if connection.vendor != "postgresql":
+            raise CommandError("generate_dataset uses COPY and needs PostgreSQL.")
+        if users < 2 or chats < 1 or days < 1 or skew <= 0:
+            raise CommandError("Need 2+ users, 1+ chats, 1+ days and a positive skew.")
+
+        rng = random.Random(seed)
+        tag = tag or f"{rng.getrandbits(32):08x}"
+        domain = f"{tag}.example.invalid"
+        if User.objects.filter(email__endswith=f"@{domain}").exists():
+            raise CommandError(f"A dataset tagged {tag!r} already exists.")
+
+        now = timezone.now()
+        start = now - timedelta(days=days)
+        began = time.monotonic()
+
+        user_ids, user_weights = self._create_users(
+            rng, users, password, domain, start, skew
+        )
+        self._log(f"{users} users", began)
+
+        plans = self._create_chats(
+            rng, chats, messages, group_ratio, skew, user_ids, user_weights, start, now
+        )
+        self._log(f"{chats} chats", began)
+
+        total = self._create_messages(rng, plans, start, days, began)
+        self._log(f"{total} messages", began)
+
+        members = self._finish_chats(plans)
+        self._log(f"{members} memberships and chat counters", began)
+
+        with connection.cursor() as cursor:
+            for model in (User, Chat, ChatParticipant, Message):
+                cursor.execute(f"ANALYZE {model._meta.db_table}")
+
+        counts = sorted((plan.count for plan in plans), reverse=True)
+        top = max(1, len(counts) // 100)
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Generated dataset {tag!r} in {time.monotonic() - began:.0f}s: "
+                f"largest chat {counts[0]} messages, top 1% of chats hold "
+                f"{sum(counts[:top]) / max(1, total):.0%}, "
+                f"median chat {counts[len(counts) // 2]}"
+            )
+        )
+
+    def _log(self, what, began):
+        self.stdout.write(f"[{time.monotonic() - began:7.1f}s] loaded {what}")
+
+    def _create_users(self, rng, count, password, domain, start, skew):
+        """COPY the users; returns their IDs and activity weights."""
+        # One hash shared by every user keeps loading fast; they can all log in
+        encoded = make_password(password)
+        ids = _reserve_ids(User, count)
+        weights = [rng.paretovariate(skew) for _ in ids]
+
+        def rows():
+            for n, user_id in enumerate(ids):
+                first, last = rng.choice(_FIRST_NAMES), rng.choice(_LAST_NAMES)
+                yield (
+                    user_id,
+                    encoded,
+                    None,
+                    False,
+                    f"{first.lower()}.{last.lower()}.{n}@{domain}",
+                    f"{first} {last}",
+                    first if rng.random() < 0.3 else "",
+                    User.Roles.USER,
+                    json.dumps(_other_info(rng)),
+                    True,
+                    False,
+                    start - timedelta(days=365 * rng.random()),
+                )
+
+        with transaction.atomic():
+            _copy(
+                User,
+                [
+                    "id", "password", "last_login", "is_superuser", "email",
+                    "full_name", "nickname", "role", "other_info", "is_active",
+                    "is_staff", "date_joined",
+                ],
+                rows(),
+            )
+        return ids, weights
+
+    def _create_chats(
+        self,
+        rng,
+        count,
+        messages,
+        group_ratio,
+        skew,
+        user_ids,
+        user_weights,
+        start,
+        now,
+    ):
+        """COPY the chats (counters are filled in later); returns their plans."""
+        user_cum = _cumulative(user_weights)
+        weight_of = dict(zip(user_ids, user_weights))
+        max_members = min(settings.CHAT_GROUP_MAX_MEMBERS, len(user_ids))
+        span = (now - start).total_seconds()
+        pairs = set()
+
+        ids = _reserve_ids(Chat, count)
+        activity = [rng.paretovariate(skew) for _ in ids]
+        scale = messages / sum(activity)
+        plans, rows = [], []
+        for chat_id, weight in zip(ids, activity):
+            created = start.timestamp() + span * rng.random()
+            pair_key = None
+            if rng.random() >= group_ratio:
+                members = self._pick_pair(rng, user_ids, user_cum, pairs)
+                if members is not None:
+                    pair_key = pair_key_for_users(*members)
+            if pair_key is None:
+                size = min(max_members, 2 + int(rng.paretovariate(1.2)))
+                members = _pick_members(rng, user_ids, user_cum, size)
+
+            plans.append(
+                _ChatPlan(
+                    chat_id,
+                    members,
+                    _cumulative(weight_of[uid] for uid in members),
+                    created,
+                    weight * scale,
+                )
+            )
+            at = _datetime(created)
+            rows.append(
+                (
+                    chat_id,
+                    Chat.Kinds.DIRECT if pair_key else Chat.Kinds.GROUP,
+                    pair_key,
+                    "" if pair_key else " ".join(rng.sample(_WORDS, 2)).title(),
+                    None if pair_key else members[0],
+                    len(members),
+                    0,
+                    0,
+                    at,
+                    at,
+                    at,
+                    None,
+                )
+            )
+
+        with transaction.atomic():
+            _copy(
+                Chat,
+                [
+                    "id", "kind", "pair_key", "title", "created_by_id",
+                    "member_count", "message_count", "last_seq", "created_at",
+                    "updated_at", "last_activity_at", "last_message_id",
+                ],
+                rows,
+            )
+        return plans
+
+    def _pick_pair(self, rng, user_ids, user_cum, pairs):
+        """Pick two users without a direct chat yet (None if none found)."""
+        for _ in range(100):
+            a, b = rng.choices(user_ids, cum_weights=user_cum, k=2)
+            key = (min(a, b), max(a, b))
+            if a != b and key not in pairs:
+                pairs.add(key)
+                return [a, b]
+        return None
+
+    def _create_messages(self, rng, plans, start, days, began):
+        """COPY the messages one day at a time; returns how many were written."""
+        bodies = [_body(rng) for _ in range(_POOL_SIZE)]
+        documents = [
+            json.dumps(_metadata(rng), ensure_ascii=False) for _ in range(_POOL_SIZE)
+        ]
+        columns = [
+            "chat_id", "sender_id", "content", "metadata", "created_at", "version",
+        ]
+        end = start.timestamp() + days * 86400
+
+        # Messages are numbered 1..n per chat in time order, matching the
+        # chat's last_seq (set to its message count in _finish_chats)
+        seqs = {}
+
+        def numbered(rows):
+            for at, chat_id, sender, body, document in rows:
+                seqs[chat_id] = seq = seqs.get(chat_id, 0) + 1
+                yield (chat_id, sender, body, document, _datetime(at), seq)
+
+        total = 0
+        for day in range(days):
+            day_start = start.timestamp() + day * 86400
+            day_end = min(day_start + 86400, end)
+            rows = []
+            for plan in plans:
+                if plan.created >= day_end:
+                    continue
+                low = max(plan.created, day_start)
+                # Spread the chat's messages evenly over its lifetime
+                expected = plan.target * (day_end - low) / (end - plan.created)
+                n = int(expected + rng.random())
+                if not n:
+                    continue
+                senders = rng.choices(plan.members, cum_weights=plan.cum_weights, k=n)
+                for sender in senders:
+                    at = low + (day_end - low) * rng.random()
+                    document = "{}"
+                    if rng.random() < _METADATA_RATE:
+                        document = rng.choice(documents)
+                    rows.append((at, plan.id, sender, rng.choice(bodies), document))
+                    plan.last = max(plan.last, at)
+                plan.count += n
+
+            # Interleave the chats' rows by time, as organic writes would
+            rows.sort()
+            with transaction.atomic():
+                _copy(Message, columns, numbered(rows))
+            total += len(rows)
+            if (day + 1) % 10 == 0 or day + 1 == days:
+                self._log(f"{total} messages ({day + 1}/{days} days)", began)
+        return total
+
+    def _finish_chats(self, plans):
+        """COPY the memberships and fill in the chat counters; returns memberships."""
+        members = 0
+
+        def rows():
+            nonlocal members
+            for plan in plans:
+                joined, last = _datetime(plan.created), _datetime(plan.last)
+                for n, user_id in enumerate(plan.members):
+                    role = ChatParticipant.Roles.MEMBER
+                    if n == 0 and len(plan.members) > 2:
+                        role = ChatParticipant.Roles.OWNER
+                    members += 1
+                    yield (plan.id, user_id, role, joined, last)
+
+        with transaction.atomic():
+            _copy(
+                ChatParticipant,
+                ["chat_id", "user_id", "role", "joined_at", "last_activity_at"],
+                rows(),
+            )
+
+        chat_table, message_table = Chat._meta.db_table, Message._meta.db_table
+        with connection.cursor() as cursor:
+            for i in range(0, len(plans), 10000):
+                batch = plans[i:i + 10000]
+                with transaction.atomic():
+                    cursor.execute(
+                        f"""
+                        UPDATE {chat_table} AS c
+                        SET message_count = s.n,
+                            last_seq = s.n,
+                            last_activity_at = s.at,
+                            updated_at = s.at,
+                            last_message_id = (
+                                SELECT m.id FROM {message_table} AS m
+                                WHERE m.chat_id = c.id
+                                ORDER BY m.created_at DESC, m.id DESC
+                                LIMIT 1
+                            )
+                        FROM unnest(%s::bigint[], %s::integer[], %s::timestamptz[])
+                            AS s(id, n, at)
+                        WHERE c.id = s.id
+                        """,
+                        [
+                            [plan.id for plan in batch],
+                            [plan.count for plan in batch],
+                            [_datetime(plan.last) for plan in batch],
+                        ],
+                    )
+        return members
+
+
+def _reserve_ids(model, count):
+    """Draw ``count`` primary keys from the model's identity sequence."""
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT nextval(pg_get_serial_sequence(%s, 'id')) "
+            "FROM generate_series(1, %s)",
+            [model._meta.db_table, count],
+        )
+        return [row[0] for row in cursor.fetchall()]
+
+
+def _copy(model, columns, rows):
+    """Stream rows into the model's table with COPY."""
+    with connection.cursor() as cursor:
+        with cursor.copy(
+            f"COPY {model._meta.db_table} ({', '.join(columns)}) FROM STDIN"
+        ) as copy:
+            for row in rows:
+                copy.write_row(row)
+
+
+def _cumulative(weights):
+    """Cumulative weights for ``random.choices``."""
+    total, result = 0.0, []
+    for weight in weights:
+        total += weight
+        result.append(total)
+    return result
+
+
+def _pick_members(rng, user_ids, user_cum, size):
+    """Pick ``size`` distinct users, favouring active ones."""
+    members = dict.fromkeys(rng.choices(user_ids, cum_weights=user_cum, k=size))
+    for _ in range(10):
+        if len(members) >= size:
+            break
+        members.update(
+            dict.fromkeys(
+                rng.choices(user_ids, cum_weights=user_cum, k=size - len(members))
+            )
+        )
+    # Heavily skewed weights may keep drawing the same users; fill uniformly
+    while len(members) < size:
+        members.setdefault(rng.choice(user_ids))
+    return list(members)[:size]
+
+
+def _datetime(timestamp):
+    return datetime.fromtimestamp(timestamp, tz=dt_timezone.utc)
+
+
+def _words(rng, n):
+    return " ".join(rng.choices(_WORDS, k=n))
+
+
+def _token(rng):
+    return f"{rng.getrandbits(64):016x}"
+
+
+def _body(rng):
+    """A message body; mostly short, with a long tail of paragraphs."""
+    text = _words(rng, max(1, min(300, int(rng.lognormvariate(1.8, 0.9)))))
+    return text[0].upper() + text[1:]
+
+
+def _other_info(rng):
+    info = {
+        "city": rng.choice(_CITIES),
+        "plan": rng.choices(["free", "pro", "team"], weights=[80, 15, 5])[0],
+        "locale": rng.choice(["en", "en-GB", "de", "es", "fr", "ja", "pt-BR"]),
+    }
+    if rng.random() < 0.3:
+        suffix = rng.choice(["Ltd", "GmbH", "Inc"])
+        info["company"] = f"{rng.choice(_LAST_NAMES)} {suffix}"
+    if rng.random() < 0.2:
+        info["bio"] = _words(rng, rng.randint(5, 40))
+    return info
+
+
+def _metadata(rng):
+    """A non-empty metadata document, from tens of bytes to about a kilobyte."""
+    kind = rng.choices(
+        ["attachment", "mentions", "reactions", "link", "reply"],
+        weights=[35, 20, 20, 15, 10],
+    )[0]
+    if kind == "attachment":
+        category, mime, ext = rng.choice(_MIME_TYPES)
+        metadata = {
+            "type": category,
+            "attachment": {
+                "name": f"{_words(rng, 2).replace(' ', '_')}.{ext}",
+                "mime": mime,
+                "size": int(rng.lognormvariate(12, 1.5)),
+                "url": f"https://files.example.invalid/{_token(rng)}.{ext}",
+            },
+        }
+        if category == "image":
+            metadata["attachment"].update(
+                width=rng.choice([640, 1080, 1920, 4032]),
+                height=rng.choice([480, 720, 1080, 3024]),
+            )
+        return metadata
+    if kind == "mentions":
+        return {"mentions": [rng.randrange(1, 10**6) for _ in range(rng.randint(1, 4))]}
+    if kind == "reactions":
+        return {
+            "reactions": {
+                emoji: rng.randint(1, 20)
+                for emoji in rng.sample(_EMOJI, rng.randint(1, 3))
+            }
+        }
+    if kind == "link":
+        slug = _words(rng, 3).replace(" ", "-")
+        return {
+            "type": "link",
+            "preview": {
+                "url": f"https://{rng.choice(_WORDS)}.example.invalid/{slug}",
+                "title": _words(rng, rng.randint(3, 10)).title(),
+                "description": _words(rng, rng.randint(10, 120)),
+                "image": f"https://cdn.example.invalid/{_token(rng)}.jpg",
+            },
+        }
+    return {
+        "reply_to": rng.randrange(1, 10**7),
+        "quote": _words(rng, rng.randint(3, 15)),
+    }
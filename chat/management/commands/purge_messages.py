@@ -0,0 +1,74 @@
+"""
+Management command to delete messages past their retention.
+
+Deletes in throttled batches through ``chat.retention``; safe to run while
+the service is live, e.g. nightly from cron. An interrupted run resumes
+after the last chat it finished unless ``--restart`` is given.
+
+Usage:
+    python manage.py purge_messages
+    python manage.py purge_messages --days 365 --pause-ms 250
+    python manage.py purge_messages --chat 12 --days 30
+"""
+
+from django.core.management.base import BaseCommand, CommandError
+
+from chat.retention import RetentionEngine
+
+
+class Command(BaseCommand):
+    help = "Delete messages older than the chats' retention in small batches."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--days",
+            type=int,
+            help="Retention of chats without their own (default: CHAT_RETENTION_DAYS).",
+        )
+        parser.add_argument(
+            "--chat",
+            type=int,
+            action="append",
+            dest="chat_ids",
+            help="Only purge this chat (repeatable).",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            help="Messages per transaction (default: CHAT_RETENTION_BATCH_SIZE).",
+        )
+        parser.add_argument(
+            "--pause-ms",
+            type=int,
+            help="Pause after each batch (default: CHAT_RETENTION_PAUSE_MS).",
+        )
+        parser.add_argument(
+            "--restart",
+            action="store_true",
+            help="Start from the first chat instead of resuming.",
+        )
+
+    def handle(
+        self,
+        *args,
+        days=None,
+        chat_ids=None,
+        batch_size=None,
+        pause_ms=None,
+        restart=False,
+        **options,
+    ):
+        if days is not None and days < 0:
+            raise CommandError("--days must not be negative")
+
+        engine = RetentionEngine(
+            default_days=days,
+            batch_size=batch_size,
+            pause=None if pause_ms is None else pause_ms / 1000,
+            progress=self.stdout.write,
+        )
+        if not engine.default_days and not chat_ids:
+            self.stdout.write(
+                "No default retention; only chats with retention_days are purged"
+            )
+        engine.run(chat_ids=chat_ids, resume=not restart)
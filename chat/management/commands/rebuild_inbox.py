@@ -0,0 +1,62 @@
+"""
+Management command to rebuild the Redis inbox sets from Postgres.
+
+Run after a Redis flush or failover to warm every user's inbox in one pass
+instead of letting the first paginated ``list_chats`` call of each user
+rebuild it lazily.
+
+Usage:
+    python manage.py rebuild_inbox
+    python manage.py rebuild_inbox --user 12 --user 34
+"""
+
+from django.core.management.base import BaseCommand
+
+from chat.inbox import rebuild
+from chat.models import ChatParticipant
+
+
+class Command(BaseCommand):
+    help = "Rebuild per-user Redis inbox sorted sets from the database."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--user",
+            type=int,
+            action="append",
+            dest="user_ids",
+            help="Only rebuild this user's inbox (may be repeated).",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=1000,
+            help="Number of user IDs to load per query (default: 1000).",
+        )
+
+    def handle(self, *args, user_ids=None, batch_size=1000, **options):
+        users = chats = 0
+        for user_id in user_ids or self._iter_user_ids(batch_size):
+            chats += rebuild(user_id)
+            users += 1
+            if users % batch_size == 0:
+                self.stdout.write(f"Rebuilt {users} inboxes ({chats} chats)")
+
+        self.stdout.write(
+            self.style.SUCCESS(f"Rebuilt {users} inboxes ({chats} chats)")
+        )
+
+    def _iter_user_ids(self, batch_size):
+        """Yield the IDs of all users with at least one chat, in keyset batches."""
+        last_id = 0
+        while True:
+            batch = list(
+                ChatParticipant.objects.filter(user_id__gt=last_id)
+                .order_by("user_id")
+                .values_list("user_id", flat=True)
+                .distinct()[:batch_size]
+            )
+            if not batch:
+                return
+            yield from batch
+            last_id = batch[-1]
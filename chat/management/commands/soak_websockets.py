@@ -0,0 +1,307 @@
+"""
+Management command to measure the memory cost of idle WebSocket connections.
+
+Opens ``--connections`` chat WebSocket connections inside one process,
+through the real routing, authentication and membership checks, on an
+in-memory channel layer (so group state is counted in the process), then
+reports the growth of the process's resident memory (RSS) per idle
+connection. The connections are spread over ``--chats`` group chats of a
+throwaway user, which is deleted afterwards.
+
+Each measurement runs in a fresh subprocess, so memory freed by an earlier
+run cannot hide the cost of the next one. A second run opens the same
+number of connections to a bare ASGI app that only accepts them; its cost
+(the in-process client: a queue and a task per connection) is subtracted
+to get the cost of ``ChatConsumer`` itself.
+
+``--tracemalloc`` also reports the Python heap growth per connection and
+the ``--top`` allocation sites; tracing makes the run slower and adds its
+own overhead to the RSS figures.
+
+Usage:
+    python manage.py soak_websockets
+    python manage.py soak_websockets --connections 50000 --chats 500
+    python manage.py soak_websockets --connections 5000 --tracemalloc --top 15
+"""
+
+import argparse
+import asyncio
+import gc
+import json
+import os
+import resource
+import subprocess
+import sys
+import time
+import tracemalloc
+
+from channels.layers import DEFAULT_CHANNEL_LAYER, InMemoryChannelLayer, channel_layers
+from channels.routing import URLRouter
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from chat.models import Chat, ChatParticipant
+from chat.routing import websocket_urlpatterns
+from users.models import User
+
+SOAK_EMAIL = "soak-websockets@example.invalid"
+
+# Connections opened (and closed) before measuring, so one-time
+# allocations (imports, caches, database connection) are not counted
+WARMUP_CONNECTIONS = 200
+
+# Headers of a typical browser handshake, copied into each scope
+_HEADERS = [
+    (b"host", b"localhost:8000"),
+    (b"user-agent", b"Mozilla/5.0 (X11; Linux x86_64; rv:128.0) Firefox/128.0"),
+    (b"origin", b"http://localhost:3000"),
+    (b"upgrade", b"websocket"),
+    (b"connection", b"Upgrade"),
+    (b"sec-websocket-version", b"13"),
+    (b"sec-websocket-key", b"dGhlIHNhbXBsZSBub25jZQ=="),
+    (b"sec-websocket-extensions", b"permessage-deflate"),
+]
+
+
+def _rss() -> int:
+    """Return the resident memory of this process in bytes."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except OSError:
+        # No /proc (macOS): fall back to the peak, in bytes there
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+class _SoakChannelLayer(InMemoryChannelLayer):
+    """
+    In-memory channel layer without the expiry sweep of every receive.
+
+    The sweep visits every channel and group, which makes opening n
+    connections O(n^2); nothing expires during a soak run anyway.
+    """
+
+    def _clean_expired(self):
+        pass
+
+
+async def _bare_app(scope, receive, send):
+    """ASGI app that accepts a WebSocket and idles until it is closed."""
+    await receive()
+    await send({"type": "websocket.accept"})
+    while (await receive())["type"] != "websocket.disconnect":
+        pass
+
+
+class Command(BaseCommand):
+    help = "Measure resident memory per idle chat WebSocket connection."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--connections",
+            type=int,
+            default=20000,
+            help="Idle connections to open (default: 20000).",
+        )
+        parser.add_argument(
+            "--chats",
+            type=int,
+            default=100,
+            help="Group chats the connections are spread over (default: 100).",
+        )
+        parser.add_argument(
+            "--concurrency",
+            type=int,
+            default=200,
+            help="Handshakes in flight at once (default: 200).",
+        )
+        parser.add_argument(
+            "--tracemalloc",
+            action="store_true",
+            help="Also report Python heap growth and top allocation sites.",
+        )
+        parser.add_argument(
+            "--top",
+            type=int,
+            default=10,
+            help="Allocation sites listed with --tracemalloc (default: 10).",
+        )
+        # Internal: measure one app in this process and print the result
+        parser.add_argument(
+            "--worker", choices=["bare", "consumer"], help=argparse.SUPPRESS
+        )
+        parser.add_argument("--user", type=int, help=argparse.SUPPRESS)
+        parser.add_argument("--chat-ids", help=argparse.SUPPRESS)
+
+    def handle(self, *args, **options):
+        if options["worker"]:
+            user = User.objects.get(id=options["user"])
+            token = str(RefreshToken.for_user(user).access_token)
+            result = asyncio.run(self._soak(token, options))
+            self.stdout.write(json.dumps(result))
+            return
+
+        if options["connections"] < 1 or options["chats"] < 1:
+            raise CommandError("--connections and --chats must be positive")
+
+        user, chat_ids = self._setup(options["chats"])
+        try:
+            bare = self._run("bare", user, chat_ids, options)
+            consumer = self._run("consumer", user, chat_ids, options)
+        finally:
+            Chat.objects.filter(id__in=chat_ids).delete()
+            user.delete()
+
+        self.stdout.write(
+            f"{'app':<10}{'connections':>12}{'RSS MB':>10}{'open s':>8}"
+            f"{'RSS B/conn':>12}{'heap B/conn':>13}"
+        )
+        for name, result in (("bare", bare), ("consumer", consumer)):
+            heap = result.get("heap_per_connection")
+            self.stdout.write(
+                f"{name:<10}{result['connections']:>12}"
+                f"{result['rss_after'] / 2**20:>10.1f}{result['seconds']:>8.1f}"
+                f"{result['rss_per_connection']:>12.0f}"
+                f"{heap if heap is not None else '-':>13}"
+            )
+
+        cost = consumer["rss_per_connection"] - bare["rss_per_connection"]
+        line = f"ChatConsumer: {cost:.0f} bytes RSS per idle connection"
+        if options["tracemalloc"]:
+            heap = consumer["heap_per_connection"] - bare["heap_per_connection"]
+            line += f" ({heap} bytes of Python heap)"
+        self.stdout.write(line)
+
+        if consumer.get("top"):
+            self.stdout.write("\nTop allocation sites (bytes per connection):")
+            for site, size in consumer["top"]:
+                self.stdout.write(f"{size:>10}  {site}")
+
+    def _setup(self, count):
+        """Create a throwaway user and the group chats to connect to."""
+        User.objects.filter(email=SOAK_EMAIL).delete()
+        user = User.objects.create_user(email=SOAK_EMAIL, full_name="Soak test")
+        chats = Chat.objects.bulk_create(
+            Chat(kind=Chat.Kinds.GROUP, title=f"Soak {i}", member_count=1)
+            for i in range(count)
+        )
+        ChatParticipant.objects.bulk_create(
+            ChatParticipant(chat=chat, user=user, role=ChatParticipant.Roles.OWNER)
+            for chat in chats
+        )
+        return user, [chat.id for chat in chats]
+
+    def _run(self, worker, user, chat_ids, options):
+        """Measure one app in a fresh subprocess."""
+        command = [
+            sys.executable,
+            sys.argv[0],
+            "soak_websockets",
+            f"--worker={worker}",
+            f"--user={user.id}",
+            f"--chat-ids={','.join(map(str, chat_ids))}",
+            f"--connections={options['connections']}",
+            f"--concurrency={options['concurrency']}",
+            f"--top={options['top']}",
+        ]
+        if options["tracemalloc"]:
+            command.append("--tracemalloc")
+        process = subprocess.run(
+            command, env=os.environ, stdout=subprocess.PIPE, text=True
+        )
+        if process.returncode:
+            raise CommandError(f"The {worker} run failed")
+        return json.loads(process.stdout.strip().splitlines()[-1])
+
+    async def _soak(self, token, options):
+        """Open the idle connections and measure the memory they hold."""
+        channel_layers.set(DEFAULT_CHANNEL_LAYER, _SoakChannelLayer())
+        if options["worker"] == "bare":
+            app = _bare_app
+        else:
+            app = URLRouter(websocket_urlpatterns)
+        chat_ids = [int(i) for i in options["chat_ids"].split(",")]
+
+        warmup = await self._open(app, token, chat_ids, WARMUP_CONNECTIONS, options)
+        await self._close(warmup)
+        del warmup
+
+        if options["tracemalloc"]:
+            tracemalloc.start()
+        gc.collect()
+        rss_before = _rss()
+        snapshot = tracemalloc.take_snapshot() if options["tracemalloc"] else None
+
+        started = time.monotonic()
+        count = options["connections"]
+        connections = await self._open(app, token, chat_ids, count, options)
+        seconds = time.monotonic() - started
+
+        gc.collect()
+        rss_after = _rss()
+        result = {
+            "connections": count,
+            "seconds": seconds,
+            "rss_after": rss_after,
+            "rss_per_connection": (rss_after - rss_before) / count,
+        }
+        if snapshot is not None:
+            stats = tracemalloc.take_snapshot().compare_to(snapshot, "lineno")
+            result["heap_per_connection"] = sum(s.size_diff for s in stats) // count
+            result["top"] = [
+                [str(s.traceback), s.size_diff // count]
+                for s in stats[: options["top"]]
+            ]
+            tracemalloc.stop()
+
+        await self._close(connections)
+        return result
+
+    async def _open(self, app, token, chat_ids, count, options):
+        """Open ``count`` connections, ``--concurrency`` handshakes at a time."""
+        connections = []
+        for start in range(0, count, options["concurrency"]):
+            batch = range(start, min(start + options["concurrency"], count))
+            connections += await asyncio.gather(
+                *(
+                    self._connect(app, token, chat_ids[i % len(chat_ids)], i)
+                    for i in batch
+                )
+            )
+        return connections
+
+    async def _connect(self, app, token, chat_id, index):
+        """Perform one handshake; return the connection's queue and task."""
+        queue = asyncio.Queue()
+        handshake = asyncio.get_running_loop().create_future()
+
+        async def send(message):
+            if not handshake.done():
+                handshake.set_result(message)
+
+        scope = {
+            "type": "websocket",
+            "asgi": {"version": "3.0"},
+            "http_version": "1.1",
+            "scheme": "ws",
+            "server": ("127.0.0.1", 8000),
+            "client": ("127.0.0.1", 1024 + index % 64000),
+            "root_path": "",
+            "path": f"/ws/chats/{chat_id}/",
+            "raw_path": f"/ws/chats/{chat_id}/".encode(),
+            "query_string": f"token={token}".encode(),
+            "headers": list(_HEADERS),
+            "subprotocols": [],
+        }
+        task = asyncio.create_task(app(scope, queue.get, send))
+        queue.put_nowait({"type": "websocket.connect"})
+        message = await handshake
+        if message["type"] != "websocket.accept":
+            raise CommandError(f"Connection to chat {chat_id} refused: {message}")
+        return queue, task
+
+    async def _close(self, connections):
+        """Disconnect every connection and wait for its app to finish."""
+        for queue, _ in connections:
+            queue.put_nowait({"type": "websocket.disconnect", "code": 1000})
+        await asyncio.gather(*(task for _, task in connections))
@@ -0,0 +1,231 @@
+"""
+Cache of the newest serialized messages of each chat.
+
+Most history reads ask for the newest page of a chat, so the last
+``CHAT_MESSAGE_CACHE_SIZE`` messages of a chat are kept already serialized,
+in two tiers:
+
+- an in-process LRU of at most ``CHAT_MESSAGE_CACHE_CHATS`` chats;
+- optionally (``CHAT_MESSAGE_CACHE_REDIS``) a Redis list per chat shared by
+  all processes, expiring ``CHAT_MESSAGE_CACHE_TTL_SECONDS`` after its last
+  write.
+
+Senders are cached by ID only and embedded from the profile cache on every
+read, so a profile change shows on cached pages as soon as it does on the
+others.
+
+Every entry is stamped with the chat's ``last_seq`` it is current for.
+Any broadcast event bumps ``Chat.last_seq``, so a reader holding the chat
+row knows an entry is fresh when the two match and ignores it otherwise.
+New messages are appended after commit when their sequence number directly
+follows the entry's; any other change simply makes entries stale until
+they are refilled from the primary database. Entries may briefly hold a
+message twice (a refill racing an append), which readers drop.
+"""
+
+import json
+import logging
+import threading
+from collections import OrderedDict
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS
+from django.utils.dateparse import parse_datetime
+from redis import RedisError
+
+from .models import Message
+from .serializers import MessageSerializer, load_profiles
+from .utils import get_redis
+
+logger = logging.getLogger(__name__)
+
+# Append a message to a cached list if the list is current up to the
+# message's predecessor; drop the entry if it missed a change.
+# KEYS: list, seq key. ARGV: seq, message JSON, size, ttl
+_APPEND_SCRIPT = """
+local current = redis.call('GET', KEYS[2])
+if not current then
+    return 0
+end
+if tonumber(current) ~= tonumber(ARGV[1]) - 1 then
+    redis.call('DEL', KEYS[1], KEYS[2])
+    return 0
+end
+redis.call('RPUSH', KEYS[1], ARGV[2])
+redis.call('LTRIM', KEYS[1], -tonumber(ARGV[3]), -1)
+redis.call('SET', KEYS[2], ARGV[1], 'EX', ARGV[4])
+redis.call('EXPIRE', KEYS[1], ARGV[4])
+return 1
+"""
+
+_local = OrderedDict()
+_lock = threading.Lock()
+
+
+def _keys(chat_id: int):
+    return f"chat:{chat_id}:recent", f"chat:{chat_id}:recent:seq"
+
+
+def _entry(message):
+    """Reduce a serialized message to its cached form, keyed by sender ID."""
+    entry = {}
+    for key, value in message.items():
+        if key == "sender":
+            entry["sender_id"] = value["id"] if value else None
+        else:
+            entry[key] = value
+    return entry
+
+
+def _hydrated(entries):
+    """Rebuild serialized messages, embedding their senders' profiles."""
+    profiles = load_profiles(
+        MessageSerializer(), {entry.get("sender_id") for entry in entries}
+    )
+    messages = []
+    for entry in entries:
+        message = {}
+        for key, value in entry.items():
+            if key == "sender_id":
+                message["sender"] = profiles.get(value)
+            else:
+                message[key] = value
+        messages.append(message)
+    return messages
+
+
+def _ordered(messages):
+    """Sort messages like the history endpoint and drop duplicates."""
+    unique = {message["id"]: message for message in messages}
+    ordered = sorted(
+        unique.values(), key=lambda m: (parse_datetime(m["created_at"]), m["id"])
+    )
+    return ordered[-settings.CHAT_MESSAGE_CACHE_SIZE :]
+
+
+def _store_local(chat_id: int, seq: int, messages):
+    with _lock:
+        _local[chat_id] = (seq, messages)
+        _local.move_to_end(chat_id)
+        while len(_local) > settings.CHAT_MESSAGE_CACHE_CHATS:
+            _local.popitem(last=False)
+
+
+def recent_messages(chat):
+    """
+    Return the newest serialized messages of a chat, oldest first.
+
+    Tries the local tier, then Redis, then loads the messages from Postgres
+    and refills both tiers.
+
+    Args:
+        chat (Chat): The chat, as loaded for the current request
+
+    Returns:
+        list: Up to ``CHAT_MESSAGE_CACHE_SIZE`` serialized messages
+    """
+    with _lock:
+        entry = _local.get(chat.id)
+        if entry is not None:
+            _local.move_to_end(chat.id)
+    if entry is not None and entry[0] == chat.last_seq:
+        return _hydrated(entry[1])
+
+    list_key, seq_key = _keys(chat.id)
+    if settings.CHAT_MESSAGE_CACHE_REDIS:
+        try:
+            pipe = get_redis().pipeline(transaction=False)
+            pipe.get(seq_key)
+            pipe.lrange(list_key, 0, -1)
+            seq, members = pipe.execute()
+        except RedisError:
+            logger.warning(
+                "Message cache unavailable for chat %s", chat.id, exc_info=True
+            )
+        else:
+            if seq is not None and int(seq) == chat.last_seq:
+                entries = _ordered(json.loads(member) for member in members)
+                _store_local(chat.id, chat.last_seq, entries)
+                return _hydrated(entries)
+
+    # Refilled from the primary: a lagging replica could miss messages up to
+    # chat.last_seq, and the entry would be stamped current without them.
+    # Messages committed after the chat row was read may be included; the
+    # entry is then labelled older than its content, which is harmless
+    rows = (
+        Message.objects.using(DEFAULT_DB_ALIAS)
+        .filter(chat_id=chat.id)
+        .prefetch_related("attachments")
+        .order_by("-created_at", "-id")[: settings.CHAT_MESSAGE_CACHE_SIZE]
+    )
+    messages = list(reversed(MessageSerializer(rows, many=True).data))
+    entries = [_entry(message) for message in messages]
+    _store_local(chat.id, chat.last_seq, entries)
+
+    if settings.CHAT_MESSAGE_CACHE_REDIS:
+        ttl = settings.CHAT_MESSAGE_CACHE_TTL_SECONDS
+        try:
+            pipe = get_redis().pipeline(transaction=True)
+            pipe.delete(list_key)
+            if entries:
+                pipe.rpush(list_key, *[json.dumps(e) for e in entries])
+                pipe.expire(list_key, ttl)
+            pipe.set(seq_key, chat.last_seq, ex=ttl)
+            pipe.execute()
+        except RedisError:
+            logger.warning(
+                "Failed to fill message cache for chat %s", chat.id, exc_info=True
+            )
+    return messages
+
+
+def record_message(chat_id: int, seq: int, data):
+    """
+    Append a committed message to the cache of its chat.
+
+    Args:
+        chat_id (int): ID of the chat
+        seq (int): Sequence number of the message's broadcast
+        data (dict): Serialized message
+    """
+    data = _entry(data)
+    with _lock:
+        entry = _local.pop(chat_id, None)
+        if entry is not None and entry[0] == seq - 1:
+            _local[chat_id] = (seq, _ordered([*entry[1], data]))
+
+    if settings.CHAT_MESSAGE_CACHE_REDIS:
+        try:
+            get_redis().eval(
+                _APPEND_SCRIPT,
+                2,
+                *_keys(chat_id),
+                seq,
+                json.dumps(data),
+                settings.CHAT_MESSAGE_CACHE_SIZE,
+                settings.CHAT_MESSAGE_CACHE_TTL_SECONDS,
+            )
+        except RedisError:
+            logger.warning(
+                "Failed to append to message cache of chat %s", chat_id, exc_info=True
+            )
+
+
+def invalidate(chat_id: int):
+    """
+    Drop the cached messages of a chat in this process and in Redis.
+
+    Only needed for changes that do not bump ``Chat.last_seq``.
+
+    Args:
+        chat_id (int): ID of the chat
+    """
+    with _lock:
+        _local.pop(chat_id, None)
+    if settings.CHAT_MESSAGE_CACHE_REDIS:
+        try:
+            get_redis().delete(*_keys(chat_id))
+        except RedisError:
+            logger.warning(
+                "Failed to invalidate message cache of chat %s", chat_id, exc_info=True
+            )
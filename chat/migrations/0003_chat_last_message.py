@@ -0,0 +1,31 @@
+# Generated by Django 5.2.6 on 2026-10-18 23:53
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0002_chat_participant_activity'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='chat',
+            name='last_message',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='chat.message'),
+        ),
+        migrations.RunSQL(
+            sql="""
+                UPDATE chat_chat c
+                SET last_message_id = (
+                    SELECT m.id FROM chat_message m
+                    WHERE m.chat_id = c.id
+                    ORDER BY m.created_at DESC, m.id DESC
+                    LIMIT 1
+                );
+            """,
+            reverse_sql=migrations.RunSQL.noop,
+        ),
+    ]
@@ -0,0 +1,61 @@
+# Generated by Django 5.2.6 on 2026-10-18 23:59
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0003_chat_last_message'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='chat',
+            name='created_by',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddField(
+            model_name='chat',
+            name='kind',
+            field=models.CharField(choices=[('direct', 'Direct'), ('group', 'Group')], default='direct', max_length=10),
+        ),
+        migrations.AddField(
+            model_name='chat',
+            name='member_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='chat',
+            name='title',
+            field=models.CharField(blank=True, max_length=255),
+        ),
+        migrations.AddField(
+            model_name='chatparticipant',
+            name='joined_at',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+        migrations.AddField(
+            model_name='chatparticipant',
+            name='role',
+            field=models.CharField(choices=[('owner', 'Owner'), ('admin', 'Admin'), ('member', 'Member')], default='member', max_length=10),
+        ),
+        migrations.AlterField(
+            model_name='chat',
+            name='pair_key',
+            field=models.CharField(blank=True, db_index=True, max_length=64, null=True, unique=True),
+        ),
+        migrations.RunSQL(
+            sql="""
+                UPDATE chat_chat c
+                SET member_count = (
+                    SELECT COUNT(*) FROM chat_chat_participants p WHERE p.chat_id = c.id
+                );
+            """,
+            reverse_sql=migrations.RunSQL.noop,
+        ),
+    ]
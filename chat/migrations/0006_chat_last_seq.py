@@ -0,0 +1,18 @@
+# Generated by Django 5.2.6 on 2026-10-19 00:03
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0005_outbox'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='chat',
+            name='last_seq',
+            field=models.BigIntegerField(default=0),
+        ),
+    ]
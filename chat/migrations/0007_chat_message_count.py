@@ -0,0 +1,27 @@
+# Generated by Django 5.2.6 on 2026-10-19 00:09
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0006_chat_last_seq'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='chat',
+            name='message_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunSQL(
+            sql="""
+                UPDATE chat_chat c
+                SET message_count = (
+                    SELECT COUNT(*) FROM chat_message m WHERE m.chat_id = c.id
+                );
+            """,
+            reverse_sql=migrations.RunSQL.noop,
+        ),
+    ]
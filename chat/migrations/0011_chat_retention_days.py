@@ -0,0 +1,18 @@
+# Generated by Django 5.2.6 on 2026-10-19 00:36
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0010_attachments'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='chat',
+            name='retention_days',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+    ]
@@ -1,37 +1,107 @@
 """
-Chat application models for handling one-to-one conversations and messages.
+Chat application models for handling one-to-one and group conversations.
 
 This module defines the core data models for the chat system:
-- Chat: Represents a conversation between two users
+- Chat: Represents a direct conversation between two users or a group chat
+- ChatParticipant: Membership of a user in a chat, ordered for inbox reads
 - Message: Individual messages within a chat conversation
+- AttachmentBlob: Deduplicated file content, addressed by its SHA-256 digest
+- Attachment: A (resumably) uploaded file, referenced by a message
+- OutboxEvent: Channel layer broadcast queued in the same transaction as its data
 """
 
+import uuid
+from datetime import timedelta
+
 from django.conf import settings
-from django.db import models
-from django.contrib.postgres.indexes import GinIndex
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, IntegrityError, connection, models, transaction
+from django.db.models import F, Q, Subquery
+from django.contrib.postgres.indexes import GinIndex, OpClass
+from django.db.models.functions import Upper
+from django.utils import timezone
 from .utils import pair_key_for_users
 
 # Reference to the user model defined in settings
 User = settings.AUTH_USER_MODEL
 
 
+class GroupFull(Exception):
+    """Raised when adding members would exceed ``CHAT_GROUP_MAX_MEMBERS``."""
+
+
 class Chat(models.Model):
     """
-    Model representing a chat conversation between two users.
+    Model representing a chat conversation.
     
-    Uses a unique pair_key to ensure only one chat exists between any two users,
-    preventing duplicate conversations.
+    Direct chats use a unique pair_key to ensure only one chat exists between
+    any two users, preventing duplicate conversations. Group chats have no
+    pair_key and can hold up to ``CHAT_GROUP_MAX_MEMBERS`` participants.
     """
-    # Unique identifier for the chat pair (generated from user IDs)
-    pair_key = models.CharField(max_length=64, unique=True, db_index=True)
+
+    class Kinds(models.TextChoices):
+        """
+        Enumeration of chat kinds.
+        """
+
+        DIRECT = "direct", "Direct"
+        GROUP = "group", "Group"
+
+    kind = models.CharField(max_length=10, choices=Kinds.choices, default=Kinds.DIRECT)
+
+    # Unique identifier for the chat pair (generated from user IDs, direct only)
+    pair_key = models.CharField(
+        max_length=64, unique=True, db_index=True, null=True, blank=True
+    )
+
+    # Display name of a group chat
+    title = models.CharField(max_length=255, blank=True)
+
+    # User who created the chat (groups only)
+    created_by = models.ForeignKey(
+        User, null=True, blank=True, on_delete=models.SET_NULL, related_name="+"
+    )
     
-    # Many-to-many relationship with users (should be exactly 2 participants)
-    participants = models.ManyToManyField(User, related_name="chats")
+    # Many-to-many relationship with users (2 for direct chats)
+    participants = models.ManyToManyField(
+        User, related_name="chats", through="ChatParticipant"
+    )
+
+    # Denormalized number of participants, so lists never count memberships
+    member_count = models.PositiveIntegerField(default=0)
+
+    # Denormalized number of messages, so history pages never count them
+    message_count = models.PositiveIntegerField(default=0)
+
+    # Sequence number of the latest event broadcast to this chat
+    last_seq = models.BigIntegerField(default=0)
     
     # Timestamps for tracking chat creation and last activity
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    # Time of the most recent message (bumped on every message write)
+    last_activity_at = models.DateTimeField(default=timezone.now)
+
+    # Denormalized pointer to the newest message for inbox previews
+    last_message = models.ForeignKey(
+        "Message", null=True, blank=True, on_delete=models.SET_NULL, related_name="+"
+    )
+
+    # Days messages are kept (None: CHAT_RETENTION_DAYS, 0: forever), see
+    # chat.retention
+    retention_days = models.PositiveIntegerField(null=True, blank=True)
+
+    class Meta:
+        """Meta configuration for the Chat model."""
+        indexes = [
+            # Case-insensitive title prefix search (admin "^title")
+            models.Index(
+                OpClass(Upper("title"), name="varchar_pattern_ops"),
+                name="chat_title_prefix_idx",
+            ),
+        ]
+
     @classmethod
     def get_or_create_1to1(cls, user_a_id: int, user_b_id: int):
         """
@@ -46,25 +116,586 @@ class Chat(models.Model):
         """
         # Generate a unique key for this user pair
         key = pair_key_for_users(user_a_id, user_b_id)
-        chat, created = cls.objects.get_or_create(pair_key=key)
+        chat, created = cls.objects.get_or_create(
+            pair_key=key, defaults={"member_count": 2}
+        )
 
         # If this is a new chat, add both users as participants
         if created:
             chat.participants.set([user_a_id, user_b_id])
 
+            # Surface the new chat in both cached inboxes
+            from .inbox import record_activity
+
+            transaction.on_commit(
+                lambda: record_activity(
+                    chat.id, chat.last_activity_at, [user_a_id, user_b_id]
+                )
+            )
+
         return chat, created
 
+    @classmethod
+    def create_group(cls, owner_id: int, title: str, member_ids):
+        """
+        Create a group chat owned by ``owner_id``.
+
+        Args:
+            owner_id (int): ID of the user creating the group
+            title (str): Display name of the group
+            member_ids (iterable): IDs of the other initial members
+
+        Returns:
+            Chat: The created group chat
+        """
+        user_ids = [owner_id] + [
+            uid for uid in dict.fromkeys(member_ids) if uid != owner_id
+        ]
+
+        with transaction.atomic():
+            chat = cls.objects.create(
+                kind=cls.Kinds.GROUP,
+                title=title,
+                created_by_id=owner_id,
+                member_count=len(user_ids),
+            )
+            ChatParticipant.objects.bulk_create(
+                ChatParticipant(
+                    chat=chat,
+                    user_id=uid,
+                    role=(
+                        ChatParticipant.Roles.OWNER
+                        if uid == owner_id
+                        else ChatParticipant.Roles.MEMBER
+                    ),
+                    last_activity_at=chat.last_activity_at,
+                )
+                for uid in user_ids
+            )
+
+            from .inbox import record_activity
+
+            transaction.on_commit(
+                lambda: record_activity(chat.id, chat.last_activity_at, user_ids)
+            )
+        return chat
+
+    @classmethod
+    def has_participant(cls, chat_id: int, user_id: int) -> bool:
+        """
+        Check membership using the unique (chat, user) index only.
+
+        Args:
+            chat_id (int): ID of the chat
+            user_id (int): ID of the user
+
+        Returns:
+            bool: True if the user is a participant of the chat
+        """
+        return ChatParticipant.objects.filter(chat_id=chat_id, user_id=user_id).exists()
+
+    def add_members(self, user_ids):
+        """
+        Add users to a group chat, skipping those who are already members.
+
+        The chat row is locked for the duration so concurrent membership
+        changes keep ``member_count`` exact, and the size limit is checked
+        against the locked count.
+
+        Args:
+            user_ids (iterable): IDs of the users to add
+
+        Returns:
+            list: IDs of the users that were actually added
+
+        Raises:
+            GroupFull: If the new members would exceed the size limit
+        """
+        with transaction.atomic():
+            member_count = (
+                Chat.objects.select_for_update()
+                .values_list("member_count", flat=True)
+                .get(id=self.id)
+            )
+
+            user_ids = list(dict.fromkeys(user_ids))
+            existing = set(
+                ChatParticipant.objects.filter(
+                    chat_id=self.id, user_id__in=user_ids
+                ).values_list("user_id", flat=True)
+            )
+            added = [uid for uid in user_ids if uid not in existing]
+            if not added:
+                return []
+            if member_count + len(added) > settings.CHAT_GROUP_MAX_MEMBERS:
+                raise GroupFull("Too many members for a group")
+
+            ChatParticipant.objects.bulk_create(
+                ChatParticipant(
+                    chat_id=self.id, user_id=uid, last_activity_at=self.last_activity_at
+                )
+                for uid in added
+            )
+            Chat.objects.filter(id=self.id).update(
+                member_count=F("member_count") + len(added)
+            )
+
+            from .inbox import record_activity
+
+            transaction.on_commit(
+                lambda: record_activity(self.id, self.last_activity_at, added)
+            )
+        return added
+
+    def remove_member(self, user_id: int) -> bool:
+        """
+        Remove a user from a group chat.
+
+        If the owner leaves, the longest-standing remaining member becomes
+        the new owner so the group stays manageable.
+
+        Args:
+            user_id (int): ID of the user to remove
+
+        Returns:
+            bool: True if the user was a member and has been removed
+        """
+        with transaction.atomic():
+            Chat.objects.select_for_update().filter(id=self.id).exists()
+
+            membership = ChatParticipant.objects.filter(
+                chat_id=self.id, user_id=user_id
+            ).first()
+            if membership is None:
+                return False
+
+            membership.delete()
+            Chat.objects.filter(id=self.id).update(member_count=F("member_count") - 1)
+
+            if membership.role == ChatParticipant.Roles.OWNER:
+                successor = (
+                    ChatParticipant.objects.filter(chat_id=self.id)
+                    .order_by("joined_at", "id")
+                    .first()
+                )
+                if successor is not None:
+                    successor.role = ChatParticipant.Roles.OWNER
+                    successor.save(update_fields=["role"])
+
+            from .inbox import remove_chat
+
+            transaction.on_commit(lambda: remove_chat(self.id, [user_id]))
+        return True
+
+    @classmethod
+    def record_activity(cls, chat_id: int, when=None, message_id=None):
+        """
+        Bump the last-activity timestamps of a chat and its participants.
+
+        The chat row (and its last message pointer) is moved forward on
+        every call. The per-participant
+        inbox rows are only rewritten once they are older than
+        ``CHAT_ACTIVITY_COALESCE_SECONDS``, so a busy chat produces at most
+        one inbox write per participant per window. Both updates are
+        conditional, which keeps concurrent writers from moving the
+        timestamp backwards.
+
+        Args:
+            chat_id (int): ID of the chat that received a message
+            when (datetime, optional): Activity time (defaults to now)
+            message_id (int, optional): ID of the message that caused it
+        """
+        when = when or timezone.now()
+        window = timedelta(seconds=settings.CHAT_ACTIVITY_COALESCE_SECONDS)
+
+        fields = {"last_activity_at": when}
+        if message_id is not None:
+            fields["last_message_id"] = message_id
+        cls.objects.filter(id=chat_id, last_activity_at__lte=when).update(**fields)
+        ChatParticipant.objects.filter(
+            chat_id=chat_id, last_activity_at__lt=when - window
+        ).update(last_activity_at=when)
+
+    @classmethod
+    def next_seq(cls, chat_id: int) -> int:
+        """
+        Allocate the chat's next event sequence number.
+
+        Must be called inside a transaction. The update locks the chat row
+        until commit, so sequence numbers follow commit order per chat.
+
+        Args:
+            chat_id (int): ID of the chat
+
+        Returns:
+            int: The allocated sequence number
+        """
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"UPDATE {cls._meta.db_table} SET last_seq = last_seq + 1 "
+                "WHERE id = %s RETURNING last_seq",
+                [chat_id],
+            )
+            (seq,) = cursor.fetchone()
+        return seq
+
     def __str__(self):
         """String representation of the chat."""
         return f"Chat<{self.id}>"
 
 
+class ChatParticipant(models.Model):
+    """
+    Membership of a user in a chat.
+
+    Besides linking users to chats, each row carries a copy of the chat's
+    last-activity time so a user's inbox can be read straight off the
+    ``(user, last_activity_at desc)`` index instead of sorting every chat.
+    The unique ``(chat, user)`` index serves membership checks.
+    """
+
+    class Roles(models.TextChoices):
+        """
+        Enumeration of participant roles (meaningful for group chats).
+        """
+
+        OWNER = "owner", "Owner"
+        ADMIN = "admin", "Admin"
+        MEMBER = "member", "Member"
+
+    chat = models.ForeignKey(Chat, on_delete=models.CASCADE, related_name="memberships")
+    user = models.ForeignKey(
+        User, on_delete=models.CASCADE, related_name="chat_memberships"
+    )
+    role = models.CharField(max_length=10, choices=Roles.choices, default=Roles.MEMBER)
+    joined_at = models.DateTimeField(default=timezone.now)
+
+    # Denormalized chat activity time used for inbox ordering
+    last_activity_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        """Meta configuration for the ChatParticipant model."""
+        # Keep the table created by the original auto-generated M2M
+        db_table = "chat_chat_participants"
+        unique_together = [("chat", "user")]
+        indexes = [
+            # Index-ordered inbox scan: newest activity first for one user
+            models.Index(
+                fields=["user", "-last_activity_at", "-chat"],
+                name="chat_participant_inbox_idx",
+            ),
+        ]
+
+    @property
+    def can_manage(self) -> bool:
+        """Whether this participant may add or remove group members."""
+        return self.role in (self.Roles.OWNER, self.Roles.ADMIN)
+
+    def __str__(self):
+        """String representation of the membership."""
+        return f"User<{self.user_id}> in Chat<{self.chat_id}>"
+
+
+class MessageManager(models.Manager):
+    """
+    Manager for Message that keeps chat activity in sync with message writes.
+    """
+
+    def create_message(
+        self,
+        chat_id: int,
+        sender,
+        content: str,
+        metadata=None,
+        client_key=None,
+        attachment_ids=None,
+    ):
+        """
+        Create a message, bump the chat's activity and queue its broadcast.
+
+        The message row, the activity update and the ``chat.message`` outbox
+        event are written in one transaction, so a message is never stored
+        without its broadcast (or the other way round). Delivery to the
+        channel layer happens later in the outbox dispatcher.
+
+        Once the transaction commits, the chat is also moved to the top of
+        every participant's cached inbox, and the message is appended to the
+        chat's recent-message cache.
+
+        A message sent with a ``client_key`` is created at most once per
+        chat and sender: retries with the same key return the original
+        message, found through a short-lived cache entry or, after that
+        expires, the ``message_client_key_uniq`` constraint.
+
+        Args:
+            chat_id (int): ID of the chat the message belongs to
+            sender: User sending the message
+            content (str): Message text
+            metadata (dict, optional): Additional message data
+            client_key (str, optional): Client-generated idempotency key
+            attachment_ids (list, optional): IDs of completed attachments
+                uploaded by the sender, attached in the same transaction
+
+        Returns:
+            Message: The created message instance, or the original one for a
+            retried ``client_key``
+
+        Raises:
+            ValueError: If an attachment is unknown, incomplete, uploaded by
+                someone else or already attached to a message
+        """
+        if client_key is not None:
+            dedup_key = f"chat:{chat_id}:dedup:{sender.pk}:{client_key}"
+            original_id = cache.get(dedup_key)
+            if original_id is not None:
+                original = self._get_original(id=original_id)
+                if original is not None:
+                    return original
+
+        try:
+            msg = self._create_message(
+                chat_id, sender, content, metadata, client_key, attachment_ids
+            )
+        except IntegrityError:
+            if client_key is None:
+                raise
+            # A retry raced the original (or came after the cache entry
+            # expired) and hit the unique constraint
+            original = self._get_original(
+                chat_id=chat_id, sender_id=sender.pk, client_key=client_key
+            )
+            if original is None:
+                raise
+            cache.set(dedup_key, original.id, settings.CHAT_IDEMPOTENCY_TTL_SECONDS)
+            return original
+
+        if client_key is not None:
+            cache.set(dedup_key, msg.id, settings.CHAT_IDEMPOTENCY_TTL_SECONDS)
+        return msg
+
+    def _get_original(self, **lookup):
+        """Load a previously sent message, from the primary."""
+        return (
+            self.db_manager(DEFAULT_DB_ALIAS)
+            .prefetch_related("attachments")
+            .filter(**lookup)
+            .first()
+        )
+
+    def _create_message(
+        self, chat_id, sender, content, metadata, client_key, attachment_ids
+    ):
+        """Write a message with its activity updates and outbox event."""
+        from .inbox import record_activity
+        from .message_cache import record_message
+        from .serializers import MessageSerializer
+
+        with transaction.atomic():
+            seq = Chat.next_seq(chat_id)
+            msg = self.create(
+                chat_id=chat_id,
+                sender=sender,
+                content=content,
+                metadata=metadata or {},
+                client_key=client_key,
+                version=seq,
+            )
+            if attachment_ids:
+                attachment_ids = set(attachment_ids)
+                claimed = Attachment.objects.filter(
+                    id__in=attachment_ids,
+                    uploader=sender,
+                    message__isnull=True,
+                    blob__isnull=False,
+                ).update(message=msg)
+                if claimed != len(attachment_ids):
+                    raise ValueError("Attachments not found or not available")
+            Chat.record_activity(chat_id, msg.created_at, message_id=msg.id)
+            Chat.objects.filter(id=chat_id).update(
+                message_count=F("message_count") + 1
+            )
+            data = MessageSerializer(msg).data
+            OutboxEvent.enqueue(
+                chat_id, {"type": "chat.message", "message": data}, seq=seq
+            )
+
+            transaction.on_commit(lambda: record_activity(chat_id, msg.created_at))
+            transaction.on_commit(lambda: record_message(chat_id, seq, data))
+        return msg
+
+    def edit_message(self, message_id: int, content: str, metadata=None):
+        """
+        Replace the content (and optionally the metadata) of a message.
+
+        The message takes the chat's next sequence number as its version,
+        and a ``chat.message_edited`` event carrying only the changed fields
+        is queued in the same transaction. The chat's inbox preview reads
+        the message through ``Chat.last_message``, so it shows the edit
+        without being rewritten.
+
+        New metadata replaces the client's keys only: enrichment results
+        stay until the message is enriched again.
+
+        Args:
+            message_id (int): ID of the message
+            content (str): New message text
+            metadata (dict, optional): New metadata (kept when omitted)
+
+        Returns:
+            Message: The edited message, or None if it does not exist or
+            was deleted
+        """
+        fields = {"content": content}
+        if metadata is not None:
+            fields["metadata"] = metadata
+        return self._change_message(message_id, "chat.message_edited", fields)
+
+    def delete_message(self, message_id: int):
+        """
+        Soft-delete a message, leaving a tombstone in the history.
+
+        The content, metadata and attachments are removed and ``deleted_at``
+        is set; the row stays so history pages, ``message_count`` and
+        clients syncing by version all see the deletion. If the message was
+        the chat's inbox preview, ``Chat.last_message`` moves to the newest
+        message that is not deleted, in the same transaction.
+
+        Args:
+            message_id (int): ID of the message
+
+        Returns:
+            Message: The tombstone, or None if the message does not exist
+            or was already deleted
+        """
+        fields = {"content": "", "metadata": {}, "deleted_at": timezone.now()}
+        return self._change_message(message_id, "chat.message_deleted", fields)
+
+    def enrich_message(self, message_id: int, content: str, patch: dict):
+        """
+        Merge enrichment results into a message's metadata.
+
+        Results live in ``metadata[Message.ENRICHMENT_KEY]``, apart from the
+        client's own metadata keys. ``patch`` maps result keys to new values
+        (None removes the key). Only keys whose value changes are written;
+        they bump the message's version and are broadcast as a
+        ``chat.message_enriched`` event holding just those keys. Enrichment
+        is not an edit, so ``edited_at`` is left alone.
+
+        Args:
+            message_id (int): ID of the message
+            content (str): Content the results were computed from; results
+                for content that was edited since are discarded
+            patch (dict): Result keys to set or remove
+
+        Returns:
+            dict or None: The keys written, or None if nothing changed or the
+            message was deleted or edited since
+        """
+        with transaction.atomic():
+            msg = (
+                self.select_for_update(of=("self",))
+                .filter(id=message_id, content=content, deleted_at__isnull=True)
+                .first()
+            )
+            if msg is None:
+                return None
+
+            current = msg.metadata.get(Message.ENRICHMENT_KEY) or {}
+            changed = {
+                key: value
+                for key, value in patch.items()
+                if current.get(key) != value
+            }
+            if not changed:
+                return None
+
+            seq = Chat.next_seq(msg.chat_id)
+            results = {
+                k: v for k, v in {**current, **changed}.items() if v is not None
+            }
+            msg.metadata = {
+                k: v for k, v in msg.metadata.items() if k != Message.ENRICHMENT_KEY
+            }
+            if results:
+                msg.metadata[Message.ENRICHMENT_KEY] = results
+            msg.version = seq
+            msg.save(update_fields=["metadata", "version"])
+
+            OutboxEvent.enqueue(
+                msg.chat_id,
+                {
+                    "type": "chat.message_enriched",
+                    "message": {
+                        "id": msg.id,
+                        "chat": msg.chat_id,
+                        "version": seq,
+                        "enrichment": changed,
+                    },
+                },
+                seq=seq,
+            )
+        return changed
+
+    def _change_message(self, message_id, event_type, fields):
+        """Update a live message, bump its version and queue the delta event."""
+        from .serializers import MessageDeltaSerializer
+
+        with transaction.atomic():
+            # Lock the message (then the chat, in next_seq) so concurrent
+            # changes of one message are applied one after the other
+            msg = (
+                self.select_for_update(of=("self",))
+                .filter(id=message_id, deleted_at__isnull=True)
+                .first()
+            )
+            if msg is None:
+                return None
+
+            seq = Chat.next_seq(msg.chat_id)
+            if "deleted_at" not in fields:
+                fields["edited_at"] = timezone.now()
+                results = msg.metadata.get(Message.ENRICHMENT_KEY)
+                if "metadata" in fields and results:
+                    fields["metadata"] = {
+                        **fields["metadata"],
+                        Message.ENRICHMENT_KEY: results,
+                    }
+            for name, value in {**fields, "version": seq}.items():
+                setattr(msg, name, value)
+            msg.save(update_fields=[*fields, "version"])
+
+            if msg.deleted_at is not None:
+                # Deleted messages keep no files (their blobs stay shared)
+                Attachment.objects.filter(message_id=msg.id).delete()
+                newest = (
+                    self.filter(chat_id=msg.chat_id, deleted_at__isnull=True)
+                    .order_by("-created_at", "-id")
+                    .values("id")[:1]
+                )
+                Chat.objects.filter(id=msg.chat_id, last_message_id=msg.id).update(
+                    last_message_id=Subquery(newest)
+                )
+
+            OutboxEvent.enqueue(
+                msg.chat_id,
+                {"type": event_type, "message": MessageDeltaSerializer(msg).data},
+                seq=seq,
+            )
+        return msg
+
+
 class Message(models.Model):
     """
     Model representing an individual message within a chat.
     
     Each message belongs to a chat and has a sender, content, and optional metadata.
+    Edits bump ``version``; deletions leave a tombstone (``deleted_at`` set,
+    content and metadata cleared) so that clients can sync them.
     """
+    # Metadata key reserved for enrichment results (see chat.enrichment);
+    # clients cannot write it
+    ENRICHMENT_KEY = "enrichment"
+
     # Foreign key to the chat this message belongs to
     chat = models.ForeignKey(Chat, on_delete=models.CASCADE, related_name="messages")
     
@@ -82,6 +713,21 @@ class Message(models.Model):
     # Timestamp for when the message was created (indexed for efficient ordering)
     created_at = models.DateTimeField(auto_now_add=True, db_index=True)
 
+    # Optional client-generated key making retried sends idempotent
+    client_key = models.CharField(max_length=64, null=True, blank=True)
+
+    # Chat sequence number of the latest change (creation, edit or deletion);
+    # clients sync changes since a version they have seen
+    version = models.BigIntegerField(default=0)
+
+    # Time of the latest edit, if any
+    edited_at = models.DateTimeField(null=True, blank=True)
+
+    # Deletion time; deleted messages stay as tombstones without content
+    deleted_at = models.DateTimeField(null=True, blank=True)
+
+    objects = MessageManager()
+
     class Meta:
         """Meta configuration for the Message model."""
         indexes = [
@@ -89,6 +735,16 @@ class Message(models.Model):
             models.Index(fields=["chat", "created_at"], name="chat_created_idx"),
             # GIN index for efficient JSON metadata queries
             GinIndex(fields=["metadata"], name="message_meta_gin"),
+            # Changes of a chat since a version watermark
+            models.Index(fields=["chat", "version"], name="message_chat_version_idx"),
+        ]
+        constraints = [
+            # One message per client key and sender in a chat
+            models.UniqueConstraint(
+                fields=["chat", "sender", "client_key"],
+                condition=Q(client_key__isnull=False),
+                name="message_client_key_uniq",
+            ),
         ]
         # Default ordering by creation time (oldest first)
         ordering = ["created_at"]
@@ -96,3 +752,144 @@ class Message(models.Model):
     def __str__(self):
         """String representation of the message."""
         return f"Msg<{self.id}> in Chat<{self.chat_id}> by {self.sender_id}"
+
+
+class AttachmentBlob(models.Model):
+    """
+    Stored file content, addressed by its SHA-256 digest.
+
+    Every upload of the same bytes shares one blob (and one file on disk
+    under ``ATTACHMENT_ROOT``, see ``chat.attachments``).
+    """
+
+    sha256 = models.CharField(max_length=64, primary_key=True)
+    size = models.PositiveBigIntegerField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        """String representation of the blob."""
+        return f"Blob<{self.sha256[:12]}>"
+
+
+class Attachment(models.Model):
+    """
+    A file uploaded by a user, and attached to at most one message.
+
+    Uploads are resumable: the client declares the size up front and sends
+    the bytes in chunks, tracked by ``received``. Once complete the
+    attachment points at the deduplicated ``AttachmentBlob`` holding its
+    content. Messages reference attachments instead of embedding files in
+    their metadata.
+    """
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    uploader = models.ForeignKey(
+        User, on_delete=models.CASCADE, related_name="attachments"
+    )
+
+    # Message the attachment was sent with (None until then)
+    message = models.ForeignKey(
+        "Message",
+        null=True,
+        blank=True,
+        on_delete=models.CASCADE,
+        related_name="attachments",
+    )
+
+    filename = models.CharField(max_length=255)
+    content_type = models.CharField(max_length=255)
+
+    # Declared total size and bytes received so far
+    size = models.PositiveBigIntegerField()
+    received = models.PositiveBigIntegerField(default=0)
+
+    # Digest declared by the client (optional), checked on completion
+    expected_sha256 = models.CharField(max_length=64, blank=True)
+
+    # Content, set once the upload is complete
+    blob = models.ForeignKey(
+        AttachmentBlob,
+        null=True,
+        blank=True,
+        on_delete=models.PROTECT,
+        related_name="attachments",
+    )
+
+    created_at = models.DateTimeField(auto_now_add=True)
+    completed_at = models.DateTimeField(null=True, blank=True)
+
+    @property
+    def is_complete(self) -> bool:
+        """Whether the upload finished and the content is available."""
+        return self.blob_id is not None
+
+    def __str__(self):
+        """String representation of the attachment."""
+        return f"Attachment<{self.id}>"
+
+
+class OutboxEvent(models.Model):
+    """
+    Channel layer event waiting to be broadcast to a chat's group.
+
+    Events are inserted in the same transaction as the data they announce
+    and drained by the ``dispatch_outbox`` command, which sends them to the
+    ``chat_{id}`` group in insertion order per chat and deletes them once
+    delivered. Failed sends are retried with backoff.
+    """
+    # Postgres NOTIFY channel used to wake the dispatcher on commit
+    NOTIFY_CHANNEL = "chat_outbox"
+
+    chat = models.ForeignKey(Chat, on_delete=models.CASCADE, related_name="+")
+
+    # Channel layer message, e.g. {"type": "chat.message", "message": {...}}
+    payload = models.JSONField()
+
+    # Number of delivery attempts so far
+    attempts = models.PositiveSmallIntegerField(default=0)
+
+    # Earliest time of the next delivery attempt (pushed forward while an
+    # event is claimed by a dispatcher or waiting for a retry)
+    available_at = models.DateTimeField(default=timezone.now)
+
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        """Meta configuration for the OutboxEvent model."""
+        indexes = [
+            # Per-chat ordering check: is an earlier event of this chat pending?
+            models.Index(fields=["chat", "id"], name="outbox_chat_idx"),
+        ]
+
+    @classmethod
+    def enqueue(cls, chat_id: int, payload: dict, seq=None):
+        """
+        Queue a broadcast to a chat's group.
+
+        Must be called inside the transaction that writes the data being
+        announced. The event is stamped with the chat's next sequence number
+        (``payload["seq"]``); allocating it locks the chat row until commit,
+        so sequence numbers and outbox IDs follow commit order per chat. The
+        NOTIFY is delivered by Postgres only on commit, which wakes an idle
+        dispatcher without polling.
+
+        Args:
+            chat_id (int): ID of the chat whose group receives the event
+            payload (dict): Channel layer message to send
+            seq (int, optional): Sequence number already allocated with
+                ``Chat.next_seq`` in this transaction, for writes that store
+                it (as ``Message.version``) before announcing them
+
+        Returns:
+            OutboxEvent: The queued event
+        """
+        if seq is None:
+            seq = Chat.next_seq(chat_id)
+        event = cls.objects.create(chat_id=chat_id, payload={**payload, "seq": seq})
+        with connection.cursor() as cursor:
+            cursor.execute(f"NOTIFY {cls.NOTIFY_CHANNEL}")
+        return event
+
+    def __str__(self):
+        """String representation of the outbox event."""
+        return f"Outbox<{self.id}> for Chat<{self.chat_id}>"
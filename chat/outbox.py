@@ -0,0 +1,244 @@
+"""
+Outbox dispatcher that drains queued broadcasts into the channel layer.
+
+Request handlers and consumers never talk to the channel layer for
+messages: they write an ``OutboxEvent`` in the same transaction as the
+message, and this dispatcher delivers it. Slow or unavailable Redis
+therefore delays delivery instead of blocking (or silently losing) sends.
+
+Delivery rules:
+
+- Events are claimed in batches with a lease (``available_at`` is pushed
+  ``CHAT_OUTBOX_LEASE_SECONDS`` ahead), so a crashed dispatcher's events
+  become available again on their own. Delivery is at-least-once.
+- An event is only claimed when no earlier event of the same chat is
+  leased or waiting for a retry, which keeps delivery ordered per chat.
+- Failed sends are retried with exponential backoff; after
+  ``CHAT_OUTBOX_MAX_ATTEMPTS`` the event is dropped and logged.
+- Each claimed batch is appended to the chats' replay buffers
+  (``chat.replay``) before it is sent, so a client that resumes right
+  after a broadcast can always replay it.
+- Created and edited messages are queued for enrichment
+  (``chat.enrichment``), so enrichment never delays a send.
+
+Run one dispatcher per partition (``--partitions`` / ``--partition``) to
+spread load over processes; each chat always maps to the same partition.
+"""
+
+import asyncio
+import json
+import logging
+from datetime import timedelta
+
+from asgiref.sync import sync_to_async
+from channels.db import database_sync_to_async
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .enrichment import feed_events
+from .models import OutboxEvent
+from .replay import append_events
+
+logger = logging.getLogger(__name__)
+
+_CLAIM_SQL = f"""
+    UPDATE {OutboxEvent._meta.db_table}
+    SET attempts = attempts + 1, available_at = %(lease_until)s
+    WHERE id IN (
+        SELECT e.id FROM {OutboxEvent._meta.db_table} e
+        WHERE e.available_at <= %(now)s
+          AND e.chat_id %% %(partitions)s = %(partition)s
+          AND NOT EXISTS (
+              SELECT 1 FROM {OutboxEvent._meta.db_table} b
+              WHERE b.chat_id = e.chat_id
+                AND b.id < e.id
+                AND b.available_at > %(now)s
+          )
+        ORDER BY e.id
+        LIMIT %(limit)s
+        FOR UPDATE SKIP LOCKED
+    )
+    RETURNING id, chat_id, payload, attempts
+"""
+
+
+def claim_batch(limit: int, partition: int = 0, partitions: int = 1):
+    """
+    Lease the next deliverable events of this dispatcher's partition.
+
+    Args:
+        limit (int): Maximum number of events to claim
+        partition (int): Index of this dispatcher's partition
+        partitions (int): Total number of partitions
+
+    Returns:
+        list: ``(id, chat_id, payload, attempts)`` tuples ordered by ID
+    """
+    now = timezone.now()
+    params = {
+        "now": now,
+        "lease_until": now + timedelta(seconds=settings.CHAT_OUTBOX_LEASE_SECONDS),
+        "partition": partition,
+        "partitions": partitions,
+        "limit": limit,
+    }
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(_CLAIM_SQL, params)
+        rows = cursor.fetchall()
+
+    # Django loads jsonb as text on raw cursors; decode it like the ORM does
+    return sorted(
+        (
+            (event_id, chat_id, json.loads(payload), attempts)
+            for event_id, chat_id, payload, attempts in rows
+        ),
+        key=lambda row: row[0],
+    )
+
+
+def settle_batch(delivered, retry, release, dropped):
+    """
+    Record the outcome of a delivery round.
+
+    Args:
+        delivered (list): IDs of events sent successfully (deleted)
+        retry (dict): Event ID -> attempts, for failed sends to back off
+        release (list): IDs of claimed events that were not attempted
+        dropped (list): IDs of events that ran out of attempts (deleted)
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        if delivered or dropped:
+            OutboxEvent.objects.filter(id__in=[*delivered, *dropped]).delete()
+        if release:
+            # Not attempted, so the claim does not count as an attempt
+            OutboxEvent.objects.filter(id__in=release).update(
+                available_at=now, attempts=F("attempts") - 1
+            )
+        for event_id, attempts in retry.items():
+            delay = min(2**attempts, settings.CHAT_OUTBOX_MAX_BACKOFF_SECONDS)
+            OutboxEvent.objects.filter(id=event_id).update(
+                available_at=now + timedelta(seconds=delay)
+            )
+
+
+class OutboxDispatcher:
+    """
+    Async loop that delivers outbox events to the channel layer.
+    """
+
+    def __init__(self, channel_layer, batch_size=None, partition=0, partitions=1):
+        self.channel_layer = channel_layer
+        self.batch_size = batch_size or settings.CHAT_OUTBOX_BATCH_SIZE
+        self.partition = partition
+        self.partitions = partitions
+
+    async def run(self):
+        """Dispatch forever, sleeping on Postgres notifications when idle."""
+        listener = await _NotificationListener.open()
+        try:
+            while True:
+                if await self.dispatch_batch() < self.batch_size:
+                    await listener.wait(settings.CHAT_OUTBOX_POLL_SECONDS)
+        finally:
+            await listener.close()
+
+    async def dispatch_batch(self) -> int:
+        """
+        Claim and deliver one batch.
+
+        Returns:
+            int: Number of events claimed
+        """
+        batch = await database_sync_to_async(claim_batch)(
+            self.batch_size, self.partition, self.partitions
+        )
+
+        events = [(chat_id, payload) for _, chat_id, payload, _ in batch]
+        await sync_to_async(append_events, thread_sensitive=False)(events)
+        await sync_to_async(feed_events, thread_sensitive=False)(events)
+
+        delivered, release, dropped = [], [], []
+        retry = {}
+        failed_chats = set()
+        for event_id, chat_id, payload, attempts in batch:
+            # Never overtake a failed event of the same chat
+            if chat_id in failed_chats:
+                release.append(event_id)
+                continue
+            try:
+                await self.channel_layer.group_send(f"chat_{chat_id}", payload)
+            except Exception:
+                failed_chats.add(chat_id)
+                if attempts >= settings.CHAT_OUTBOX_MAX_ATTEMPTS:
+                    logger.error(
+                        "Dropping outbox event %s after %s attempts",
+                        event_id,
+                        attempts,
+                        exc_info=True,
+                    )
+                    dropped.append(event_id)
+                else:
+                    logger.warning(
+                        "Outbox event %s failed, retrying", event_id, exc_info=True
+                    )
+                    retry[event_id] = attempts
+            else:
+                delivered.append(event_id)
+
+        if batch:
+            await database_sync_to_async(settle_batch)(
+                delivered, retry, release, dropped
+            )
+        return len(batch)
+
+
+class _NotificationListener:
+    """
+    Waits for ``OutboxEvent.NOTIFY_CHANNEL`` notifications.
+
+    Uses a dedicated psycopg 3 async connection (a pooled Django connection
+    cannot hold a LISTEN). Without psycopg 3, or when notifications cannot
+    be received (e.g. behind pgbouncer), waiting falls back to sleeping for
+    the poll interval.
+    """
+
+    def __init__(self, conn=None):
+        self.conn = conn
+
+    @classmethod
+    async def open(cls):
+        try:
+            import psycopg
+        except ImportError:
+            return cls()
+
+        db = settings.DATABASES["default"]
+        try:
+            conn = await psycopg.AsyncConnection.connect(
+                dbname=db["NAME"],
+                user=db["USER"],
+                password=db["PASSWORD"],
+                host=db["HOST"],
+                port=db["PORT"],
+                autocommit=True,
+            )
+            await conn.execute(f"LISTEN {OutboxEvent.NOTIFY_CHANNEL}")
+        except psycopg.Error:
+            logger.warning("Outbox LISTEN unavailable, polling instead", exc_info=True)
+            return cls()
+        return cls(conn)
+
+    async def wait(self, timeout: float):
+        """Return after a notification arrives or ``timeout`` seconds pass."""
+        if self.conn is None:
+            await asyncio.sleep(timeout)
+            return
+        async for _ in self.conn.notifies(timeout=timeout, stop_after=1):
+            pass
+
+    async def close(self):
+        if self.conn is not None:
+            await self.conn.close()
@@ -0,0 +1,92 @@
+"""
+Built-in message enrichment processors (see ``chat.enrichment``).
+
+- MentionProcessor: ``mentions``, IDs of participants addressed by
+  ``@nickname``
+- LinkProcessor: ``links``, the URLs in the message with their domains
+- FlagProcessor: ``flags``, the ``CHAT_FLAGGED_TERMS`` the message contains
+
+Link previews (fetching titles and images) are left to a custom processor
+with its own ``concurrency`` limit: fetching arbitrary URLs from the
+server needs an egress policy this project does not define.
+"""
+
+import re
+from urllib.parse import urlsplit
+
+from django.conf import settings
+from django.db.models.functions import Lower
+
+from .enrichment import Processor
+from .models import ChatParticipant
+
+_MENTION_RE = re.compile(r"(?<![\w@])@([\w.+-]{1,100})")
+_URL_RE = re.compile(r"https?://[^\s<>\"']+", re.IGNORECASE)
+_WORD_RE = re.compile(r"\w+")
+
+# URLs kept per message
+MAX_LINKS = 10
+
+
+class MentionProcessor(Processor):
+    """
+    Resolve ``@nickname`` mentions to the chat participants they address.
+
+    Nicknames match case-insensitively; handles that match no participant
+    are ignored.
+    """
+
+    key = "mentions"
+
+    def process(self, message):
+        handles = {
+            handle.rstrip(".").lower()
+            for handle in _MENTION_RE.findall(message["content"])
+        }
+        if not handles:
+            return None
+        user_ids = (
+            ChatParticipant.objects.filter(chat_id=message["chat_id"])
+            .annotate(nickname=Lower("user__nickname"))
+            .filter(nickname__in=handles)
+            .values_list("user_id", flat=True)
+        )
+        return sorted(user_ids) or None
+
+
+class LinkProcessor(Processor):
+    """
+    Extract the http(s) URLs of a message (at most ``MAX_LINKS``).
+    """
+
+    key = "links"
+
+    def process(self, message):
+        links = []
+        for url in _URL_RE.findall(message["content"]):
+            # Trailing punctuation usually ends the sentence, not the URL
+            url = url.rstrip(".,;:!?)]}")
+            domain = urlsplit(url).hostname
+            if domain and url not in (link["url"] for link in links):
+                links.append({"url": url, "domain": domain})
+            if len(links) == MAX_LINKS:
+                break
+        return links or None
+
+
+class FlagProcessor(Processor):
+    """
+    Flag messages containing any of the ``CHAT_FLAGGED_TERMS`` (whole
+    words, case-insensitive).
+    """
+
+    key = "flags"
+
+    def __init__(self):
+        self.terms = {term.lower() for term in settings.CHAT_FLAGGED_TERMS}
+
+    def process(self, message):
+        if not self.terms:
+            return None
+        words = set(_WORD_RE.findall(message["content"].lower()))
+        return sorted(self.terms & words) or None
@@ -0,0 +1,96 @@
+"""
+Per-chat replay buffer for resuming WebSocket sessions.
+
+Every broadcast carries the chat's sequence number (``Chat.last_seq``,
+allocated by ``OutboxEvent.enqueue``). The outbox dispatcher appends each
+event to a Redis sorted set ``chat:{chat_id}:replay`` scored by that
+sequence number before sending it, keeping the newest
+``CHAT_REPLAY_BUFFER_SIZE`` events for ``CHAT_REPLAY_TTL_SECONDS`` after
+the chat's last broadcast.
+
+A client that reconnects after a short network blip sends the last
+sequence number it saw and receives just the events it missed, read from
+Redis. Only when the buffer cannot prove the gap is complete (expired,
+trimmed, or Redis unavailable) is the client told to resync over the REST
+API.
+"""
+
+import json
+import logging
+
+from django.conf import settings
+from redis import RedisError
+
+from .models import Chat
+from .utils import get_redis
+
+logger = logging.getLogger(__name__)
+
+
+def replay_key(chat_id: int) -> str:
+    """Return the Redis key of a chat's replay buffer."""
+    return f"chat:{chat_id}:replay"
+
+
+def append_events(events):
+    """
+    Add broadcast events to their chats' replay buffers.
+
+    Appending an event twice (e.g. when its delivery is retried) is a no-op,
+    since the serialized payload is the sorted set member.
+
+    Args:
+        events (list): ``(chat_id, payload)`` tuples; payloads carry ``seq``
+    """
+    if not events:
+        return
+
+    pipe = get_redis().pipeline(transaction=False)
+    for chat_id in {chat_id for chat_id, _ in events}:
+        key = replay_key(chat_id)
+        for event_chat_id, payload in events:
+            if event_chat_id == chat_id:
+                pipe.zadd(key, {json.dumps(payload, sort_keys=True): payload["seq"]})
+        pipe.zremrangebyrank(key, 0, -(settings.CHAT_REPLAY_BUFFER_SIZE + 1))
+        pipe.expire(key, settings.CHAT_REPLAY_TTL_SECONDS)
+    try:
+        pipe.execute()
+    except RedisError:
+        logger.warning("Failed to append events to replay buffers", exc_info=True)
+
+
+def events_since(chat_id: int, last_seq: int):
+    """
+    Return the events of a chat that came after ``last_seq``.
+
+    Args:
+        chat_id (int): ID of the chat
+        last_seq (int): Last sequence number the client received
+
+    Returns:
+        list or None: Payloads in sequence order, or None when the gap cannot
+        be replayed and the client must resync
+    """
+    key = replay_key(chat_id)
+    try:
+        pipe = get_redis().pipeline(transaction=False)
+        pipe.exists(key)
+        pipe.zrangebyscore(key, f"({last_seq}", "+inf")
+        exists, members = pipe.execute()
+    except RedisError:
+        logger.warning("Replay buffer unavailable for chat %s", chat_id, exc_info=True)
+        return None
+
+    if not exists:
+        # Nothing broadcast for a while (or Redis was flushed): replaying is
+        # only possible when the client has not missed anything at all
+        current = Chat.objects.filter(id=chat_id).values_list("last_seq", flat=True)
+        return [] if current.first() == last_seq else None
+
+    events = [json.loads(member) for member in members]
+    # The buffer must hold every sequence number of the gap, without holes
+    # left by trimming or by a failed append
+    for expected, event in enumerate(events, start=last_seq + 1):
+        if event["seq"] != expected:
+            return None
+    return events
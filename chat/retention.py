@@ -0,0 +1,314 @@
+"""
+Retention engine that purges old messages in small batches.
+
+A chat keeps its messages for ``Chat.retention_days`` days, or
+``CHAT_RETENTION_DAYS`` when the chat sets none (0 keeps them forever).
+A single ``DELETE`` of every expired message would hold locks on huge
+ranges, write one enormous WAL burst and cascade through the ORM, so
+``purge_messages`` works chat by chat instead:
+
+- Each batch takes the oldest ``CHAT_RETENTION_BATCH_SIZE`` expired
+  messages of one chat from the ``chat_created_idx`` index and deletes
+  them, their attachments and their share of ``Chat.message_count`` in a
+  short transaction, then sleeps ``CHAT_RETENTION_PAUSE_MS`` so replicas
+  and concurrent writers keep up.
+- The transaction of every batch that deleted messages also queues a
+  ``chat.messages_purged`` event. Its sequence number invalidates the
+  chat's recent-message cache everywhere, so no reader is served deleted
+  messages once the batch commits, even if the run stops right after.
+- Chats are visited in ID order and the last finished chat is stored in
+  Redis, so an interrupted run resumes where it stopped.
+- When the message table is range-partitioned on ``created_at``,
+  partitions that lie entirely past every chat's retention are detached
+  and dropped instead of being deleted row by row.
+
+Attachment files stay in their (shared) blobs; see ``chat.attachments``.
+"""
+
+import logging
+import re
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Max
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from redis import RedisError
+
+from .models import Attachment, Chat, Message, OutboxEvent
+from .utils import get_redis
+
+logger = logging.getLogger(__name__)
+
+# Redis key holding the ID of the last chat a run finished
+CURSOR_KEY = "chat:retention:cursor"
+
+# Chats read per query while walking the chat table
+_CHAT_PAGE_SIZE = 1000
+
+_MESSAGES = Message._meta.db_table
+_ATTACHMENTS = Attachment._meta.db_table
+_CHATS = Chat._meta.db_table
+
+_BOUND_RE = re.compile(r"TO \('([^']+)'\)")
+
+_PURGE_BATCH_SQL = f"""
+    WITH doomed AS (
+        SELECT id FROM {_MESSAGES}
+        WHERE chat_id = %(chat_id)s AND created_at < %(cutoff)s
+        -- Spelled as chat_created_idx's key so the range is read from it
+        ORDER BY chat_id, created_at
+        LIMIT %(limit)s
+        FOR UPDATE
+    ),
+    detached AS (
+        DELETE FROM {_ATTACHMENTS} WHERE message_id IN (SELECT id FROM doomed)
+    ),
+    deleted AS (
+        DELETE FROM {_MESSAGES} WHERE id IN (SELECT id FROM doomed)
+        RETURNING id
+    )
+    UPDATE {_CHATS} SET
+        message_count = GREATEST(
+            message_count - (SELECT count(*) FROM deleted), 0
+        ),
+        last_message_id = CASE
+            WHEN last_message_id IN (SELECT id FROM doomed) THEN (
+                SELECT m.id FROM {_MESSAGES} m
+                WHERE m.chat_id = %(chat_id)s
+                  AND m.deleted_at IS NULL
+                  AND m.id NOT IN (SELECT id FROM doomed)
+                ORDER BY m.created_at DESC, m.id DESC
+                LIMIT 1
+            )
+            ELSE last_message_id
+        END
+    WHERE id = %(chat_id)s
+    RETURNING (SELECT count(*) FROM deleted)
+"""
+
+
+def retention_cutoff(days, now=None):
+    """Return the time before which messages kept ``days`` days expire."""
+    return (now or timezone.now()) - timedelta(days=days)
+
+
+class RetentionEngine:
+    """
+    Deletes expired messages in throttled, index-ordered batches.
+
+    Args:
+        default_days (int): Retention of chats without their own (0: none)
+        batch_size (int): Messages deleted per transaction
+        pause (float): Seconds slept after each batch
+        progress: Callable receiving a progress line, or None
+    """
+
+    def __init__(
+        self, default_days=None, batch_size=None, pause=None, progress=None
+    ):
+        self.default_days = (
+            settings.CHAT_RETENTION_DAYS if default_days is None else default_days
+        )
+        self.batch_size = batch_size or settings.CHAT_RETENTION_BATCH_SIZE
+        if pause is None:
+            pause = settings.CHAT_RETENTION_PAUSE_MS / 1000
+        self.pause = pause
+        self.progress = progress or (lambda line: None)
+        self.now = timezone.now()
+        self.deleted = 0
+
+    def run(self, chat_ids=None, resume=True) -> int:
+        """
+        Purge the expired messages of every chat (or the given ones).
+
+        Args:
+            chat_ids (list, optional): Only purge these chats (no checkpoint)
+            resume (bool): Continue after the chat a previous run finished
+
+        Returns:
+            int: Number of messages deleted
+        """
+        started = time.monotonic()
+        if chat_ids is None:
+            self.drop_partitions()
+
+        cursor = self._load_cursor() if resume and chat_ids is None else 0
+        if cursor:
+            self.progress(f"Resuming after chat {cursor}")
+
+        while True:
+            chats = Chat.objects.filter(id__gt=cursor).order_by("id")
+            if chat_ids is not None:
+                chats = chats.filter(id__in=chat_ids)
+            page = list(chats.values_list("id", "retention_days")[:_CHAT_PAGE_SIZE])
+            if not page:
+                break
+
+            for chat_id, days in page:
+                days = self.default_days if days is None else days
+                cursor = chat_id
+                if not days:
+                    continue
+                if self.purge_chat(chat_id, retention_cutoff(days, self.now)):
+                    if chat_ids is None:
+                        self._save_cursor(cursor)
+            if chat_ids is None:
+                self._save_cursor(cursor)
+
+        if chat_ids is None:
+            self._save_cursor(None)
+        elapsed = time.monotonic() - started
+        self.progress(f"Deleted {self.deleted} messages in {elapsed:.1f}s")
+        return self.deleted
+
+    def purge_chat(self, chat_id: int, cutoff) -> int:
+        """
+        Delete a chat's messages created before ``cutoff``, batch by batch.
+
+        Args:
+            chat_id (int): ID of the chat
+            cutoff (datetime): Messages created before it are deleted
+
+        Returns:
+            int: Number of messages deleted
+        """
+        deleted = 0
+        while True:
+            with transaction.atomic(), connection.cursor() as cursor:
+                cursor.execute(
+                    _PURGE_BATCH_SQL,
+                    {"chat_id": chat_id, "cutoff": cutoff, "limit": self.batch_size},
+                )
+                row = cursor.fetchone()
+                count = row[0] if row else 0
+                if count:
+                    self._announce(chat_id, cutoff)
+            deleted += count
+            self.deleted += count
+            if count < self.batch_size:
+                break
+            self.progress(f"Chat {chat_id}: {deleted} deleted so far")
+            time.sleep(self.pause)
+
+        if deleted:
+            self.progress(f"Chat {chat_id}: deleted {deleted} messages")
+            time.sleep(self.pause)
+        return deleted
+
+    def drop_partitions(self) -> int:
+        """
+        Drop message partitions older than every chat's retention.
+
+        Only applies when the message table is range-partitioned on
+        ``created_at`` and every chat has a retention.
+
+        Returns:
+            int: Number of partitions dropped
+        """
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT pg_get_partkeydef(c.oid) FROM pg_class c "
+                "WHERE c.oid = %s::regclass",
+                [_MESSAGES],
+            )
+            row = cursor.fetchone()
+        if not row or row[0] != "RANGE (created_at)" or not self.default_days:
+            return 0
+
+        longest = Chat.objects.aggregate(days=Max("retention_days"))["days"] or 0
+        if Chat.objects.filter(retention_days=0).exists():
+            # Some chat keeps its messages forever
+            return 0
+        cutoff = retention_cutoff(max(self.default_days, longest), self.now)
+
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT c.relname, pg_get_expr(c.relpartbound, c.oid) "
+                "FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid "
+                "WHERE i.inhparent = %s::regclass ORDER BY c.relname",
+                [_MESSAGES],
+            )
+            partitions = cursor.fetchall()
+
+        dropped = 0
+        for name, bound in partitions:
+            match = _BOUND_RE.search(bound or "")
+            upper = parse_datetime(match.group(1)) if match else None
+            if upper is None or upper > cutoff:
+                continue
+            self._drop_partition(name, cutoff)
+            dropped += 1
+        return dropped
+
+    def _drop_partition(self, name, cutoff):
+        """Detach and drop one expired partition, fixing the chat counters."""
+        table = connection.ops.quote_name(name)
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute(
+                f"SELECT chat_id, count(*) FROM {table} GROUP BY chat_id"
+            )
+            counts = cursor.fetchall()
+            cursor.execute(
+                f"DELETE FROM {_ATTACHMENTS} "
+                f"WHERE message_id IN (SELECT id FROM {table})"
+            )
+            cursor.execute(
+                f"UPDATE {_CHATS} SET last_message_id = NULL "
+                f"WHERE last_message_id IN (SELECT id FROM {table})"
+            )
+            cursor.execute(
+                f"UPDATE {_CHATS} c SET message_count = "
+                "GREATEST(c.message_count - d.n, 0) "
+                "FROM unnest(%s::bigint[], %s::bigint[]) AS d(chat_id, n) "
+                "WHERE c.id = d.chat_id",
+                [[chat_id for chat_id, _ in counts], [n for _, n in counts]],
+            )
+            cursor.execute(f"ALTER TABLE {_MESSAGES} DETACH PARTITION {table}")
+            cursor.execute(f"DROP TABLE {table}")
+
+            # Point previews that lost their message at the newest survivor
+            cursor.execute(
+                f"""
+                UPDATE {_CHATS} c SET last_message_id = (
+                    SELECT m.id FROM {_MESSAGES} m
+                    WHERE m.chat_id = c.id AND m.deleted_at IS NULL
+                    ORDER BY m.created_at DESC, m.id DESC
+                    LIMIT 1
+                )
+                WHERE c.id = ANY(%s) AND c.last_message_id IS NULL
+                """,
+                [[chat_id for chat_id, _ in counts]],
+            )
+            for chat_id, count in counts:
+                self.deleted += count
+                self._announce(chat_id, cutoff)
+        self.progress(f"Dropped partition {name} ({len(counts)} chats)")
+
+    def _announce(self, chat_id, cutoff):
+        """
+        Tell a chat's clients (and message caches) that history shrank.
+
+        Must be called inside the transaction that deletes the messages.
+        """
+        OutboxEvent.enqueue(
+            chat_id, {"type": "chat.messages_purged", "before": cutoff.isoformat()}
+        )
+
+    def _load_cursor(self) -> int:
+        try:
+            return int(get_redis().get(CURSOR_KEY) or 0)
+        except RedisError:
+            logger.warning("Failed to read the retention checkpoint", exc_info=True)
+            return 0
+
+    def _save_cursor(self, chat_id):
+        try:
+            if chat_id is None:
+                get_redis().delete(CURSOR_KEY)
+            else:
+                get_redis().set(CURSOR_KEY, chat_id)
+        except RedisError:
+            logger.warning("Failed to store the retention checkpoint", exc_info=True)
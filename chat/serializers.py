@@ -2,75 +2,302 @@
 Serializers for chat application API responses.
 
 This module defines DRF serializers for converting model instances to/from JSON:
-- PublicUserSerializer: Safe user information for API responses
+- UserProfileField: Public user information, rendered from the profile cache
+- AttachmentSerializer: An uploaded file and its upload progress
 - MessageSerializer: Message data with sender information
-- ChatSerializer: Chat data with participants and last message
+- MessageDeltaSerializer: Changed fields of an edited or deleted message
+- ChatSerializer: Chat data with a capped participant preview and last message
+- ChatMemberSerializer: A participant of a chat with their role
+
+Embedded users (senders, participants, members) are never joined or loaded
+from the users table: they are rendered from the shared profile cache, and
+list serializers load the profiles of all their items in one batch.
 """
 
 from rest_framework import serializers
-from django.contrib.auth import get_user_model
-from .models import Chat, Message
+from django.conf import settings
+from django.db import models
+from django.db.models import Prefetch
+from users.serializers import PublicUserSerializer
+from .models import Attachment, Chat, ChatParticipant, Message
+
+
+def load_profiles(serializer, user_ids):
+    """
+    Get public user data for a serializer, batching through its context.
 
-# Get the user model configured in Django settings
-User = get_user_model()
+    Profiles already loaded by the root serializer (see
+    ``ProfileListSerializer``) are reused; the others are read from the
+    profile cache and kept in the context for the rest of the rendering.
 
+    Args:
+        serializer: The field or serializer rendering the users
+        user_ids (iterable): IDs of the users
 
-class PublicUserSerializer(serializers.ModelSerializer):
+    Returns:
+        dict: Public data by user ID; users that do not exist are left out
     """
-    Serializer for user information that's safe to expose publicly.
-    
-    Only includes non-sensitive user fields that can be shared with other users
-    in chat contexts (excludes password, email verification status, etc.).
+    profiles = serializer.context.setdefault("profiles", {})
+    missing = set(user_ids) - profiles.keys()
+    if missing:
+        profiles.update(PublicUserSerializer.from_cache(missing))
+    return profiles
+
+
+class UserProfileField(serializers.Field):
+    """
+    Read-only public information of a user, bound to a user ID attribute.
+
+    Renders from the profile cache (``PublicUserSerializer.from_cache``), so
+    the user row is never joined; e.g. ``UserProfileField(source="sender_id")``.
+    """
+
+    def __init__(self, **kwargs):
+        kwargs["read_only"] = True
+        super().__init__(**kwargs)
+
+    def to_representation(self, user_id):
+        return load_profiles(self, [user_id]).get(user_id)
+
+
+class ProfileListSerializer(serializers.ListSerializer):
+    """
+    List serializer loading the users embedded in all items in one batch.
+
+    The child serializer lists the user IDs of an item in ``user_ids``.
+    """
+
+    def to_representation(self, data):
+        items = list(data.all() if isinstance(data, models.Manager) else data)
+        load_profiles(
+            self, {user_id for item in items for user_id in self.child.user_ids(item)}
+        )
+        return super().to_representation(items)
+
+
+class AttachmentSerializer(serializers.ModelSerializer):
+    """
+    Serializer for attachments.
+
+    ``received`` is the upload offset to resume from; ``sha256`` is set
+    (and the file downloadable) once the upload is complete.
     """
+    sha256 = serializers.CharField(source="blob_id", read_only=True)
+    complete = serializers.BooleanField(source="is_complete", read_only=True)
+
     class Meta:
-        model = User
-        fields = ["id", "email", "full_name", "nickname"]
+        model = Attachment
+        fields = [
+            "id",
+            "filename",
+            "content_type",
+            "size",
+            "received",
+            "sha256",
+            "complete",
+            "created_at",
+            "completed_at",
+        ]
+        read_only_fields = fields
 
 
 class MessageSerializer(serializers.ModelSerializer):
     """
     Serializer for chat messages.
     
-    Includes read-only sender information using PublicUserSerializer to provide
-    context about who sent each message without exposing sensitive data.
+    Includes read-only public sender information (from the profile cache) to
+    provide context about who sent each message without exposing sensitive data.
+    Attachments are listed in ``attachments`` and attached on creation by
+    passing the IDs of completed uploads in ``attachment_ids``.
     """
     # Include sender details as read-only nested data
-    sender = PublicUserSerializer(read_only=True)
+    sender = UserProfileField(source="sender_id")
+
+    # Optional idempotency key; a blank key would merge unrelated messages
+    client_key = serializers.CharField(
+        max_length=64, required=False, allow_null=True, allow_blank=False
+    )
+
+    attachments = AttachmentSerializer(many=True, read_only=True)
+    attachment_ids = serializers.ListField(
+        child=serializers.UUIDField(),
+        write_only=True,
+        required=False,
+        max_length=settings.CHAT_MESSAGE_MAX_ATTACHMENTS,
+    )
 
     class Meta:
         model = Message
-        fields = ["id", "chat", "sender", "content", "metadata", "created_at"]
+        fields = [
+            "id",
+            "chat",
+            "sender",
+            "content",
+            "metadata",
+            "client_key",
+            "created_at",
+            "version",
+            "edited_at",
+            "deleted_at",
+            "attachments",
+            "attachment_ids",
+        ]
         # These fields are automatically managed and shouldn't be set via API
-        read_only_fields = ["id", "sender", "created_at"]
+        read_only_fields = [
+            "id",
+            "sender",
+            "created_at",
+            "version",
+            "edited_at",
+            "deleted_at",
+        ]
+        list_serializer_class = ProfileListSerializer
+
+    @staticmethod
+    def user_ids(message):
+        """IDs of the users embedded in a serialized message."""
+        return [message.sender_id]
+
+    def validate_metadata(self, value):
+        """Keep clients from writing the key reserved for enrichment."""
+        if isinstance(value, dict) and Message.ENRICHMENT_KEY in value:
+            raise serializers.ValidationError(
+                f"The {Message.ENRICHMENT_KEY!r} key is reserved"
+            )
+        return value
+
+
+class MessageDeltaSerializer(serializers.ModelSerializer):
+    """
+    Serializer for the changed fields of an edited or deleted message.
+
+    Used for ``message.edited`` and ``message.deleted`` broadcasts, which
+    clients apply to the message they already have.
+    """
+
+    class Meta:
+        model = Message
+        fields = [
+            "id",
+            "chat",
+            "content",
+            "metadata",
+            "version",
+            "edited_at",
+            "deleted_at",
+        ]
+
+
+def member_preview_prefetch():
+    """
+    Build a prefetch that loads a capped participant preview for each chat.
+
+    At most ``CHAT_MEMBER_PREVIEW_SIZE`` memberships per chat are loaded (in
+    one windowed query) into ``chat.member_preview``, so listing large group
+    chats never pulls in every participant.
+
+    Returns:
+        Prefetch: Prefetch object for ``prefetch_related``
+    """
+    return Prefetch(
+        "memberships",
+        queryset=ChatParticipant.objects.order_by("joined_at", "id")[
+            : settings.CHAT_MEMBER_PREVIEW_SIZE
+        ],
+        to_attr="member_preview",
+    )
 
 
 class ChatSerializer(serializers.ModelSerializer):
     """
     Serializer for chat conversations.
     
-    Includes all participants and the most recent message to provide
-    sufficient context for chat list displays.
+    Includes a capped participant preview, the total member count and the
+    most recent message to provide sufficient context for chat list displays.
+    For direct chats the preview always holds both participants.
     """
-    # Include all participants' public information
-    participants = PublicUserSerializer(many=True, read_only=True)
+    # Public information of the first few participants
+    participants = serializers.SerializerMethodField()
     
     # Include the most recent message for preview purposes
     last_message = serializers.SerializerMethodField()
 
     class Meta:
         model = Chat
-        fields = ["id", "participants", "created_at", "updated_at", "last_message"]
+        fields = [
+            "id",
+            "kind",
+            "title",
+            "participants",
+            "member_count",
+            "created_at",
+            "updated_at",
+            "last_activity_at",
+            "last_message",
+        ]
+        list_serializer_class = ProfileListSerializer
+
+    @staticmethod
+    def user_ids(chat):
+        """IDs of the users embedded in a serialized chat."""
+        ids = [m.user_id for m in getattr(chat, "member_preview", ())]
+        if chat.last_message is not None:
+            ids.append(chat.last_message.sender_id)
+        return ids
+
+    def get_participants(self, obj: Chat):
+        """
+        Get a capped preview of the chat's participants.
+        
+        Uses ``member_preview`` when loaded via ``member_preview_prefetch()``
+        and otherwise queries the first participants directly.
+        
+        Args:
+            obj: Chat instance
+            
+        Returns:
+            list: Serialized public data of up to CHAT_MEMBER_PREVIEW_SIZE users
+        """
+        preview = getattr(obj, "member_preview", None)
+        if preview is None:
+            preview = obj.memberships.order_by("joined_at", "id")[
+                : settings.CHAT_MEMBER_PREVIEW_SIZE
+            ]
+        user_ids = [m.user_id for m in preview]
+        profiles = load_profiles(self, user_ids)
+        return [profiles[i] for i in user_ids if i in profiles]
 
     def get_last_message(self, obj: Chat):
         """
         Get the most recent message in this chat.
         
+        Uses the denormalized ``Chat.last_message`` pointer, so callers that
+        ``select_related("last_message")`` render without extra queries.
+        
         Args:
             obj: Chat instance
             
         Returns:
             dict or None: Serialized message data or None if no messages exist
         """
-        # Get the most recent message from this chat
-        m = obj.messages.order_by("-created_at").first()
-        return MessageSerializer(m).data if m else None
+        m = obj.last_message
+        return MessageSerializer(m, context=self.context).data if m else None
+
+
+class ChatMemberSerializer(serializers.ModelSerializer):
+    """
+    Serializer for a chat participant in member listings.
+    
+    Combines the user's public information with their role in the chat.
+    """
+    user = UserProfileField(source="user_id")
+
+    class Meta:
+        model = ChatParticipant
+        fields = ["user", "role", "joined_at"]
+        list_serializer_class = ProfileListSerializer
+
+    @staticmethod
+    def user_ids(membership):
+        """IDs of the users embedded in a serialized membership."""
+        return [membership.user_id]
@@ -1,3 +1,1700 @@
-from django.test import TestCase
+"""
+Tests for the chat application.
 
-# Create your tests here.
+Grouped by feature: inbox ordering, message writes and history reads,
+group chats, real-time delivery (outbox, replay, WebSockets), attachments
+and background jobs (dataset generation, enrichment). Every test starts
+with empty caches (see ``chat_backend.testing``).
+"""
+
+import hashlib
+import json
+import sys
+import tempfile
+import threading
+from datetime import timedelta
+from io import StringIO
+from unittest import mock, skipUnless
+
+from asgiref.sync import async_to_sync, sync_to_async
+from channels.db import database_sync_to_async
+from channels.layers import DEFAULT_CHANNEL_LAYER, channel_layers, get_channel_layer
+from django.conf import settings
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from redis import RedisError
+
+from chat_backend.testing import (
+    CacheTestMixin,
+    WebSocketClient,
+    access_token,
+    api_client,
+    reset_caches,
+)
+from users.models import User
+
+from . import drain, message_cache
+from .attachments import BLOCK_SIZE, write_chunk
+from .management.commands.soak_websockets import Command as SoakCommand
+from .consumers import ChatConsumer, group_name
+from .enrichment import GROUP as ENRICHMENT_GROUP
+from .enrichment import STREAM_KEY, EnrichmentWorker, Processor, get_processors
+from .inbox import InboxIndex, inbox_key, rebuild
+from .models import (
+    Attachment,
+    AttachmentBlob,
+    Chat,
+    ChatParticipant,
+    GroupFull,
+    Message,
+    OutboxEvent,
+)
+from .outbox import OutboxDispatcher, claim_batch, settle_batch
+from .replay import events_since, replay_key
+from .retention import RetentionEngine
+from .utils import get_redis
+
+
+def make_user(name, **extra):
+    """Create a user whose email and nickname derive from ``name``."""
+    return User.objects.create_user(
+        email=f"{name}@example.com",
+        password="password",
+        full_name=name.title(),
+        nickname=name,
+        **extra,
+    )
+
+
+def post_message(client, chat, content, **data):
+    """Send a message through the REST API."""
+    return client.post(
+        reverse("messages", args=[chat.id]),
+        {"chat": chat.id, "content": content, **data},
+        format="json",
+    )
+
+
+class ChatActivityTests(CacheTestMixin, TestCase):
+    """Last-activity tracking and the index-ordered inbox."""
+
+    def setUp(self):
+        super().setUp()
+        self.alice = make_user("alice")
+        self.bob = make_user("bob")
+        self.carol = make_user("carol")
+        self.client = api_client(self.alice)
+        self.with_bob, _ = Chat.get_or_create_1to1(self.alice.id, self.bob.id)
+        self.with_carol, _ = Chat.get_or_create_1to1(self.alice.id, self.carol.id)
+
+    def test_message_bumps_chat_activity(self):
+        before = Chat.objects.get(id=self.with_bob.id).last_activity_at
+
+        response = post_message(self.client, self.with_bob, "hello")
+
+        self.assertEqual(response.status_code, 201)
+        chat = Chat.objects.get(id=self.with_bob.id)
+        self.assertGreater(chat.last_activity_at, before)
+        self.assertEqual(chat.last_message_id, response.data["id"])
+        self.assertEqual(chat.message_count, 1)
+
+    def test_participant_rows_are_coalesced(self):
+        stale = timezone.now() - timedelta(hours=1)
+        ChatParticipant.objects.filter(chat=self.with_bob).update(
+            last_activity_at=stale
+        )
+
+        post_message(self.client, self.with_bob, "first")
+        first = set(
+            ChatParticipant.objects.filter(chat=self.with_bob).values_list(
+                "last_activity_at", flat=True
+            )
+        )
+        post_message(self.client, self.with_bob, "second")
+        second = set(
+            ChatParticipant.objects.filter(chat=self.with_bob).values_list(
+                "last_activity_at", flat=True
+            )
+        )
+
+        # The first message rewrote the stale rows, the second one (within
+        # CHAT_ACTIVITY_COALESCE_SECONDS) left them alone
+        self.assertNotIn(stale, first)
+        self.assertEqual(first, second)
+        chat = Chat.objects.get(id=self.with_bob.id)
+        self.assertGreater(chat.last_activity_at, max(second))
+
+    def test_inbox_lists_most_recent_activity_first(self):
+        post_message(self.client, self.with_bob, "older")
+        post_message(self.client, self.with_carol, "newer")
+
+        response = self.client.get(reverse("list_chats"))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            [chat["id"] for chat in response.data],
+            [self.with_carol.id, self.with_bob.id],
+        )
+
+    def test_inbox_pagination(self):
+        post_message(self.client, self.with_carol, "older")
+        post_message(self.client, self.with_bob, "newer")
+
+        response = self.client.get(reverse("list_chats"), {"page_size": 1})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data["count"], 2)
+        self.assertEqual(
+            [chat["id"] for chat in response.data["results"]], [self.with_bob.id]
+        )
+        self.assertIsNotNone(response.data["next"])
+
+
+class InboxCacheTests(CacheTestMixin, TestCase):
+    """Paginated inbox reads served from the per-user Redis sorted sets."""
+
+    def setUp(self):
+        super().setUp()
+        self.alice = make_user("alice")
+        self.client = api_client(self.alice)
+        self.chats = []
+        for name in ("bob", "carol", "dave"):
+            chat, _ = Chat.get_or_create_1to1(self.alice.id, make_user(name).id)
+            self.chats.append(chat)
+
+    def inbox_page(self, **params):
+        response = self.client.get(reverse("list_chats"), {"page_size": 2, **params})
+        self.assertEqual(response.status_code, 200)
+        return [chat["id"] for chat in response.data["results"]]
+
+    def test_set_is_built_on_first_read_and_follows_activity(self):
+        self.assertEqual(get_redis().zcard(inbox_key(self.alice.id)), 0)
+        self.inbox_page()
+        self.assertEqual(get_redis().zcard(inbox_key(self.alice.id)), 3)
+
+        oldest = self.chats[0]
+        with self.captureOnCommitCallbacks(execute=True):
+            post_message(self.client, oldest, "back on top")
+
+        self.assertEqual(self.inbox_page()[0], oldest.id)
+        self.assertEqual(len(self.inbox_page(page=2)), 1)
+
+    def test_rebuild_command(self):
+        call_command("rebuild_inbox", user_ids=[self.alice.id], stdout=mock.Mock())
+
+        members = get_redis().zrevrange(inbox_key(self.alice.id), 0, -1)
+        self.assertEqual(
+            sorted(int(member) for member in members),
+            sorted(chat.id for chat in self.chats),
+        )
+
+    def test_falls_back_to_postgres_when_redis_is_down(self):
+        expected = self.inbox_page()
+
+        with mock.patch("chat.inbox.get_redis") as redis:
+            redis.return_value.zcard.side_effect = RedisError("down")
+            with self.assertLogs("chat.inbox", "WARNING"):
+                self.assertEqual(self.inbox_page(), expected)
+
+    def test_falls_back_to_postgres_when_redis_fails_mid_request(self):
+        expected = self.inbox_page()
+
+        # The set is opened, then Redis fails while the page is read
+        with mock.patch("chat.inbox.get_redis") as redis:
+            redis.return_value.zcard.return_value = 3
+            redis.return_value.zrevrange.side_effect = RedisError("down")
+            with self.assertLogs("chat.inbox", "WARNING"):
+                self.assertEqual(self.inbox_page(), expected)
+
+
+class InboxRoutingTests(CacheTestMixin, TransactionTestCase):
+    """Inbox reads of memberships outside of a transaction."""
+
+    databases = "__all__"
+
+    def setUp(self):
+        super().setUp()
+        self.alice = make_user("alice")
+        self.chat, _ = Chat.get_or_create_1to1(self.alice.id, make_user("bob").id)
+
+    def inbox_queries(self, queries):
+        """Reads of a user's memberships (not the previews of their chats)."""
+        column = f'"{ChatParticipant._meta.db_table}"."user_id" ='
+        return [q for q in queries if column in q["sql"]]
+
+    def test_rebuild_reads_the_primary(self):
+        with CaptureQueriesContext(connections["replica_1"]) as replica_queries:
+            self.assertEqual(rebuild(self.alice.id), 1)
+
+        self.assertEqual(replica_queries.captured_queries, [])
+
+    def test_redis_fallback_reads_the_primary(self):
+        with mock.patch("chat.inbox.get_redis") as redis:
+            redis.return_value.zrevrange.side_effect = RedisError("down")
+            with CaptureQueriesContext(connections["replica_1"]) as replica_queries:
+                with self.assertLogs("chat.inbox", "WARNING"):
+                    chats = InboxIndex(self.alice.id, 1)[0:1]
+
+        self.assertEqual(chats, [self.chat])
+        self.assertEqual(self.inbox_queries(replica_queries), [])
+
+
+class ConnectionPoolTests(TransactionTestCase):
+    """Connection reuse under a connect storm (``bench_db_connections``)."""
+
+    databases = "__all__"
+
+    @skipUnless(settings.DB_POOL_MODE == "pool", "needs DB_POOL_MODE=pool")
+    def test_concurrent_requests_share_pooled_connections(self):
+        out = StringIO()
+        call_command(
+            "bench_db_connections", worker=True, clients=30, queries=3, stdout=out
+        )
+
+        result = json.loads(out.getvalue())
+        self.assertEqual(result["errors"], 0)
+        # 30 request threads, but never more backends than the pool holds
+        max_size = settings.DATABASES["default"]["OPTIONS"]["pool"]["max_size"]
+        self.assertLessEqual(result["connections"], max_size)
+
+
+class GroupChatTests(CacheTestMixin, TestCase):
+    """Group creation, member management and the capped member preview."""
+
+    def setUp(self):
+        super().setUp()
+        self.owner = make_user("owner")
+        self.members = [make_user(f"member{i}") for i in range(3)]
+        self.client = api_client(self.owner)
+
+    def create_group(self, members):
+        response = self.client.post(
+            reverse("create_group"),
+            {"title": "Team", "member_ids": [user.id for user in members]},
+            format="json",
+        )
+        self.assertEqual(response.status_code, 201)
+        return Chat.objects.get(id=response.data["id"])
+
+    def add_members(self, chat, users, client=None):
+        return (client or self.client).post(
+            reverse("chat_members", args=[chat.id]),
+            {"user_ids": [user.id for user in users]},
+            format="json",
+        )
+
+    def test_create_group(self):
+        chat = self.create_group(self.members)
+
+        self.assertEqual(chat.kind, Chat.Kinds.GROUP)
+        self.assertEqual(chat.member_count, 4)
+        self.assertEqual(
+            ChatParticipant.objects.get(chat=chat, user=self.owner).role,
+            ChatParticipant.Roles.OWNER,
+        )
+
+    @override_settings(CHAT_MEMBER_PREVIEW_SIZE=2)
+    def test_inbox_shows_a_capped_member_preview(self):
+        chat = self.create_group(self.members)
+
+        (entry,) = self.client.get(reverse("list_chats")).data
+
+        self.assertEqual(entry["id"], chat.id)
+        self.assertEqual(entry["member_count"], 4)
+        self.assertEqual(len(entry["participants"]), 2)
+
+    def test_add_members_skips_existing_ones(self):
+        chat = self.create_group(self.members[:1])
+
+        response = self.add_members(chat, self.members)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data["added"], [m.id for m in self.members[1:]])
+        chat.refresh_from_db()
+        self.assertEqual(chat.member_count, 4)
+        self.assertEqual(chat.memberships.count(), 4)
+
+    @override_settings(CHAT_GROUP_MAX_MEMBERS=4)
+    def test_size_limit_counts_only_new_members(self):
+        chat = self.create_group(self.members[:2])
+
+        # Re-adding members of a full group is a no-op, not an error
+        response = self.add_members(chat, self.members)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data["added"], [self.members[2].id])
+
+        response = self.add_members(chat, self.members + [make_user("extra")])
+        self.assertEqual(response.status_code, 400)
+        chat.refresh_from_db()
+        self.assertEqual(chat.member_count, 4)
+
+    @override_settings(CHAT_GROUP_MAX_MEMBERS=3)
+    def test_size_limit_uses_the_current_member_count(self):
+        chat = self.create_group(self.members[:1])
+        stale = Chat.objects.get(id=chat.id)
+        chat.add_members([self.members[1].id])
+
+        with self.assertRaises(GroupFull):
+            stale.add_members([self.members[2].id])
+
+    def test_only_managers_add_members(self):
+        chat = self.create_group(self.members[:1])
+
+        response = self.add_members(
+            chat, self.members[1:], client=api_client(self.members[0])
+        )
+
+        self.assertEqual(response.status_code, 403)
+
+    def test_owner_leaving_hands_the_group_over(self):
+        chat = self.create_group(self.members)
+
+        response = self.client.delete(
+            reverse("remove_chat_member", args=[chat.id, self.owner.id])
+        )
+
+        self.assertEqual(response.status_code, 204)
+        chat.refresh_from_db()
+        self.assertEqual(chat.member_count, 3)
+        self.assertEqual(
+            ChatParticipant.objects.get(chat=chat, role=ChatParticipant.Roles.OWNER)
+            .user_id,
+            self.members[0].id,
+        )
+
+    def test_members_cannot_remove_each_other(self):
+        chat = self.create_group(self.members)
+
+        response = api_client(self.members[0]).delete(
+            reverse("remove_chat_member", args=[chat.id, self.members[1].id])
+        )
+
+        self.assertEqual(response.status_code, 403)
+
+
+class RecordingChannelLayer:
+    """Channel layer stand-in recording ``group_send`` calls."""
+
+    def __init__(self, failing_groups=()):
+        self.sent = []
+        self.failing_groups = set(failing_groups)
+
+    async def group_send(self, group, message):
+        if group in self.failing_groups:
+            raise ConnectionError("channel layer unavailable")
+        self.sent.append((group, message))
+
+
+class OutboxTests(CacheTestMixin, TransactionTestCase):
+    """Broadcasts queued with their data and delivered by the dispatcher."""
+
+    databases = "__all__"
+
+    def setUp(self):
+        super().setUp()
+        self.alice = make_user("alice")
+        self.bob = make_user("bob")
+        self.chat, _ = Chat.get_or_create_1to1(self.alice.id, self.bob.id)
+        self.other, _ = Chat.get_or_create_1to1(self.alice.id, make_user("carol").id)
+
+    def enqueue(self, chat, **payload):
+        with transaction.atomic():
+            return OutboxEvent.enqueue(chat.id, {"type": "chat.test", **payload})
+
+    def dispatch(self, layer):
+        return async_to_sync(OutboxDispatcher(layer).dispatch_batch)()
+
+    def test_message_and_its_event_commit_together(self):
+        response = post_message(api_client(self.alice), self.chat, "hello")
+
+        event = OutboxEvent.objects.get()
+        self.assertEqual(event.chat_id, self.chat.id)
+        self.assertEqual(event.payload["type"], "chat.message")
+        self.assertEqual(event.payload["message"]["id"], response.data["id"])
+        self.assertEqual(event.payload["seq"], response.data["version"])
+
+    def test_events_are_claimed_in_order_per_chat(self):
+        first = self.enqueue(self.chat, n=1)
+        second = self.enqueue(self.chat, n=2)
+
+        self.assertEqual([row[0] for row in claim_batch(1)], [first.id])
+        # The second event waits while the first one is leased
+        self.assertEqual(claim_batch(10), [])
+
+        settle_batch([first.id], {}, [], [])
+        self.assertEqual([row[0] for row in claim_batch(10)], [second.id])
+
+    def test_partitions_split_chats(self):
+        self.enqueue(self.chat)
+        self.enqueue(self.other)
+
+        partition = self.chat.id % 2
+        claimed = [row[1] for row in claim_batch(10, partition, partitions=2)]
+
+        self.assertIn(self.chat.id, claimed)
+        self.assertTrue(all(chat_id % 2 == partition for chat_id in claimed))
+
+    def test_dispatcher_delivers_and_deletes_events(self):
+        self.enqueue(self.chat, n=1)
+        self.enqueue(self.chat, n=2)
+        layer = RecordingChannelLayer()
+
+        self.assertEqual(self.dispatch(layer), 2)
+
+        self.assertEqual(
+            [(group, message["n"]) for group, message in layer.sent],
+            [(f"chat_{self.chat.id}", 1), (f"chat_{self.chat.id}", 2)],
+        )
+        self.assertFalse(OutboxEvent.objects.exists())
+
+    def test_failed_send_is_retried_without_being_overtaken(self):
+        first = self.enqueue(self.chat, n=1)
+        second = self.enqueue(self.chat, n=2)
+        self.enqueue(self.other, n=3)
+        layer = RecordingChannelLayer(failing_groups=[f"chat_{self.chat.id}"])
+
+        with self.assertLogs("chat.outbox", "WARNING"):
+            self.dispatch(layer)
+
+        # Other chats are unaffected
+        self.assertEqual([message["n"] for _, message in layer.sent], [3])
+        first.refresh_from_db()
+        second.refresh_from_db()
+        self.assertEqual(first.attempts, 1)
+        self.assertGreater(first.available_at, timezone.now())
+        # The later event was released without counting an attempt
+        self.assertEqual(second.attempts, 0)
+        self.assertEqual(claim_batch(10), [])
+
+        OutboxEvent.objects.update(available_at=timezone.now())
+        layer.failing_groups.clear()
+        self.dispatch(layer)
+        self.assertEqual([message["n"] for _, message in layer.sent], [3, 1, 2])
+
+    @override_settings(CHAT_OUTBOX_MAX_ATTEMPTS=1)
+    def test_event_is_dropped_after_its_last_attempt(self):
+        self.enqueue(self.chat)
+        layer = RecordingChannelLayer(failing_groups=[f"chat_{self.chat.id}"])
+
+        with self.assertLogs("chat.outbox", "ERROR"):
+            self.dispatch(layer)
+
+        self.assertFalse(OutboxEvent.objects.exists())
+
+
+async def open_socket(user, chat, query="", subprotocols=()):
+    """Connect ``user`` to a chat's WebSocket and check it was accepted."""
+    params = f"token={await database_sync_to_async(access_token)(user)}"
+    socket = WebSocketClient(
+        f"/ws/chats/{chat.id}/",
+        f"{params}&{query}" if query else params,
+        subprotocols,
+    )
+    message = await socket.connect()
+    if message["type"] != "websocket.accept":
+        raise AssertionError(f"Connection refused: {message}")
+    return socket
+
+
+class ReplayTests(CacheTestMixin, TransactionTestCase):
+    """Per-chat sequence numbers and resuming sessions from the buffer."""
+
+    databases = "__all__"
+
+    def setUp(self):
+        super().setUp()
+        self.alice = make_user("alice")
+        self.bob = make_user("bob")
+        self.chat, _ = Chat.get_or_create_1to1(self.alice.id, self.bob.id)
+
+    def broadcast(self, *contents):
+        """Send messages and run the outbox, which fills the replay buffer."""
+        client = api_client(self.alice)
+        seqs = [
+            post_message(client, self.chat, text).data["version"]
+            for text in contents
+        ]
+        async_to_sync(OutboxDispatcher(RecordingChannelLayer()).dispatch_batch)()
+        return seqs
+
+    def test_sequence_numbers_are_consecutive_per_chat(self):
+        self.assertEqual(self.broadcast("one", "two", "three"), [1, 2, 3])
+
+    def test_events_since_returns_the_gap(self):
+        self.broadcast("one", "two", "three")
+
+        events = events_since(self.chat.id, 1)
+
+        self.assertEqual([event["seq"] for event in events], [2, 3])
+        self.assertEqual(events[0]["message"]["content"], "two")
+        self.assertEqual(events_since(self.chat.id, 3), [])
+
+    @override_settings(CHAT_REPLAY_BUFFER_SIZE=2)
+    def test_trimmed_gap_requires_a_resync(self):
+        self.broadcast("one", "two", "three")
+
+        self.assertIsNone(events_since(self.chat.id, 0))
+        self.assertEqual(len(events_since(self.chat.id, 1)), 2)
+
+    def test_expired_buffer_replays_only_an_empty_gap(self):
+        self.broadcast("one", "two")
+        get_redis().delete(replay_key(self.chat.id))
+
+        self.assertEqual(events_since(self.chat.id, 2), [])
+        self.assertIsNone(events_since(self.chat.id, 1))
+
+    def test_redis_failure_requires_a_resync(self):
+        with mock.patch("chat.replay.get_redis") as redis:
+            redis.return_value.pipeline.return_value.execute.side_effect = (
+                RedisError("down")
+            )
+            with self.assertLogs("chat.replay", "WARNING"):
+                self.assertIsNone(events_since(self.chat.id, 0))
+
+    async def test_resume_replays_missed_events(self):
+        await database_sync_to_async(self.broadcast)("one", "two", "three")
+
+        socket = await open_socket(self.bob, self.chat, "last_seq=1")
+        frames = [await socket.receive_json() for _ in range(3)]
+        await socket.disconnect()
+
+        self.assertEqual(
+            [(frame["type"], frame.get("seq")) for frame in frames],
+            [("message", 2), ("message", 3), ("resumed", None)],
+        )
+        self.assertEqual(frames[2]["data"], {"seq": 3})
+
+    async def test_resume_without_the_gap_asks_for_a_resync(self):
+        await database_sync_to_async(self.broadcast)("one", "two")
+        await sync_to_async(get_redis().delete)(replay_key(self.chat.id))
+
+        socket = await open_socket(self.bob, self.chat, "last_seq=0")
+        frame = await socket.receive_json()
+        await socket.disconnect()
+
+        self.assertEqual(frame, {"type": "resync"})
+
+
+class MessageCacheTests(CacheTestMixin, TestCase):
+    """First history pages served from the recent-message cache."""
+
+    def setUp(self):
+        super().setUp()
+        self.alice = make_user("alice")
+        self.bob = make_user("bob")
+        self.client = api_client(self.alice)
+        self.chat, _ = Chat.get_or_create_1to1(self.alice.id, self.bob.id)
+        with self.captureOnCommitCallbacks(execute=True):
+            for text in ("one", "two"):
+                post_message(self.client, self.chat, text)
+
+    def history(self, **params):
+        response = self.client.get(reverse("messages", args=[self.chat.id]), params)
+        self.assertEqual(response.status_code, 200)
+        return [message["content"] for message in response.data["results"]]
+
+    def test_first_page_is_cached(self):
+        self.assertEqual(self.history(), ["one", "two"])
+        # A change that is not broadcast does not reach the cache
+        Message.objects.filter(chat=self.chat).update(content="changed")
+
+        self.assertEqual(self.history(), ["one", "two"])
+        self.assertEqual(self.history(page=2, page_size=1), ["changed"])
+
+    def test_new_messages_are_appended(self):
+        self.history()
+        Message.objects.filter(chat=self.chat).update(content="changed")
+
+        with self.captureOnCommitCallbacks(execute=True):
+            post_message(self.client, self.chat, "three")
+
+        # Appended to the cached page rather than refilled
+        self.assertEqual(self.history(), ["one", "two", "three"])
+
+    def test_stale_entries_are_refilled(self):
+        self.history()
+        with transaction.atomic():
+            Message.objects.filter(chat=self.chat).update(content="changed")
+            Chat.next_seq(self.chat.id)
+
+        self.assertEqual(self.history(), ["changed", "changed"])
+
+    def test_redis_tier_is_shared_between_processes(self):
+        self.history()
+        Message.objects.filter(chat=self.chat).update(content="changed")
+        # Another process starts with an empty local tier
+        message_cache._local.clear()
+
+        self.assertEqual(self.history(), ["one", "two"])
+
+    def test_senders_reflect_profile_changes(self):
+        self.history()
+        Message.objects.filter(chat=self.chat).update(content="changed")
+        self.alice.full_name = "Alice Liddell"
+        self.alice.save()
+
+        # Both tiers keep the page, with the sender as saved since
+        for tier in ("local", "redis"):
+            with self.subTest(tier=tier):
+                if tier == "redis":
+                    message_cache._local.clear()
+                url = reverse("messages", args=[self.chat.id])
+                results = self.client.get(url).data["results"]
+                self.assertEqual(
+                    [message["content"] for message in results], ["one", "two"]
+                )
+                self.assertEqual(results[0]["sender"]["full_name"], "Alice Liddell")
+                self.assertNotIn("sender_id", results[0])
+
+
+class MessageCacheRoutingTests(CacheTestMixin, TransactionTestCase):
+    """Cache refills outside of a transaction."""
+
+    databases = "__all__"
+
+    def test_refill_reads_the_primary(self):
+        chat, _ = Chat.get_or_create_1to1(make_user("alice").id, make_user("bob").id)
+
+        with CaptureQueriesContext(connections["replica_1"]) as replica_queries:
+            message_cache.recent_messages(chat)
+
+        self.assertEqual(len(replica_queries), 0)
+
+
+class IdempotencyTests(CacheTestMixin, TestCase):
+    """Retried message submissions carrying a ``client_key``."""
+
+    def setUp(self):
+        super().setUp()
+        self.alice = make_user("alice")
+        self.bob = make_user("bob")
+        self.chat, _ = Chat.get_or_create_1to1(self.alice.id, self.bob.id)
+        self.client = api_client(self.alice)
+
+    def test_retry_returns_the_original_message(self):
+        first = post_message(self.client, self.chat, "hi", client_key="k1")
+        retry = post_message(self.client, self.chat, "hi", client_key="k1")
+
+        self.assertEqual(first.status_code, 201)
+        self.assertEqual(retry.data["id"], first.data["id"])
+        self.assertEqual(Message.objects.count(), 1)
+        self.assertEqual(OutboxEvent.objects.count(), 1)
+
+    def test_retry_after_the_dedup_entry_expired(self):
+        first = post_message(self.client, self.chat, "hi", client_key="k1")
+        reset_caches()
+
+        retry = post_message(self.client, self.chat, "hi", client_key="k1")
+
+        # Caught by the message_client_key_uniq constraint
+        self.assertEqual(retry.data["id"], first.data["id"])
+        self.assertEqual(Message.objects.count(), 1)
+
+    def test_keys_are_scoped_to_the_sender(self):
+        post_message(self.client, self.chat, "hi", client_key="k1")
+        post_message(api_client(self.bob), self.chat, "hi", client_key="k1")
+
+        self.assertEqual(Message.objects.count(), 2)
+
+    def test_blank_key_is_rejected(self):
+        response = post_message(self.client, self.chat, "hi", client_key="")
+
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("client_key", response.data)
+        self.assertFalse(Message.objects.exists())
+
+    def test_messages_without_a_key_are_never_merged(self):
+        post_message(self.client, self.chat, "hi")
+        post_message(self.client, self.chat, "hi", client_key=None)
+
+        self.assertEqual(Message.objects.count(), 2)
+
+
+class IdempotentSocketTests(CacheTestMixin, TransactionTestCase):
+    """Retried ``message.send`` frames."""
+
+    databases = "__all__"
+
+    async def test_resent_frame_is_stored_once(self):
+        alice = await database_sync_to_async(make_user)("alice")
+        bob = await database_sync_to_async(make_user)("bob")
+        chat, _ = await database_sync_to_async(Chat.get_or_create_1to1)(
+            alice.id, bob.id
+        )
+        frame = {"type": "message.send", "content": "hi", "client_key": "k1"}
+
+        socket = await open_socket(alice, chat)
+        for payload in (frame, frame, {**frame, "client_key": ""}):
+            await socket.send_json(payload)
+        await socket.disconnect()
+
+        count = await Message.objects.filter(chat=chat).acount()
+        self.assertEqual(count, 1)
+
+
+class TypingTests(CacheTestMixin, TransactionTestCase):
+    """Throttled, never stored typing notifications."""
+
+    databases = "__all__"
+
+    def setUp(self):
+        super().setUp()
+        self.alice = make_user("alice")
+        self.bob = make_user("bob")
+        self.chat, _ = Chat.get_or_create_1to1(self.alice.id, self.bob.id)
+
+    async def test_typing_is_announced_once_per_interval(self):
+        bob = await open_socket(self.bob, self.chat)
+        # Two devices of the same user, each typing twice
+        phone = await open_socket(self.alice, self.chat)
+        laptop = await open_socket(self.alice, self.chat)
+        for socket in (phone, phone, laptop, laptop):
+            await socket.send_json({"type": "typing"})
+
+        frame = await bob.receive_json()
+        self.assertTrue(await bob.receive_nothing(0.2))
+        # The typing user is not told about themselves
+        self.assertTrue(await phone.receive_nothing(0.1))
+        for socket in (bob, phone, laptop):
+            await socket.disconnect()
+
+        self.assertEqual(
+            frame,
+            {
+                "type": "typing",
+                "data": {
+                    "user_id": self.alice.id,
+                    "expires_in": settings.CHAT_TYPING_TTL_SECONDS,
+                },
+            },
+        )
+        self.assertFalse(await Message.objects.aexists())
+
+    @override_settings(CHAT_TYPING_INTERVAL_SECONDS=0)
+    async def test_typing_is_announced_again_after_the_interval(self):
+        bob = await open_socket(self.bob, self.chat)
+        alice = await open_socket(self.alice, self.chat)
+
+        await alice.send_json({"type": "typing"})
+        await bob.receive_json()
+        await alice.send_json({"type": "typing"})
+        frame = await bob.receive_json()
+        for socket in (bob, alice):
+            await socket.disconnect()
+
+        self.assertEqual(frame["type"], "typing")
+
+
+class BatchingTests(CacheTestMixin, TransactionTestCase):
+    """Frames batched for WebSocket clients that opt in."""
+
+    databases = "__all__"
+
+    def setUp(self):
+        super().setUp()
+        self.alice = make_user("alice")
+        self.bob = make_user("bob")
+        self.chat, _ = Chat.get_or_create_1to1(self.alice.id, self.bob.id)
+
+    async def burst(self, count, **event):
+        """Broadcast ``count`` message events, then ``event`` if given."""
+        layer = get_channel_layer()
+        for seq in range(1, count + 1):
+            await layer.group_send(
+                group_name(self.chat.id),
+                {"type": "chat.message", "seq": seq, "message": {"id": seq}},
+            )
+        if event:
+            await layer.group_send(group_name(self.chat.id), event)
+
+    async def open_batching_socket(self):
+        socket = WebSocketClient(
+            f"/ws/chats/{self.chat.id}/",
+            f"token={await database_sync_to_async(access_token)(self.bob)}",
+            [ChatConsumer.BATCH_SUBPROTOCOL],
+        )
+        accept = await socket.connect()
+        self.assertEqual(accept["subprotocol"], ChatConsumer.BATCH_SUBPROTOCOL)
+        return socket
+
+    async def test_frames_are_sent_one_by_one_by_default(self):
+        socket = await open_socket(self.bob, self.chat)
+        await self.burst(3)
+        frames = [await socket.receive_json() for _ in range(3)]
+        await socket.disconnect()
+
+        self.assertEqual([frame["seq"] for frame in frames], [1, 2, 3])
+        self.assertEqual(frames[0], {"type": "message", "data": {"id": 1}, "seq": 1})
+
+    async def test_burst_arrives_as_one_frame_in_order(self):
+        socket = await self.open_batching_socket()
+        await self.burst(5)
+        frame = await socket.receive_json()
+        self.assertTrue(await socket.receive_nothing(0.1))
+        await socket.disconnect()
+
+        self.assertEqual(frame["type"], "batch")
+        self.assertEqual([inner["seq"] for inner in frame["data"]], [1, 2, 3, 4, 5])
+        self.assertEqual(frame["data"][0]["data"], {"id": 1})
+
+    @override_settings(CHAT_WS_BATCH_MAX_FRAMES=3)
+    async def test_full_batches_are_sent_without_waiting(self):
+        socket = await self.open_batching_socket()
+        await self.burst(7)
+        frames = [await socket.receive_json() for _ in range(3)]
+        await socket.disconnect()
+
+        self.assertEqual(
+            [[inner["seq"] for inner in frame["data"]] for frame in frames],
+            [[1, 2, 3], [4, 5, 6], [7]],
+        )
+
+    async def test_held_frames_are_sent_before_a_close(self):
+        socket = await self.open_batching_socket()
+        # Removing bob closes his connection right after the last frame
+        await self.burst(2, type="chat.member_removed", seq=3, user_id=self.bob.id)
+        frame = await socket.receive_json()
+        code = await socket.receive_close()
+        await socket.disconnect()
+
+        self.assertEqual(
+            [inner["type"] for inner in frame["data"]],
+            ["message", "message", "member.removed"],
+        )
+        self.assertEqual(code, 4403)
+
+
+class MetadataFilterTests(CacheTestMixin, TestCase):
+    """History reads filtered on message metadata."""
+
+    def setUp(self):
+        super().setUp()
+        alice = make_user("alice")
+        self.chat, _ = Chat.get_or_create_1to1(alice.id, make_user("bob").id)
+        self.client = api_client(alice)
+        post_message(self.client, self.chat, "plain")
+        post_message(self.client, self.chat, "pinned", metadata={"pinned": True})
+        post_message(
+            self.client, self.chat, "tagged", metadata={"tag": "a", "pinned": False}
+        )
+
+    def history(self, params):
+        return self.client.get(reverse("messages", args=[self.chat.id]), params)
+
+    def contents(self, params):
+        response = self.history(params)
+        self.assertEqual(response.status_code, 200)
+        return [message["content"] for message in response.data["results"]]
+
+    def test_containment(self):
+        self.assertEqual(self.contents({"metadata": '{"pinned": true}'}), ["pinned"])
+
+    def test_key_existence(self):
+        self.assertEqual(
+            self.contents({"metadata_has": "pinned"}), ["pinned", "tagged"]
+        )
+        self.assertEqual(
+            self.contents({"metadata_has": ["pinned", "tag"]}), ["tagged"]
+        )
+
+    def test_filters_bypass_the_message_cache(self):
+        self.contents({})
+
+        self.assertEqual(self.contents({"metadata_has": "tag"}), ["tagged"])
+
+    def test_value_must_be_a_json_object(self):
+        for value in ("[1]", "not json"):
+            self.assertEqual(self.history({"metadata": value}).status_code, 400)
+
+
+class GenerateDatasetTests(TestCase):
+    """The COPY-based synthetic dataset generator, run small."""
+
+    def generate(self, **options):
+        options = {"users": 40, "chats": 30, "messages": 0, "seed": 1, **options}
+        call_command("generate_dataset", tag="test", stdout=StringIO(), **options)
+
+    def test_users_chats_and_memberships(self):
+        self.generate(group_ratio=0.5)
+
+        users = User.objects.filter(email__endswith="@test.example.invalid")
+        self.assertEqual(users.count(), 40)
+        self.assertTrue(users.first().check_password("password"))
+        self.assertEqual(Chat.objects.count(), 30)
+        for chat in Chat.objects.all():
+            self.assertEqual(chat.memberships.count(), chat.member_count)
+            if chat.kind == Chat.Kinds.DIRECT:
+                self.assertEqual(chat.member_count, 2)
+                self.assertIsNotNone(chat.pair_key)
+            else:
+                self.assertGreaterEqual(chat.member_count, 2)
+                self.assertEqual(
+                    chat.memberships.get(role=ChatParticipant.Roles.OWNER).user_id,
+                    chat.created_by_id,
+                )
+
+    def test_same_tag_is_refused(self):
+        self.generate()
+
+        with self.assertRaises(CommandError):
+            self.generate()
+
+    def test_messages(self):
+        self.generate(messages=400)
+
+        self.assertGreater(Message.objects.count(), 0)
+        for chat in Chat.objects.all():
+            versions = list(
+                chat.messages.order_by("created_at", "id").values_list(
+                    "version", flat=True
+                )
+            )
+            # Numbered like messages sent through the API
+            self.assertEqual(versions, list(range(1, chat.message_count + 1)))
+            self.assertEqual(chat.last_seq, chat.message_count)
+            if versions:
+                self.assertEqual(
+                    chat.last_message_id, chat.messages.latest("created_at", "id").id
+                )
+
+
+class MessageChangeTests(CacheTestMixin, TestCase):
+    """Edits, tombstones and syncing changes since a version."""
+
+    def setUp(self):
+        super().setUp()
+        self.alice = make_user("alice")
+        self.bob = make_user("bob")
+        self.chat, _ = Chat.get_or_create_1to1(self.alice.id, self.bob.id)
+        self.client = api_client(self.alice)
+        self.first = post_message(self.client, self.chat, "first").data
+        self.second = post_message(self.client, self.chat, "second").data
+
+    def detail_url(self, message):
+        return reverse("message_detail", args=[self.chat.id, message["id"]])
+
+    def changes_since(self, version, **params):
+        response = self.client.get(
+            reverse("messages", args=[self.chat.id]),
+            {"since_version": version, **params},
+        )
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def test_edit(self):
+        response = self.client.patch(
+            self.detail_url(self.first), {"content": "edited"}, format="json"
+        )
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data["content"], "edited")
+        self.assertEqual(response.data["version"], 3)
+        self.assertIsNotNone(response.data["edited_at"])
+        event = OutboxEvent.objects.latest("id")
+        self.assertEqual(event.payload["type"], "chat.message_edited")
+        self.assertEqual(event.payload["message"]["content"], "edited")
+        self.assertNotIn("sender", event.payload["message"])
+
+    def test_only_the_sender_edits(self):
+        response = api_client(self.bob).patch(
+            self.detail_url(self.first), {"content": "edited"}, format="json"
+        )
+
+        self.assertEqual(response.status_code, 403)
+
+    def test_delete_leaves_a_tombstone(self):
+        response = self.client.delete(self.detail_url(self.second))
+
+        self.assertEqual(response.status_code, 204)
+        message = Message.objects.get(id=self.second["id"])
+        self.assertEqual(message.content, "")
+        self.assertIsNotNone(message.deleted_at)
+        # The chat preview falls back to the newest remaining message
+        self.assertEqual(
+            Chat.objects.get(id=self.chat.id).last_message_id, self.first["id"]
+        )
+        response = self.client.delete(self.detail_url(self.second))
+        self.assertEqual(response.status_code, 404)
+
+    def test_sync_returns_only_changes(self):
+        self.client.patch(
+            self.detail_url(self.first), {"content": "edited"}, format="json"
+        )
+        self.client.delete(self.detail_url(self.second))
+
+        data = self.changes_since(2)
+
+        self.assertEqual(
+            [(m["id"], m["content"], m["version"]) for m in data["results"]],
+            [(self.first["id"], "edited", 3), (self.second["id"], "", 4)],
+        )
+        self.assertEqual(data["version"], 4)
+        self.assertFalse(data["has_more"])
+        self.assertEqual(self.changes_since(4)["results"], [])
+
+    def test_sync_pages(self):
+        data = self.changes_since(0, page_size=1)
+
+        self.assertEqual([m["id"] for m in data["results"]], [self.first["id"]])
+        self.assertTrue(data["has_more"])
+        self.assertEqual(data["version"], 1)
+
+
+class AttachmentTests(CacheTestMixin, TestCase):
+    """Resumable uploads, deduplicated storage and range downloads."""
+
+    content = bytes(range(256)) * 40
+
+    def setUp(self):
+        super().setUp()
+        root = tempfile.TemporaryDirectory()
+        self.addCleanup(root.cleanup)
+        self.enterContext(override_settings(ATTACHMENT_ROOT=root.name))
+        self.alice = make_user("alice")
+        self.bob = make_user("bob")
+        self.chat, _ = Chat.get_or_create_1to1(self.alice.id, self.bob.id)
+        self.client = api_client(self.alice)
+
+    def start(self, content=None, **data):
+        content = self.content if content is None else content
+        response = self.client.post(
+            reverse("attachments"),
+            {"filename": "data.bin", "size": len(content), **data},
+            format="json",
+        )
+        self.assertEqual(response.status_code, 201)
+        return response.data["id"]
+
+    def send_chunk(self, attachment_id, offset, chunk):
+        return self.client.generic(
+            "PATCH",
+            reverse("attachment_detail", args=[attachment_id]),
+            chunk,
+            content_type="application/offset+octet-stream",
+            HTTP_UPLOAD_OFFSET=str(offset),
+        )
+
+    def upload(self, content=None, **data):
+        content = self.content if content is None else content
+        attachment_id = self.start(content, **data)
+        response = self.send_chunk(attachment_id, 0, content)
+        self.assertEqual(response.status_code, 200)
+        return attachment_id
+
+    def download(self, attachment_id, client=None, **headers):
+        response = (client or self.client).get(
+            reverse("attachment_content", args=[attachment_id]), **headers
+        )
+        body = b""
+        if response.status_code in (200, 206):
+            # Reading the whole stream closes the response (and the file)
+            body = b"".join(response.streaming_content)
+        return response, body
+
+    def test_chunked_upload_resumes_from_the_offset(self):
+        attachment_id = self.start()
+
+        response = self.send_chunk(attachment_id, 0, self.content[:4000])
+        self.assertEqual(response.data["received"], 4000)
+        # The client lost track and asks where to resume
+        response = self.client.get(reverse("attachment_detail", args=[attachment_id]))
+        self.assertEqual(response["Upload-Offset"], "4000")
+        response = self.send_chunk(attachment_id, 4000, self.content[4000:])
+
+        self.assertTrue(response.data["complete"])
+        digest = hashlib.sha256(self.content).hexdigest()
+        self.assertEqual(response.data["sha256"], digest)
+        self.assertEqual(self.download(attachment_id)[1], self.content)
+
+    def test_chunk_at_the_wrong_offset_conflicts(self):
+        attachment_id = self.start()
+        self.send_chunk(attachment_id, 0, self.content[:4000])
+
+        response = self.send_chunk(attachment_id, 2000, self.content[2000:6000])
+
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.data["received"], 4000)
+
+    @override_settings(ATTACHMENT_CHUNK_MAX_SIZE=1024)
+    def test_chunk_size_is_limited(self):
+        attachment_id = self.start()
+
+        response = self.send_chunk(attachment_id, 0, self.content[:2048])
+
+        self.assertEqual(response.status_code, 413)
+
+    def test_digest_mismatch_restarts_the_upload(self):
+        attachment_id = self.start(sha256="0" * 64)
+
+        response = self.send_chunk(attachment_id, 0, self.content)
+
+        self.assertEqual(response.status_code, 400)
+        attachment = Attachment.objects.get(id=attachment_id)
+        self.assertEqual(attachment.received, 0)
+        self.assertIsNone(attachment.blob_id)
+
+    def test_identical_files_share_a_blob(self):
+        first = Attachment.objects.get(id=self.upload())
+        second = Attachment.objects.get(id=self.upload())
+
+        self.assertNotEqual(first.id, second.id)
+        self.assertEqual(first.blob_id, second.blob_id)
+        self.assertEqual(AttachmentBlob.objects.count(), 1)
+
+    def test_participants_download_sent_attachments(self):
+        attachment_id = self.upload()
+        bob, stranger = api_client(self.bob), api_client(make_user("mallory"))
+        # Not sent yet, so only the uploader sees it
+        self.assertEqual(self.download(attachment_id, bob)[0].status_code, 404)
+
+        response = post_message(
+            self.client, self.chat, "file", attachment_ids=[attachment_id]
+        )
+
+        self.assertEqual(response.data["attachments"][0]["id"], attachment_id)
+        self.assertEqual(self.download(attachment_id, bob)[1], self.content)
+        self.assertEqual(self.download(attachment_id, stranger)[0].status_code, 404)
+
+    def test_range_requests(self):
+        attachment_id = self.upload()
+        etag = self.download(attachment_id)[0]["ETag"]
+
+        response, body = self.download(attachment_id, HTTP_RANGE="bytes=100-199")
+        self.assertEqual(response.status_code, 206)
+        size = len(self.content)
+        self.assertEqual(response["Content-Range"], f"bytes 100-199/{size}")
+        self.assertEqual(body, self.content[100:200])
+
+        response, body = self.download(attachment_id, HTTP_RANGE="bytes=-10")
+        self.assertEqual(body, self.content[-10:])
+
+        # A stale If-Range validator gets the whole file
+        response, body = self.download(
+            attachment_id, HTTP_RANGE="bytes=0-9", HTTP_IF_RANGE='"stale"'
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(body, self.content)
+        response, body = self.download(
+            attachment_id, HTTP_RANGE="bytes=0-9", HTTP_IF_RANGE=etag
+        )
+        self.assertEqual(response.status_code, 206)
+
+    def test_unsatisfiable_range(self):
+        attachment_id = self.upload()
+
+        response, _ = self.download(
+            attachment_id, HTTP_RANGE=f"bytes={len(self.content)}-"
+        )
+
+        self.assertEqual(response.status_code, 416)
+        self.assertEqual(response["Content-Range"], f"bytes */{len(self.content)}")
+
+    def test_revalidation(self):
+        attachment_id = self.upload()
+        etag = self.download(attachment_id)[0]["ETag"]
+
+        response, _ = self.download(attachment_id, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(response.status_code, 304)
+
+
+class UploadConnectionTests(CacheTestMixin, TransactionTestCase):
+    """Uploads waiting on their clients without holding connections."""
+
+    databases = "__all__"
+
+    @skipUnless(settings.DB_POOL_MODE == "pool", "needs DB_POOL_MODE=pool")
+    def test_stalled_uploads_leave_connections_to_other_requests(self):
+        root = tempfile.TemporaryDirectory()
+        self.addCleanup(root.cleanup)
+        self.enterContext(override_settings(ATTACHMENT_ROOT=root.name))
+        alice = make_user("alice")
+        size = 2 * BLOCK_SIZE
+        # One stalled upload per connection in the pool
+        pool_size = settings.DATABASES["default"]["OPTIONS"]["pool"]["max_size"]
+        attachments = [
+            Attachment.objects.create(uploader=alice, filename="a.bin", size=size)
+            for _ in range(pool_size)
+        ]
+        connections.close_all()
+        stalled = threading.Semaphore(0)
+        resume = threading.Event()
+
+        class StalledBody:
+            """Request body whose client pauses after its first block."""
+
+            blocks = 0
+
+            def read(self, size):
+                self.blocks += 1
+                if self.blocks == 2:
+                    stalled.release()
+                    resume.wait(30)
+                return b"x" * size
+
+        def run(fn, *args):
+            try:
+                fn(*args)
+            finally:
+                connections.close_all()
+
+        uploads = [
+            threading.Thread(
+                target=run, args=(write_chunk, a.id, 0, StalledBody(), size)
+            )
+            for a in attachments
+        ]
+        for thread in uploads:
+            thread.start()
+        for _ in uploads:
+            self.assertTrue(stalled.acquire(timeout=10))
+
+        # Another request, on the primary whose pool the uploads share
+        counts = []
+        users = User.objects.using(DEFAULT_DB_ALIAS)
+        request = threading.Thread(
+            target=run, args=(lambda: counts.append(users.count()),)
+        )
+        request.start()
+        request.join(5)
+        served = not request.is_alive()
+        resume.set()
+        for thread in (*uploads, request):
+            thread.join()
+
+        self.assertTrue(served)
+        self.assertEqual(counts, [1])
+        self.assertEqual(
+            set(Attachment.objects.values_list("received", flat=True)), {size}
+        )
+
+
+class FailingProcessor(Processor):
+    """Enrichment processor that always fails."""
+
+    key = "broken"
+
+    def process(self, message):
+        raise RuntimeError("processor failed")
+
+
+class EnrichmentTests(CacheTestMixin, TransactionTestCase):
+    """Background enrichment fed by the outbox and stored on messages."""
+
+    databases = "__all__"
+
+    def setUp(self):
+        super().setUp()
+        self.alice = make_user("alice")
+        self.bob = make_user("bob")
+        self.chat, _ = Chat.get_or_create_1to1(self.alice.id, self.bob.id)
+        self.client = api_client(self.alice)
+
+    def send(self, content, **data):
+        """Send a message and let the outbox queue it for enrichment."""
+        response = post_message(self.client, self.chat, content, **data)
+        self.assertEqual(response.status_code, 201)
+        async_to_sync(OutboxDispatcher(RecordingChannelLayer()).dispatch_batch)()
+        return response.data
+
+    def run_worker(self, worker=None):
+        """Process everything queued, like one round of ``enrich_messages``."""
+        worker = worker or EnrichmentWorker(processors=get_processors())
+        self.addCleanup(worker.executor.shutdown)
+        worker.ensure_group()
+        worker.retry_pending()
+        for _, batch in worker.redis.xreadgroup(
+            ENRICHMENT_GROUP, worker.consumer, {STREAM_KEY: ">"}, count=100
+        ):
+            worker.process_entries(batch)
+        return worker
+
+    def pending(self, worker):
+        return worker.redis.xpending(STREAM_KEY, ENRICHMENT_GROUP)["pending"]
+
+    def test_results_are_stored_under_the_reserved_key(self):
+        sent = self.send(
+            "hi @bob, see https://example.com/a.", metadata={"mentions": "mine"}
+        )
+
+        self.run_worker()
+
+        message = Message.objects.get(id=sent["id"])
+        self.assertEqual(
+            message.metadata,
+            {
+                # The client's own keys are left alone
+                "mentions": "mine",
+                "enrichment": {
+                    "mentions": [self.bob.id],
+                    "links": [
+                        {"url": "https://example.com/a", "domain": "example.com"}
+                    ],
+                },
+            },
+        )
+        event = OutboxEvent.objects.get(payload__type="chat.message_enriched")
+        self.assertEqual(event.payload["message"]["version"], message.version)
+        self.assertEqual(
+            event.payload["message"]["enrichment"], message.metadata["enrichment"]
+        )
+
+    def test_unchanged_results_are_not_rewritten(self):
+        sent = self.send("no enrichment here")
+
+        self.run_worker()
+
+        self.assertEqual(Message.objects.get(id=sent["id"]).metadata, {})
+        self.assertFalse(
+            OutboxEvent.objects.filter(payload__type="chat.message_enriched").exists()
+        )
+
+    def test_edits_keep_results_until_enriched_again(self):
+        sent = self.send("hi @bob")
+        self.run_worker()
+        url = reverse("message_detail", args=[self.chat.id, sent["id"]])
+
+        response = self.client.patch(
+            url, {"content": "hi all", "metadata": {"tag": "x"}}, format="json"
+        )
+        self.assertEqual(
+            response.data["metadata"],
+            {"tag": "x", "enrichment": {"mentions": [self.bob.id]}},
+        )
+
+        async_to_sync(OutboxDispatcher(RecordingChannelLayer()).dispatch_batch)()
+        self.run_worker()
+        self.assertEqual(Message.objects.get(id=sent["id"]).metadata, {"tag": "x"})
+
+    def test_clients_cannot_write_the_reserved_key(self):
+        response = post_message(
+            self.client, self.chat, "hi", metadata={"enrichment": {"flags": []}}
+        )
+        self.assertEqual(response.status_code, 400)
+
+        sent = self.send("hi")
+        response = self.client.patch(
+            reverse("message_detail", args=[self.chat.id, sent["id"]]),
+            {"content": "hi", "metadata": {"enrichment": {}}},
+            format="json",
+        )
+        self.assertEqual(response.status_code, 400)
+
+    async def test_socket_frames_cannot_write_the_reserved_key(self):
+        socket = await open_socket(self.alice, self.chat)
+        await socket.send_json(
+            {"type": "message.send", "content": "hi", "metadata": {"enrichment": {}}}
+        )
+        await socket.disconnect()
+
+        self.assertFalse(await Message.objects.aexists())
+
+    def test_messages_are_read_from_the_primary(self):
+        self.send("see https://example.com")
+
+        with CaptureQueriesContext(connections["replica_1"]) as replica_queries:
+            self.run_worker()
+
+        message_table = Message._meta.db_table
+        self.assertFalse(
+            [q for q in replica_queries if f'FROM "{message_table}"' in q["sql"]]
+        )
+        self.assertIn("enrichment", Message.objects.get().metadata)
+
+    @override_settings(
+        CHAT_ENRICHMENT_RETRY_SECONDS=0, CHAT_ENRICHMENT_MAX_ATTEMPTS=2
+    )
+    def test_failed_entries_are_retried_then_dropped(self):
+        sent = self.send("see https://example.com")
+        processors = (*get_processors(), FailingProcessor())
+        worker = EnrichmentWorker(processors=processors)
+
+        with self.assertLogs("chat.enrichment", "WARNING"):
+            self.run_worker(worker)
+        # Results of the processors that worked are stored anyway
+        message = Message.objects.get(id=sent["id"])
+        self.assertIn("links", message.metadata["enrichment"])
+        self.assertEqual(self.pending(worker), 1)
+
+        with self.assertLogs("chat.enrichment", "WARNING"):
+            self.run_worker(worker)  # second delivery
+        with self.assertLogs("chat.enrichment", "ERROR"):
+            self.run_worker(worker)
+        self.assertEqual(self.pending(worker), 0)
+
+
+class RetentionTests(CacheTestMixin, TestCase):
+    """Batched purges of messages past their chat's retention."""
+
+    def setUp(self):
+        super().setUp()
+        self.alice = make_user("alice")
+        self.bob = make_user("bob")
+        self.client = api_client(self.alice)
+        self.chat, _ = Chat.get_or_create_1to1(self.alice.id, self.bob.id)
+        with self.captureOnCommitCallbacks(execute=True):
+            for text in ("old 1", "old 2", "old 3", "old 4", "old 5", "new"):
+                post_message(self.client, self.chat, text)
+        Message.objects.filter(content__startswith="old").update(
+            created_at=timezone.now() - timedelta(days=40)
+        )
+
+    def purge(self, days=30, **options):
+        engine = RetentionEngine(default_days=days, batch_size=2, pause=0, **options)
+        return engine.run(chat_ids=[self.chat.id])
+
+    def purge_events(self):
+        return OutboxEvent.objects.filter(payload__type="chat.messages_purged")
+
+    def test_expired_messages_are_deleted_in_batches(self):
+        self.assertEqual(self.purge(), 5)
+
+        self.assertEqual(
+            list(Message.objects.values_list("content", flat=True)), ["new"]
+        )
+        self.chat.refresh_from_db()
+        self.assertEqual(self.chat.message_count, 1)
+        # One event per batch, each in the transaction that deleted rows
+        self.assertEqual(self.purge_events().count(), 3)
+
+    def test_chat_retention_overrides_the_default(self):
+        self.chat.retention_days = 60
+        self.chat.save()
+        self.assertEqual(self.purge(), 0)
+
+        self.chat.retention_days = None
+        self.chat.save()
+        self.assertEqual(self.purge(days=0), 0)
+        self.assertFalse(self.purge_events().exists())
+
+    def test_interrupted_run_has_announced_its_batches(self):
+        with mock.patch("chat.retention.time.sleep", side_effect=KeyboardInterrupt):
+            with self.assertRaises(KeyboardInterrupt):
+                self.purge()
+
+        # The first batch is committed and announced; nothing else ran
+        self.assertEqual(Message.objects.count(), 4)
+        self.assertEqual(self.purge_events().count(), 1)
+
+    def test_cached_history_drops_purged_messages(self):
+        url = reverse("messages", args=[self.chat.id])
+        self.assertEqual(len(self.client.get(url).data["results"]), 6)
+
+        self.purge()
+
+        results = self.client.get(url).data["results"]
+        self.assertEqual([message["content"] for message in results], ["new"])
+
+    def test_command(self):
+        out = StringIO()
+        call_command(
+            "purge_messages", "--chat", self.chat.id, "--days", "30", stdout=out
+        )
+
+        self.assertEqual(Message.objects.count(), 1)
+        self.assertIn("Deleted 5 messages", out.getvalue())
+
+
+class AdminTests(CacheTestMixin, TestCase):
+    """Chat and message admins, and the soft-delete action."""
+
+    def setUp(self):
+        super().setUp()
+        self.alice = make_user("alice")
+        self.bob = make_user("bob")
+        self.chat, _ = Chat.get_or_create_1to1(self.alice.id, self.bob.id)
+        self.group = Chat.create_group(
+            self.alice.id, "Release planning", [self.bob.id]
+        )
+        post_message(api_client(self.alice), self.chat, "hi")
+        self.message = Message.objects.get()
+        self.client.force_login(
+            User.objects.create_superuser(email="staff@example.com", password="pw")
+        )
+
+    def changelist(self, model, **params):
+        response = self.client.get(reverse(f"admin:chat_{model}_changelist"), params)
+        self.assertEqual(response.status_code, 200)
+        return list(response.context["cl"].result_list)
+
+    def test_chat_search(self):
+        self.assertEqual(self.changelist("chat", q=self.chat.id), [self.chat])
+        self.assertEqual(self.changelist("chat", q="release"), [self.group])
+        # Prefix search, served by chat_title_prefix_idx
+        self.assertEqual(self.changelist("chat", q="planning"), [])
+
+    def test_message_list_is_filtered_by_chat(self):
+        self.assertEqual(
+            self.changelist("message", chat__id__exact=self.chat.id), [self.message]
+        )
+        self.assertEqual(self.changelist("message", chat__id__exact=self.group.id), [])
+        self.assertEqual(self.changelist("message", q="hi"), [])
+
+    def test_messages_are_soft_deleted(self):
+        url = reverse("admin:chat_message_changelist")
+        action_form = self.client.get(url).context["action_form"]
+        actions = dict(action_form.fields["action"].choices)
+        # Hard deletes would skip counters, tombstones and broadcasts
+        self.assertNotIn("delete_selected", actions)
+
+        response = self.client.post(
+            url, {"action": "soft_delete", "_selected_action": [self.message.id]}
+        )
+
+        self.assertEqual(response.status_code, 302)
+        self.message.refresh_from_db()
+        self.assertIsNotNone(self.message.deleted_at)
+        self.assertTrue(
+            OutboxEvent.objects.filter(payload__type="chat.message_deleted").exists()
+        )
+
+
+class DrainTests(CacheTestMixin, TransactionTestCase):
+    """Gradual closing of WebSocket connections before a deploy."""
+
+    databases = "__all__"
+
+    def setUp(self):
+        super().setUp()
+        self.addCleanup(self.reset_drain)
+        self.alice = make_user("alice")
+        self.bob = make_user("bob")
+        self.chat, _ = Chat.get_or_create_1to1(self.alice.id, self.bob.id)
+
+    @staticmethod
+    def reset_drain():
+        """Forget this process's drain, which cannot be cancelled otherwise."""
+        for task in (drain._watcher, drain._drain_task):
+            if task is not None:
+                task.cancel()
+        drain._draining = False
+        drain._connections.clear()
+        drain._watcher = drain._drain_task = None
+
+    async def assert_drained(self, socket):
+        frame = await socket.receive_json()
+        self.assertEqual(frame["type"], "reconnect")
+        self.assertLessEqual(
+            frame["data"]["after_ms"], settings.CHAT_DRAIN_RECONNECT_SPREAD_MS
+        )
+        self.assertEqual(await socket.receive_close(), 1012)
+
+    async def test_connections_are_closed_with_a_reconnect_frame(self):
+        sockets = [
+            await open_socket(self.alice, self.chat),
+            await open_socket(self.bob, self.chat),
+        ]
+
+        with self.assertLogs("chat.drain", "INFO"):
+            self.assertTrue(drain.start_drain(window=0))
+            self.assertFalse(drain.start_drain(window=0))
+            for socket in sockets:
+                await self.assert_drained(socket)
+            await drain._drain_task
+        for socket in sockets:
+            await socket.disconnect()
+        self.assertEqual(drain._connections, set())
+
+    async def test_new_connections_are_refused(self):
+        drain._draining = True
+        token = await database_sync_to_async(access_token)(self.alice)
+        socket = WebSocketClient(f"/ws/chats/{self.chat.id}/", f"token={token}")
+
+        message = await socket.connect()
+        await socket.disconnect()
+
+        self.assertEqual(message["type"], "websocket.close")
+
+    @override_settings(CHAT_DRAIN_POLL_SECONDS=0)
+    async def test_drain_request_reaches_older_processes(self):
+        socket = await open_socket(self.alice, self.chat)
+
+        with self.assertLogs("chat.drain", "INFO"):
+            await sync_to_async(drain.request_drain)(1)
+            await self.assert_drained(socket)
+        await socket.disconnect()
+
+    def test_endpoint(self):
+        url = reverse("drain")
+        admin = make_user("admin", role=User.Roles.ADMIN)
+
+        response = api_client(self.alice).post(url, {}, format="json")
+        self.assertEqual(response.status_code, 403)
+        response = api_client(admin).post(url, {"window_seconds": -1}, format="json")
+        self.assertEqual(response.status_code, 400)
+        self.assertIsNone(cache.get(drain.DRAIN_KEY))
+
+        response = api_client(admin).post(url, {"window_seconds": 10}, format="json")
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(cache.get(drain.DRAIN_KEY)["window"], 10)
+
+
+class IdleConnectionTests(CacheTestMixin, TransactionTestCase):
+    """Compact state of idle connections, and the soak harness measuring it."""
+
+    databases = "__all__"
+
+    def setUp(self):
+        super().setUp()
+        self.alice = make_user("alice", role=User.Roles.ADMIN)
+        self.bob = make_user("bob")
+        self.chat, _ = Chat.get_or_create_1to1(self.alice.id, self.bob.id)
+
+    async def test_consumers_keep_only_ids_and_shared_strings(self):
+        sockets = [
+            await open_socket(self.alice, self.chat),
+            await open_socket(self.bob, self.chat),
+        ]
+        consumers = sorted(drain._connections, key=lambda c: c.user_id)
+        for socket in sockets:
+            await socket.disconnect()
+
+        alice, bob = consumers
+        self.assertEqual((alice.user_id, bob.user_id), (self.alice.id, self.bob.id))
+        self.assertNotIn("user", vars(alice))
+        self.assertIs(alice.role, sys.intern("admin"))
+        self.assertIs(bob.role, sys.intern("user"))
+        self.assertIs(alice.group_name, bob.group_name)
+
+    async def test_demoted_admin_loses_admin_frames(self):
+        # Token issued while alice was an admin
+        token = await database_sync_to_async(access_token)(self.alice)
+        self.alice.role = User.Roles.USER
+        await self.alice.asave()
+        socket = WebSocketClient(f"/ws/chats/{self.chat.id}/", f"token={token}")
+        await socket.connect()
+
+        await socket.send_json(
+            {"type": "message.send", "content": "hi", "profile": True}
+        )
+        self.assertTrue(await socket.receive_nothing(0.3))
+        await socket.disconnect()
+
+        self.assertTrue(await Message.objects.aexists())
+
+    def test_soak_worker(self):
+        command = SoakCommand()
+        user, chat_ids = command._setup(2)
+        # The worker installs a layer of its own
+        layer = channel_layers.backends.get(DEFAULT_CHANNEL_LAYER)
+        self.addCleanup(channel_layers.set, DEFAULT_CHANNEL_LAYER, layer)
+        out = StringIO()
+
+        call_command(
+            "soak_websockets",
+            worker="consumer",
+            user=user.id,
+            chat_ids=",".join(map(str, chat_ids)),
+            connections=20,
+            concurrency=10,
+            stdout=out,
+        )
+
+        result = json.loads(out.getvalue())
+        self.assertEqual(result["connections"], 20)
+        self.assertIn("rss_per_connection", result)
@@ -3,8 +3,15 @@ URL routing configuration for chat application REST API endpoints.
 
 Defines the URL patterns for HTTP-based chat functionality:
 - POST /start/ - Start a new chat with another user
+- POST /groups/ - Create a group chat
 - GET /chats/ - List all chats for the authenticated user  
 - GET/POST /chats/<id>/messages/ - Retrieve or send messages in a specific chat
+- PATCH/DELETE /chats/<id>/messages/<message_id>/ - Edit or delete a message
+- GET/POST /chats/<id>/members/ - List or add chat members
+- DELETE /chats/<id>/members/<user_id>/ - Remove a member from a group chat
+- POST /attachments/ - Start an attachment upload
+- GET/PATCH /attachments/<id>/ - Check on an upload or send its next chunk
+- GET /attachments/<id>/content/ - Download an attachment (supports Range)
 """
 
 from django.urls import path
@@ -13,6 +20,9 @@ from . import views
 urlpatterns = [
     # Endpoint to initiate a new chat conversation with another user
     path("start/", views.start_chat, name="start_chat"),
+
+    # Endpoint to create a group chat
+    path("groups/", views.create_group, name="create_group"),
     
     # Endpoint to list all chats for the current user
     path("chats/", views.list_chats, name="list_chats"),
@@ -20,4 +30,35 @@ urlpatterns = [
     # Endpoint to handle messages within a specific chat
     # Supports both retrieving messages (GET) and sending new messages (POST)
     path("chats/<int:chat_id>/messages/", views.messages_view, name="messages"),
+
+    # Endpoint to edit (PATCH) or delete (DELETE) a message
+    path(
+        "chats/<int:chat_id>/messages/<int:message_id>/",
+        views.message_detail,
+        name="message_detail",
+    ),
+
+    # Endpoints to list, add and remove chat members
+    path("chats/<int:chat_id>/members/", views.chat_members, name="chat_members"),
+    path(
+        "chats/<int:chat_id>/members/<int:user_id>/",
+        views.remove_chat_member,
+        name="remove_chat_member",
+    ),
+
+    # Endpoints to upload attachments in chunks and download them
+    path("attachments/", views.attachments_view, name="attachments"),
+    path(
+        "attachments/<uuid:attachment_id>/",
+        views.attachment_detail,
+        name="attachment_detail",
+    ),
+    path(
+        "attachments/<uuid:attachment_id>/content/",
+        views.attachment_content,
+        name="attachment_content",
+    ),
+
+    # Endpoint to drain WebSocket connections before a deploy (admins)
+    path("drain/", views.drain_view, name="drain"),
 ]
@@ -2,10 +2,15 @@
 Utility functions for chat application.
 
 This module contains helper functions used throughout the chat system
-for common operations like generating unique identifiers.
+for common operations like generating unique identifiers and reaching the
+shared Redis instance.
 """
 
 import hashlib
+from functools import lru_cache
+
+import redis
+from django.conf import settings
 
 
 def pair_key_for_users(a_id: int, b_id: int) -> str:
@@ -32,3 +37,17 @@ def pair_key_for_users(a_id: int, b_id: int) -> str:
     
     # Generate a deterministic hash from the sorted pair
     return hashlib.sha256(f"pair:{x}:{y}".encode()).hexdigest()
+
+
+@lru_cache(maxsize=None)
+def get_redis() -> redis.Redis:
+    """
+    Return a process-wide Redis client for ``settings.REDIS_URL``.
+
+    The client keeps its own connection pool, so a single instance is
+    shared by every caller in the process.
+
+    Returns:
+        redis.Redis: Synchronous Redis client
+    """
+    return redis.Redis.from_url(settings.REDIS_URL)
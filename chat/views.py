@@ -3,26 +3,74 @@ API views for chat functionality.
 
 This module provides REST API endpoints for:
 - Starting new chat conversations
+- Creating group chats and managing their members
 - Listing user's chats
 - Retrieving and sending messages within a chat
+- Editing and deleting messages
+- Uploading attachments in resumable chunks and downloading them
+- Draining WebSocket connections before a deploy (admins)
 """
 
+import re
+
+from django.conf import settings
+from django.db import transaction
+from django.http import FileResponse, HttpResponse, StreamingHttpResponse
 from django.shortcuts import get_object_or_404
-from django.db.models import Prefetch
+from django.utils.http import content_disposition_header, parse_etags
+from django.db.models import Prefetch, Q, prefetch_related_objects
 from django.contrib.auth import get_user_model
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 from rest_framework import status
+from rest_framework.utils.urls import replace_query_param
+
+from chat_backend.json_filters import json_filter
+from users.permissions import IsAdmin
 
-from .models import Chat, Message
-from .serializers import ChatSerializer, MessageSerializer
+from .attachments import (
+    UploadConflict,
+    blob_path,
+    iter_range,
+    parse_range,
+    write_chunk,
+)
+from .drain import request_drain
+from .inbox import open_inbox
+from .message_cache import recent_messages
+from .models import (
+    Attachment,
+    Chat,
+    ChatParticipant,
+    GroupFull,
+    Message,
+    OutboxEvent,
+)
+from .pagination import DefaultPagination
+from .serializers import (
+    AttachmentSerializer,
+    ChatMemberSerializer,
+    ChatSerializer,
+    MessageSerializer,
+    member_preview_prefetch,
+)
 from .utils import pair_key_for_users
 
 # Get the user model configured in Django settings
 User = get_user_model()
 
 
+def _parse_user_ids(value):
+    """Return a list of ints from a list of user IDs, or None if invalid."""
+    if not isinstance(value, list):
+        return None
+    try:
+        return [int(v) for v in value]
+    except (TypeError, ValueError):
+        return None
+
+
 @api_view(["POST"])
 @permission_classes([IsAuthenticated])
 def start_chat(request):
@@ -63,6 +111,44 @@ def start_chat(request):
     )
 
 
+@api_view(["POST"])
+@permission_classes([IsAuthenticated])
+def create_group(request):
+    """
+    API endpoint to create a group chat.
+    
+    The authenticated user becomes the owner of the new group.
+    
+    Expected POST data:
+        - title: Display name of the group (required)
+        - member_ids: List of user IDs to add besides the creator
+        
+    Returns:
+        - 201: Group created
+        - 400: Invalid request (missing title, bad IDs, too many members)
+        - 404: One of the users was not found
+    """
+    title = (request.data.get("title") or "").strip()
+    if not title:
+        return Response({"detail": "title is required"}, status=400)
+
+    member_ids = _parse_user_ids(request.data.get("member_ids", []))
+    if member_ids is None:
+        return Response({"detail": "member_ids must be a list of IDs"}, status=400)
+
+    member_ids = set(member_ids) - {request.user.id}
+    if len(member_ids) + 1 > settings.CHAT_GROUP_MAX_MEMBERS:
+        return Response({"detail": "Too many members for a group"}, status=400)
+
+    # Ensure every member exists (one query for the whole list)
+    found = User.objects.filter(id__in=member_ids).count()
+    if found != len(member_ids):
+        return Response({"detail": "User not found"}, status=404)
+
+    chat = Chat.create_group(request.user.id, title, sorted(member_ids))
+    return Response(ChatSerializer(chat).data, status=status.HTTP_201_CREATED)
+
+
 @api_view(["GET"])
 @permission_classes([IsAuthenticated])
 def list_chats(request):
@@ -70,19 +156,53 @@ def list_chats(request):
     API endpoint to list all chats for the authenticated user.
     
     Returns all chat conversations where the user is a participant,
-    ordered by most recently updated first.
+    ordered by most recent activity first. The ordering is read from the
+    user's membership rows via the inbox index. Passing ``page`` or
+    ``page_size`` switches to a paginated response that is served from the
+    user's Redis inbox set when available.
+
+    Membership rows are bumped at most once per
+    ``CHAT_ACTIVITY_COALESCE_SECONDS`` (see ``Chat.record_activity``), so
+    when read from Postgres, chats active within that window of each other
+    may be listed out of the order of their returned ``last_activity_at``.
+    
+    GET Parameters:
+        - page: Page number (optional, enables pagination)
+        - page_size: Number of chats per page (optional, enables pagination)
     
     Returns:
         - 200: List of user's chats with participants and last message
     """
-    # Get all chats where the user is a participant
-    chats = Chat.objects.filter(participants=request.user).prefetch_related(
-        "participants"
+    # Walk the user's memberships in inbox order (chat_participant_inbox_idx)
+    memberships = (
+        ChatParticipant.objects.filter(user_id=request.user.id)
+        .select_related("chat__last_message")
+        .order_by("-last_activity_at", "-chat_id")
     )
-    
-    # Serialize the chats ordered by most recent activity
-    data = ChatSerializer(chats.order_by("-updated_at"), many=True).data
 
+    # Paginate only when the client asks for it, to keep the old response shape
+    paginator = None
+    if "page" in request.query_params or "page_size" in request.query_params:
+        paginator = DefaultPagination()
+
+        # Prefer the Redis inbox index; it falls back to Postgres when cold
+        inbox = open_inbox(request.user.id)
+        if inbox is not None:
+            chats = paginator.paginate_queryset(inbox, request)
+            return paginator.get_paginated_response(
+                ChatSerializer(chats, many=True).data
+            )
+
+        memberships = paginator.paginate_queryset(memberships, request)
+
+    chats = [m.chat for m in memberships]
+    prefetch_related_objects(
+        chats, member_preview_prefetch(), "last_message__attachments"
+    )
+    data = ChatSerializer(chats, many=True).data
+
+    if paginator is not None:
+        return paginator.get_paginated_response(data)
     return Response(data)
 
 
@@ -100,10 +220,29 @@ def messages_view(request, chat_id: int):
         
     GET Parameters:
         - page_size: Number of messages per page (default: 25)
+        - after: Message ID; return up to ``page_size`` messages sent after
+          it (oldest first) as ``{"results": [...], "has_more": bool}``
+          instead of a page
+        - metadata: JSON object; only messages whose metadata contains it
+        - metadata_has: Top-level metadata key the messages must have
+          (repeatable)
+        - since_version: Version watermark; return up to ``page_size``
+          messages created, edited or deleted after it (oldest change
+          first) as ``{"results": [...], "has_more": bool, "version": int}``,
+          where ``version`` is the watermark for the next call
+        
+    The first page and short ``after`` reads of recent messages are served
+    from the chat's recent-message cache when it is current and no metadata
+    filter is given. Metadata filters use the ``message_meta_gin`` index.
         
     POST Data:
         - content: Message content (required)
-        - metadata: Optional JSON metadata
+        - metadata: Optional JSON metadata (the ``enrichment`` key is
+          reserved for enrichment results)
+        - client_key: Optional idempotency key (max 64 characters); retries
+          with the same key return the original message
+        - attachment_ids: Optional IDs of completed uploads of the sender's
+          (see ``attachments_view``) to attach to the message
         
     Returns:
         GET - 200: Paginated list of messages
@@ -116,7 +255,7 @@ def messages_view(request, chat_id: int):
     chat = get_object_or_404(Chat, id=chat_id)
 
     # Verify the user is a participant in this chat
-    if not chat.participants.filter(id=request.user.id).exists():
+    if not Chat.has_participant(chat.id, request.user.id):
         return Response({"detail": "Not a participant"}, status=403)
 
     if request.method == "POST":
@@ -124,42 +263,75 @@ def messages_view(request, chat_id: int):
         serializer = MessageSerializer(data=request.data)
 
         if serializer.is_valid():
-            # Create the new message
-            msg = Message.objects.create(
-                chat=chat,
-                sender=request.user,
-                content=serializer.validated_data["content"],
-                metadata=serializer.validated_data.get("metadata", {}),
-            )
-            
-            # Update chat's updated_at timestamp for proper ordering
-            Chat.objects.filter(id=chat.id).update()
+            # Create the new message, bump the chat's activity and queue the
+            # broadcast to connected WebSocket clients (sent by the outbox
+            # dispatcher, so Redis latency never delays this response)
+            try:
+                msg = Message.objects.create_message(
+                    chat_id=chat.id,
+                    sender=request.user,
+                    content=serializer.validated_data["content"],
+                    metadata=serializer.validated_data.get("metadata", {}),
+                    client_key=serializer.validated_data.get("client_key"),
+                    attachment_ids=serializer.validated_data.get("attachment_ids"),
+                )
+            except ValueError as e:
+                return Response({"detail": str(e)}, status=400)
 
-            # Broadcast the new message to all connected WebSocket clients
-            from asgiref.sync import async_to_sync
-            from channels.layers import get_channel_layer
+            return Response(MessageSerializer(msg).data, status=201)
+        return Response(serializer.errors, status=400)
+
+    page_size = int(request.query_params.get("page_size", 25))
+    try:
+        filters = json_filter(request.query_params, "metadata", "metadata")
+    except ValueError as e:
+        return Response({"detail": str(e)}, status=400)
 
-            channel_layer = get_channel_layer()
-            async_to_sync(channel_layer.group_send)(
-                f"chat_{chat.id}",
+    since_version = request.query_params.get("since_version")
+    if since_version is not None:
+        return _messages_since_version(chat, since_version, page_size, filters)
+
+    after = request.query_params.get("after")
+    if after is not None:
+        return _messages_after(request, chat, after, page_size, filters)
+
+    # The newest page is served from the recent-message cache when it holds
+    # enough messages
+    page = request.query_params.get("page", "1")
+    if (
+        not filters
+        and page == "1"
+        and 0 < page_size <= settings.CHAT_MESSAGE_CACHE_SIZE
+    ):
+        recent = recent_messages(chat)
+        if len(recent) >= min(page_size, chat.message_count):
+            next_url = None
+            if chat.message_count > page_size:
+                next_url = replace_query_param(
+                    request.build_absolute_uri(), "page", 2
+                )
+            return Response(
                 {
-                    "type": "chat.message",
-                    "message": MessageSerializer(msg).data,
-                },
+                    "count": chat.message_count,
+                    "next": next_url,
+                    "previous": None,
+                    "results": recent[-page_size:],
+                }
             )
 
-            return Response(MessageSerializer(msg).data, status=201)
-        return Response(serializer.errors, status=400)
-
     # Handle GET request - retrieve paginated messages
-    # Get messages ordered by newest first, with sender information
-    qs = chat.messages.select_related("sender").order_by("-created_at")
+    # Get messages ordered by newest first (senders come from the profile cache)
+    qs = (
+        chat.messages.prefetch_related("attachments")
+        .filter(filters)
+        .order_by("-created_at")
+    )
 
     # Set up pagination
     from rest_framework.pagination import PageNumberPagination
 
     paginator = PageNumberPagination()
-    paginator.page_size = int(request.query_params.get("page_size", 25))
+    paginator.page_size = page_size
 
     # Get the requested page of messages
     result_page = paginator.paginate_queryset(qs, request)
@@ -168,3 +340,520 @@ def messages_view(request, chat_id: int):
     # Reverse the order so oldest messages appear first in the response
     data = list(reversed(data))
     return paginator.get_paginated_response(data)
+
+
+def _messages_after(request, chat, after, limit, filters):
+    """
+    Respond with the messages of a chat sent after the message ``after``.
+
+    Reads from the recent-message cache when the cursor is in it (and no
+    metadata filter applies), and from the database otherwise.
+    """
+    try:
+        after = int(after)
+    except ValueError:
+        return Response({"detail": "after must be a message ID"}, status=400)
+
+    recent = [] if filters else recent_messages(chat)
+    for index, message in enumerate(recent):
+        if message["id"] == after:
+            newer = recent[index + 1 :]
+            return Response(
+                {"results": newer[:limit], "has_more": len(newer) > limit}
+            )
+
+    cursor = (
+        chat.messages.filter(id=after).values_list("created_at", flat=True).first()
+    )
+    if cursor is None:
+        return Response({"detail": "Message not found"}, status=404)
+
+    rows = list(
+        chat.messages.prefetch_related("attachments")
+        .filter(filters)
+        .filter(Q(created_at__gt=cursor) | Q(created_at=cursor, id__gt=after))
+        .order_by("created_at", "id")[: limit + 1]
+    )
+    return Response(
+        {
+            "results": MessageSerializer(rows[:limit], many=True).data,
+            "has_more": len(rows) > limit,
+        }
+    )
+
+
+def _messages_since_version(chat, since_version, limit, filters):
+    """
+    Respond with the messages of a chat changed after a version watermark.
+
+    Reads the ``message_chat_version_idx`` index. Deleted messages come back
+    as tombstones. The returned ``version`` is the highest one included, so
+    changes committed while paging are picked up by the next call.
+    """
+    try:
+        since_version = int(since_version)
+    except ValueError:
+        return Response({"detail": "since_version must be an integer"}, status=400)
+
+    rows = list(
+        chat.messages.prefetch_related("attachments")
+        .filter(filters)
+        .filter(version__gt=since_version)
+        .order_by("version")[: limit + 1]
+    )
+    results = rows[:limit]
+    return Response(
+        {
+            "results": MessageSerializer(results, many=True).data,
+            "has_more": len(rows) > limit,
+            "version": results[-1].version if results else since_version,
+        }
+    )
+
+
+@api_view(["PATCH", "DELETE"])
+@permission_classes([IsAuthenticated])
+def message_detail(request, chat_id: int, message_id: int):
+    """
+    API endpoint to edit or delete a message.
+    
+    PATCH: Replace the message's content (and optionally its metadata);
+    only the sender may edit.
+    DELETE: Soft-delete the message, leaving a tombstone; allowed for the
+    sender and for owners and admins of a group.
+    
+    Both bump the message's ``version`` and broadcast a ``message.edited``
+    or ``message.deleted`` delta to the chat's WebSocket clients.
+    
+    Args:
+        chat_id: ID of the chat
+        message_id: ID of the message
+        
+    PATCH Data:
+        - content: New message content (required)
+        - metadata: New JSON metadata (optional, kept when omitted; the
+          ``enrichment`` key is reserved)
+        
+    Returns:
+        PATCH - 200: Edited message data
+        DELETE - 204: Message deleted
+        - 400: Invalid request data
+        - 403: Not allowed to change this message
+        - 404: Chat or message not found, or message already deleted
+    """
+    message = get_object_or_404(
+        Message.objects.only("id", "chat_id", "sender_id", "deleted_at"),
+        id=message_id,
+        chat_id=chat_id,
+        deleted_at__isnull=True,
+    )
+    membership = (
+        ChatParticipant.objects.filter(chat_id=chat_id, user_id=request.user.id)
+        .values_list("role", flat=True)
+        .first()
+    )
+    if membership is None:
+        return Response({"detail": "Not a participant"}, status=403)
+
+    is_sender = message.sender_id == request.user.id
+    if request.method == "DELETE":
+        if not is_sender and membership == ChatParticipant.Roles.MEMBER:
+            return Response(
+                {"detail": "Not allowed to delete this message"}, status=403
+            )
+        if Message.objects.delete_message(message.id) is None:
+            return Response({"detail": "Message not found"}, status=404)
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+    if not is_sender:
+        return Response({"detail": "Only the sender can edit a message"}, status=403)
+
+    content = request.data.get("content")
+    if not isinstance(content, str) or not content.strip():
+        return Response({"detail": "content is required"}, status=400)
+    metadata = request.data.get("metadata")
+    if metadata is not None and not isinstance(metadata, dict):
+        return Response({"detail": "metadata must be a JSON object"}, status=400)
+    if metadata is not None and Message.ENRICHMENT_KEY in metadata:
+        return Response(
+            {"detail": f"The {Message.ENRICHMENT_KEY!r} metadata key is reserved"},
+            status=400,
+        )
+
+    msg = Message.objects.edit_message(message.id, content.strip(), metadata)
+    if msg is None:
+        return Response({"detail": "Message not found"}, status=404)
+    return Response(MessageSerializer(msg).data)
+
+
+@api_view(["GET", "POST"])
+@permission_classes([IsAuthenticated])
+def chat_members(request, chat_id: int):
+    """
+    API endpoint to list or add the members of a chat.
+    
+    GET: Paginated list of members with their roles (any participant)
+    POST: Add users to a group chat (group owners and admins only)
+    
+    Args:
+        chat_id: ID of the chat
+        
+    GET Parameters:
+        - page / page_size: Pagination controls
+        
+    POST Data:
+        - user_ids: List of user IDs to add
+        
+    Returns:
+        GET - 200: Paginated list of members
+        POST - 200: IDs of the users that were added
+        - 400: Invalid request (not a group, bad IDs, group full)
+        - 403: User not a participant, or not allowed to manage members
+        - 404: Chat or user not found
+    """
+    chat = get_object_or_404(Chat, id=chat_id)
+
+    membership = ChatParticipant.objects.filter(
+        chat_id=chat.id, user_id=request.user.id
+    ).first()
+    if membership is None:
+        return Response({"detail": "Not a participant"}, status=403)
+
+    if request.method == "GET":
+        paginator = DefaultPagination()
+        members = paginator.paginate_queryset(
+            chat.memberships.order_by("joined_at", "id"),
+            request,
+        )
+        return paginator.get_paginated_response(
+            ChatMemberSerializer(members, many=True).data
+        )
+
+    if chat.kind != Chat.Kinds.GROUP:
+        return Response({"detail": "Members can only be added to groups"}, status=400)
+    if not membership.can_manage:
+        return Response({"detail": "Not allowed to manage members"}, status=403)
+
+    user_ids = _parse_user_ids(request.data.get("user_ids"))
+    if not user_ids:
+        return Response({"detail": "user_ids must be a non-empty list"}, status=400)
+
+    user_ids = set(user_ids)
+    if User.objects.filter(id__in=user_ids).count() != len(user_ids):
+        return Response({"detail": "User not found"}, status=404)
+
+    # Membership change and its broadcast commit together
+    try:
+        with transaction.atomic():
+            added = chat.add_members(sorted(user_ids))
+            if added:
+                OutboxEvent.enqueue(
+                    chat.id, {"type": "chat.members_added", "user_ids": added}
+                )
+    except GroupFull as e:
+        return Response({"detail": str(e)}, status=400)
+    return Response({"added": added})
+
+
+@api_view(["DELETE"])
+@permission_classes([IsAuthenticated])
+def remove_chat_member(request, chat_id: int, user_id: int):
+    """
+    API endpoint to remove a member from a group chat.
+    
+    Members can always remove themselves (leave the group). Removing someone
+    else requires the owner or admin role, and only the owner can remove an
+    admin. Open WebSocket connections of the removed user are closed.
+    
+    Args:
+        chat_id: ID of the group chat
+        user_id: ID of the member to remove
+        
+    Returns:
+        - 204: Member removed
+        - 400: Chat is not a group
+        - 403: Not allowed to remove this member
+        - 404: Chat not found or user not a member
+    """
+    chat = get_object_or_404(Chat, id=chat_id)
+    if chat.kind != Chat.Kinds.GROUP:
+        return Response(
+            {"detail": "Members can only be removed from groups"}, status=400
+        )
+
+    roles = dict(
+        ChatParticipant.objects.filter(
+            chat_id=chat.id, user_id__in=[request.user.id, user_id]
+        ).values_list("user_id", "role")
+    )
+    if request.user.id not in roles:
+        return Response({"detail": "Not a participant"}, status=403)
+    if user_id not in roles:
+        return Response({"detail": "Not a member"}, status=404)
+
+    if user_id != request.user.id:
+        actor, target = roles[request.user.id], roles[user_id]
+        if actor == ChatParticipant.Roles.MEMBER or (
+            target != ChatParticipant.Roles.MEMBER
+            and actor != ChatParticipant.Roles.OWNER
+        ):
+            return Response({"detail": "Not allowed to remove this member"}, status=403)
+
+    with transaction.atomic():
+        if chat.remove_member(user_id):
+            OutboxEvent.enqueue(
+                chat.id, {"type": "chat.member_removed", "user_id": user_id}
+            )
+    return Response(status=status.HTTP_204_NO_CONTENT)
+
+
+# Lowercase hex SHA-256 digest
+_SHA256_RE = re.compile(r"^[0-9a-f]{64}$")
+
+
+@api_view(["POST"])
+@permission_classes([IsAuthenticated])
+def attachments_view(request):
+    """
+    API endpoint to start an attachment upload.
+
+    The file is then sent in chunks with ``PATCH /attachments/<id>/`` and,
+    once complete, attached to a message through ``attachment_ids``.
+
+    POST Data:
+        - filename: Name of the file (required, max 255 characters)
+        - size: Size of the file in bytes (required, at most
+          ``ATTACHMENT_MAX_SIZE``)
+        - content_type: MIME type (default ``application/octet-stream``)
+        - sha256: Optional hex SHA-256 of the file; the upload is rejected
+          and restarted if the received content does not match
+
+    Returns:
+        - 201: The attachment, with ``received`` 0
+        - 400: Invalid request data
+    """
+    filename = request.data.get("filename")
+    content_type = request.data.get("content_type") or "application/octet-stream"
+    size = request.data.get("size")
+    sha256 = request.data.get("sha256") or ""
+
+    if not isinstance(filename, str) or not 0 < len(filename.strip()) <= 255:
+        return Response({"detail": "filename is required"}, status=400)
+    if not isinstance(content_type, str) or len(content_type) > 255:
+        return Response({"detail": "content_type is invalid"}, status=400)
+    if (
+        not isinstance(size, int)
+        or isinstance(size, bool)
+        or not 0 < size <= settings.ATTACHMENT_MAX_SIZE
+    ):
+        return Response(
+            {
+                "detail": "size must be between 1 and "
+                f"{settings.ATTACHMENT_MAX_SIZE} bytes"
+            },
+            status=400,
+        )
+    if sha256 and (not isinstance(sha256, str) or not _SHA256_RE.match(sha256)):
+        return Response(
+            {"detail": "sha256 must be a lowercase hex digest"}, status=400
+        )
+
+    attachment = Attachment.objects.create(
+        uploader=request.user,
+        filename=filename.strip(),
+        content_type=content_type,
+        size=size,
+        expected_sha256=sha256,
+    )
+    return Response(AttachmentSerializer(attachment).data, status=201)
+
+
+@api_view(["GET", "PATCH"])
+@permission_classes([IsAuthenticated])
+def attachment_detail(request, attachment_id):
+    """
+    API endpoint to check on an upload or send its next chunk.
+
+    GET: The attachment; ``received`` is the offset to resume from
+    PATCH: Append a chunk. The raw request body holds the bytes and the
+    ``Upload-Offset`` header their offset, which must equal ``received``.
+    The upload completes with its last chunk: the file is hashed and
+    stored once per distinct content.
+
+    Only the uploader can see or continue an upload.
+
+    Args:
+        attachment_id: UUID of the attachment
+
+    Returns:
+        - 200: The attachment, with an ``Upload-Offset`` header
+        - 400: Missing or invalid offset or body, or a digest mismatch
+          (the upload restarts from offset 0)
+        - 404: Attachment not found
+        - 409: Offset is not the current one (the body holds ``received``),
+          or the upload is already complete
+        - 413: Chunk larger than ``ATTACHMENT_CHUNK_MAX_SIZE``
+    """
+    attachment = get_object_or_404(
+        Attachment, id=attachment_id, uploader_id=request.user.id
+    )
+
+    if request.method == "PATCH":
+        try:
+            offset = int(request.headers["Upload-Offset"])
+            length = int(request.META.get("CONTENT_LENGTH") or 0)
+        except (KeyError, ValueError):
+            return Response(
+                {"detail": "Upload-Offset header is required"}, status=400
+            )
+        if length > settings.ATTACHMENT_CHUNK_MAX_SIZE:
+            return Response(
+                {
+                    "detail": "Chunks are limited to "
+                    f"{settings.ATTACHMENT_CHUNK_MAX_SIZE} bytes"
+                },
+                status=413,
+            )
+        if offset < 0 or length <= 0 or offset + length > attachment.size:
+            return Response(
+                {"detail": "Chunk must be non-empty and within the file"},
+                status=400,
+            )
+
+        try:
+            attachment = write_chunk(attachment.id, offset, request.stream, length)
+        except UploadConflict as e:
+            return Response(
+                {"detail": str(e), "received": e.received}, status=409
+            )
+        except ValueError as e:
+            return Response({"detail": str(e)}, status=400)
+
+    response = Response(AttachmentSerializer(attachment).data)
+    response["Upload-Offset"] = str(attachment.received)
+    return response
+
+
+@api_view(["GET"])
+@permission_classes([IsAuthenticated])
+def attachment_content(request, attachment_id):
+    """
+    API endpoint to download an attachment.
+
+    Supports single byte ``Range`` requests (with ``If-Range``) so clients
+    can resume downloads and seek in media. Content never changes, so the
+    response carries its SHA-256 as ``ETag`` and may be cached for good;
+    ``If-None-Match`` revalidation gets a 304.
+
+    Files are always sent as downloads (``Content-Disposition: attachment``)
+    so uploaded HTML is never rendered by the browser.
+
+    Permissions:
+        The uploader, and participants of the chat the attachment was sent to
+
+    Args:
+        attachment_id: UUID of the attachment
+
+    Returns:
+        - 200: The whole file
+        - 206: The requested range
+        - 304: The client's copy is current
+        - 404: Attachment not found, not complete or not visible to the user
+        - 416: The range cannot be satisfied
+    """
+    attachment = get_object_or_404(
+        Attachment, id=attachment_id, blob__isnull=False
+    )
+    if attachment.uploader_id != request.user.id:
+        chat_id = (
+            Message.objects.filter(id=attachment.message_id)
+            .values_list("chat_id", flat=True)
+            .first()
+        )
+        if chat_id is None or not Chat.has_participant(chat_id, request.user.id):
+            return Response(
+                {"detail": "Attachment not found"}, status=status.HTTP_404_NOT_FOUND
+            )
+
+    size = attachment.size
+    etag = f'"{attachment.blob_id}"'
+    headers = {
+        "Accept-Ranges": "bytes",
+        "ETag": etag,
+        "Cache-Control": "private, max-age=31536000, immutable",
+        "Content-Disposition": content_disposition_header(
+            True, attachment.filename
+        ),
+    }
+
+    if_none_match = request.headers.get("If-None-Match")
+    if if_none_match and set(parse_etags(if_none_match)) & {etag, "*"}:
+        return HttpResponse(status=status.HTTP_304_NOT_MODIFIED, headers=headers)
+
+    byte_range = None
+    range_header = request.headers.get("Range")
+    if range_header and request.headers.get("If-Range", etag) == etag:
+        try:
+            byte_range = parse_range(range_header, size)
+        except ValueError:
+            headers["Content-Range"] = f"bytes */{size}"
+            return HttpResponse(
+                status=status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE,
+                headers=headers,
+            )
+
+    path = blob_path(attachment.blob_id)
+    if byte_range is None:
+        response = FileResponse(
+            open(path, "rb"), content_type=attachment.content_type
+        )
+    else:
+        start, end = byte_range
+        length = end - start + 1
+        headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+        headers["Content-Length"] = str(length)
+        response = StreamingHttpResponse(
+            iter_range(path, start, length),
+            status=status.HTTP_206_PARTIAL_CONTENT,
+            content_type=attachment.content_type,
+        )
+    for name, value in headers.items():
+        response[name] = value
+    return response
+
+
+@api_view(["POST"])
+@permission_classes([IsAdmin])
+def drain_view(request):
+    """
+    Drain the WebSocket connections of every running ASGI process.
+
+    Processes started before this request stop accepting WebSocket
+    connections and close theirs gradually, telling each client when to
+    reconnect (see ``chat.drain``). Processes started afterwards, such as
+    a new release, are not affected.
+
+    Request Body:
+        - window_seconds (int, optional): Seconds over which each process
+          closes its connections (default: CHAT_DRAIN_WINDOW_SECONDS)
+
+    Returns:
+        - 202: Drain requested; processes pick it up within
+          CHAT_DRAIN_POLL_SECONDS
+        - 400: Invalid window
+        - 403: Not an admin
+    """
+    window = request.data.get("window_seconds", settings.CHAT_DRAIN_WINDOW_SECONDS)
+    if not isinstance(window, int) or isinstance(window, bool) or window < 0:
+        return Response(
+            {"detail": "window_seconds must be a non-negative integer"}, status=400
+        )
+
+    drain = request_drain(window)
+    return Response(
+        {
+            "window_seconds": drain["window"],
+            "poll_seconds": settings.CHAT_DRAIN_POLL_SECONDS,
+        },
+        status=status.HTTP_202_ACCEPTED,
+    )
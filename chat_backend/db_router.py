@@ -0,0 +1,264 @@
+"""
+Database routing for read replicas.
+
+Reads go to one of ``settings.DATABASE_REPLICAS`` and writes always go to
+``default``. Three rules keep that safe for chat traffic:
+
+- Reads inside a transaction on ``default`` stay on the primary.
+- Once a request has written, the rest of it reads from the primary.
+- After a user writes, their reads are pinned to the primary for
+  ``REPLICA_PIN_SECONDS`` (tracked in the shared cache), so users always
+  see their own messages even while replicas lag.
+
+Replicas are picked with "power of two choices": two healthy replicas are
+sampled and the one with the lower load score (latency EWMA times queries
+in flight in this process) wins. A replica that raises a connection error,
+or lags by more than ``REPLICA_MAX_LAG_SECONDS``, is skipped until its next
+health check ``REPLICA_HEALTH_CHECK_SECONDS`` later. When no replica is
+usable, reads fall back to the primary.
+"""
+
+import contextvars
+import logging
+import random
+import threading
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, InterfaceError, OperationalError
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.utils.functional import SimpleLazyObject, empty
+
+logger = logging.getLogger(__name__)
+
+# Per-request routing state (None outside of HTTP requests)
+_request_state = contextvars.ContextVar("db_routing_state", default=None)
+
+# Lag query that reports 0 on a primary and on a fully caught-up replica
+_LAG_SQL = """
+    SELECT CASE
+        WHEN NOT pg_is_in_recovery()
+            OR pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+        ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0)
+    END
+"""
+
+
+def pin_key(user_id) -> str:
+    """Return the cache key marking a user as pinned to the primary."""
+    return f"db:pin:{user_id}"
+
+
+class _RequestState:
+    """Routing facts gathered while serving one request."""
+
+    __slots__ = ("request", "user_id", "wrote", "pinned")
+
+    def __init__(self, request=None, user_id=None):
+        self.request = request
+        self.user_id = user_id
+        self.wrote = False
+        self.pinned = None
+
+    def current_user_id(self):
+        """
+        Return the authenticated user's ID, if it is known without a query.
+
+        DRF copies the authenticated user onto the Django request, so after
+        authentication the user is a plain attribute. An unevaluated lazy
+        user from Django's auth middleware is ignored because resolving it
+        here would route a query from inside the router.
+        """
+        if self.user_id is None and self.request is not None:
+            user = self.request.__dict__.get("user")
+            if isinstance(user, SimpleLazyObject):
+                user = None if user._wrapped is empty else user._wrapped
+            if user is not None and user.is_authenticated:
+                self.user_id = user.pk
+        return self.user_id
+
+
+class _ReplicaStats:
+    """Load and health bookkeeping for one replica in this process."""
+
+    __slots__ = ("latency_ms", "inflight", "healthy", "checked_at")
+
+    def __init__(self):
+        self.latency_ms = 1.0
+        self.inflight = 0
+        self.healthy = True
+        self.checked_at = 0.0
+
+    def score(self) -> float:
+        return self.latency_ms * (self.inflight + 1)
+
+
+class ReplicaPool:
+    """
+    Picks a replica for each read based on load and health.
+
+    Latency and in-flight counts are collected by an execute wrapper that is
+    installed on every replica connection as it is created.
+    """
+
+    # Weight of the newest sample in the latency moving average
+    ALPHA = 0.2
+
+    def __init__(self, aliases):
+        self.aliases = list(aliases)
+        self.stats = {alias: _ReplicaStats() for alias in self.aliases}
+        self.lock = threading.Lock()
+
+    def choose(self):
+        """
+        Return the alias of the replica to read from, or None for the primary.
+        """
+        candidates = [alias for alias in self.aliases if self._is_usable(alias)]
+        if not candidates:
+            return None
+        if len(candidates) == 1:
+            return candidates[0]
+        a, b = random.sample(candidates, 2)
+        return a if self.stats[a].score() <= self.stats[b].score() else b
+
+    def _is_usable(self, alias) -> bool:
+        stats = self.stats[alias]
+        now = time.monotonic()
+        if now - stats.checked_at >= settings.REPLICA_HEALTH_CHECK_SECONDS:
+            stats.checked_at = now
+            stats.healthy = self._check(alias)
+        return stats.healthy
+
+    def _check(self, alias) -> bool:
+        """Probe a replica's connection and replication lag."""
+        try:
+            with connections[alias].cursor() as cursor:
+                cursor.execute(_LAG_SQL)
+                lag = float(cursor.fetchone()[0])
+        except DatabaseError:
+            logger.warning("Replica %s failed its health check", alias, exc_info=True)
+            return False
+
+        if lag > settings.REPLICA_MAX_LAG_SECONDS:
+            logger.warning("Replica %s is %.1fs behind, skipping it", alias, lag)
+            return False
+        return True
+
+    def mark_down(self, alias):
+        """Take a replica out of rotation until its next health check."""
+        stats = self.stats[alias]
+        stats.healthy = False
+        stats.checked_at = time.monotonic()
+
+    def execute_wrapper(self, alias):
+        """Build an execute wrapper that records load for ``alias``."""
+        stats = self.stats[alias]
+
+        def wrapper(execute, sql, params, many, context):
+            with self.lock:
+                stats.inflight += 1
+            started = time.perf_counter()
+            try:
+                return execute(sql, params, many, context)
+            except (OperationalError, InterfaceError):
+                self.mark_down(alias)
+                raise
+            finally:
+                elapsed = (time.perf_counter() - started) * 1000
+                with self.lock:
+                    stats.inflight -= 1
+                    stats.latency_ms += self.ALPHA * (elapsed - stats.latency_ms)
+
+        return wrapper
+
+
+class ReplicaRouter:
+    """
+    Django database router sending reads to replicas and writes to primary.
+    """
+
+    def __init__(self):
+        self.pool = ReplicaPool(settings.DATABASE_REPLICAS)
+        connection_created.connect(self._on_connection_created, weak=False)
+
+    def _on_connection_created(self, sender, connection, **kwargs):
+        if connection.alias in self.pool.stats:
+            connection.execute_wrappers.append(
+                self.pool.execute_wrapper(connection.alias)
+            )
+
+    def db_for_read(self, model, **hints):
+        if not self.pool.aliases:
+            return DEFAULT_DB_ALIAS
+
+        # Keep reads inside a primary transaction on the primary
+        if connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return DEFAULT_DB_ALIAS
+
+        state = _request_state.get()
+        if state is not None and self._is_pinned(state):
+            return DEFAULT_DB_ALIAS
+
+        return self.pool.choose() or DEFAULT_DB_ALIAS
+
+    def db_for_write(self, model, **hints):
+        state = _request_state.get()
+        if state is not None:
+            state.wrote = True
+            user_id = state.current_user_id()
+            if user_id is not None and not state.pinned:
+                state.pinned = True
+                cache.set(pin_key(user_id), 1, settings.REPLICA_PIN_SECONDS)
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the same data as the primary
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == DEFAULT_DB_ALIAS
+
+    def _is_pinned(self, state) -> bool:
+        if state.wrote:
+            return True
+        if state.pinned is None:
+            user_id = state.current_user_id()
+            if user_id is None:
+                return False
+            state.pinned = bool(cache.get(pin_key(user_id)))
+        return state.pinned
+
+
+@contextmanager
+def routing_context(request=None, user_id=None):
+    """
+    Track writes and read pinning for one unit of work.
+
+    Used by ``ReplicaPinningMiddleware`` for HTTP requests and by WebSocket
+    consumers, which know their user from the JWT rather than a request.
+
+    Args:
+        request: Django request whose authenticated user should be pinned
+        user_id (int, optional): User ID when there is no request
+    """
+    token = _request_state.set(_RequestState(request, user_id))
+    try:
+        yield
+    finally:
+        _request_state.reset(token)
+
+
+class ReplicaPinningMiddleware:
+    """
+    Middleware that scopes replica routing decisions to each request.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        with routing_context(request):
+            return self.get_response(request)
@@ -0,0 +1,50 @@
+"""
+JSONB query filters shared by the chat and users APIs.
+
+``Message.metadata`` and ``User.other_info`` carry GIN indexes with the
+default ``jsonb_ops`` operator class, which serves both filters built here:
+containment (``@>``) and top-level key existence (``?``). The smaller
+``jsonb_path_ops`` class cannot serve key existence at all, so the indexes
+keep ``jsonb_ops``; ``bench_jsonb_indexes`` reports the size difference.
+"""
+
+import json
+
+from django.db.models import Q
+
+
+def json_filter(query_params, param: str, field: str) -> Q:
+    """
+    Build a filter on a JSONB field from query parameters.
+
+    ``?{param}={"k": "v"}`` keeps rows whose field contains the given JSON
+    object, and each ``?{param}_has=k`` keeps rows that have the top-level
+    key ``k``. Both forms are served by a GIN index on the field.
+
+    Args:
+        query_params: Request query parameters
+        param (str): Name of the query parameter
+        field (str): Name of the model's JSON field
+
+    Returns:
+        Q: The filter (empty when neither parameter is present)
+
+    Raises:
+        ValueError: If the containment value is not a JSON object
+    """
+    condition = Q()
+
+    contains = query_params.get(param)
+    if contains is not None:
+        try:
+            value = json.loads(contains)
+        except json.JSONDecodeError:
+            value = None
+        if not isinstance(value, dict):
+            raise ValueError(f"{param} must be a JSON object")
+        condition &= Q(**{f"{field}__contains": value})
+
+    for key in query_params.getlist(f"{param}_has"):
+        condition &= Q(**{f"{field}__has_key": key})
+
+    return condition
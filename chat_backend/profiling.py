@@ -0,0 +1,368 @@
+"""
+On-demand profiling of single requests and WebSocket frames.
+
+An admin (``users.permissions.IsAdmin``) asks for a profile by sending an
+``X-Profile: 1`` header or a ``?profile=1`` query parameter with an HTTP
+request, or ``"profile": true`` inside a WebSocket frame. That one unit of
+work then runs under ``cProfile`` with every SQL query timed, and the result
+is stored in the shared cache for ``PROFILE_TTL_SECONDS``. The response
+carries the profile's ID in an ``X-Profile-Id`` header (WebSocket clients
+get a ``{"type": "profile"}`` frame), and admins fetch it from
+``/api/profiles/``: as JSON with the slowest functions and queries, or as a
+``.prof`` file for ``pstats`` or snakeviz.
+
+Nothing is installed for requests that do not ask for a profile: the
+middleware checks for the flag and calls the view, and execute wrappers
+and profilers only exist while a profile is being captured. With
+``PROFILING_ENABLED=0`` the middleware is removed entirely.
+
+For a WebSocket frame the event loop is profiled while the frame is
+handled, so awaits may attribute some time to other connections served by
+the same loop. Sync work passed through ``traced`` is profiled in the
+thread that runs it.
+
+A thread runs at most one profiler (Python 3.12 refuses a second one), so
+a capture asked for while another one profiles the same thread, e.g. a
+frame of another connection on the same event loop, is skipped: the work
+runs unprofiled and no profile ID is returned.
+"""
+
+import cProfile
+import marshal
+import pstats
+import threading
+import time
+import uuid
+from contextlib import ExitStack, contextmanager
+from contextvars import ContextVar
+from types import SimpleNamespace
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.http import HttpResponse
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.decorators import api_view, permission_classes
+from rest_framework.exceptions import APIException
+from rest_framework.request import Request
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+
+from users.permissions import IsAdmin
+
+# Profile being captured by the current request or frame (None otherwise)
+_current = ContextVar("profile", default=None)
+
+# Cache key of the list of recently captured profile IDs
+_INDEX_KEY = "profiles:index"
+
+# Per-thread flag, set while a profiler is enabled on the thread
+_profiling = threading.local()
+
+
+def _is_profiling() -> bool:
+    """Return whether a profiler is enabled on the current thread."""
+    return getattr(_profiling, "active", False)
+
+
+def profile_key(profile_id) -> str:
+    """Return the cache key of a stored profile."""
+    return f"profiles:{profile_id}"
+
+
+def is_admin(user) -> bool:
+    """
+    Check whether a user may capture profiles.
+
+    Args:
+        user: Authenticated user (or None)
+
+    Returns:
+        bool: True if ``IsAdmin`` grants the user access
+    """
+    if user is None:
+        return False
+    # IsAdmin only looks at request.user
+    return IsAdmin().has_permission(SimpleNamespace(user=user), None)
+
+
+class Profile:
+    """CPU profiles and SQL timings collected for one request or frame."""
+
+    def __init__(self, user_id, target):
+        self.id = uuid.uuid4().hex
+        self.user_id = user_id
+        self.target = target
+        self.created_at = timezone.now()
+        self.duration_ms = 0.0
+        self.queries = []
+        self.query_count = 0
+        self.query_ms = 0.0
+        self.profilers = []
+        # Threads running traced work update the profile concurrently
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def attach(self):
+        """
+        Profile the current thread and time its queries until exit.
+
+        Does nothing if a profiler is already enabled on the thread.
+        """
+        if _is_profiling():
+            yield
+            return
+
+        profiler = cProfile.Profile()
+        with self._lock:
+            self.profilers.append(profiler)
+        with ExitStack() as stack:
+            for alias in connections:
+                stack.enter_context(
+                    connections[alias].execute_wrapper(self._wrapper(alias))
+                )
+            _profiling.active = True
+            try:
+                profiler.enable()
+                yield
+            finally:
+                profiler.disable()
+                _profiling.active = False
+
+    def _wrapper(self, alias):
+        def wrapper(execute, sql, params, many, context):
+            started = time.perf_counter()
+            try:
+                return execute(sql, params, many, context)
+            finally:
+                elapsed = (time.perf_counter() - started) * 1000
+                with self._lock:
+                    self.query_count += 1
+                    self.query_ms += elapsed
+                    if len(self.queries) < settings.PROFILE_MAX_QUERIES:
+                        # Parameters are left out: they may hold user data
+                        self.queries.append(
+                            {
+                                "alias": alias,
+                                "sql": sql,
+                                "many": many,
+                                "ms": round(elapsed, 3),
+                            }
+                        )
+
+        return wrapper
+
+    def stats(self) -> dict:
+        """Merge the collected CPU profiles into one ``pstats`` dictionary."""
+        return pstats.Stats(*self.profilers).stats
+
+    def save(self):
+        """Store the profile in the shared cache and list it in the index."""
+        timeout = settings.PROFILE_TTL_SECONDS
+        cache.set(
+            profile_key(self.id),
+            {
+                "id": self.id,
+                "user_id": self.user_id,
+                "target": self.target,
+                "created_at": self.created_at.isoformat(),
+                "duration_ms": round(self.duration_ms, 3),
+                "query_count": self.query_count,
+                "query_ms": round(self.query_ms, 3),
+                "queries": self.queries,
+                "stats": marshal.dumps(self.stats()),
+            },
+            timeout,
+        )
+        index = [self.id] + (cache.get(_INDEX_KEY) or [])
+        cache.set(_INDEX_KEY, index[: settings.PROFILE_INDEX_SIZE], timeout)
+
+
+@contextmanager
+def capture(user_id, target):
+    """
+    Profile the enclosed request or frame handling and store the result.
+
+    Args:
+        user_id (int): ID of the admin who asked for the profile
+        target (str): What is being profiled, e.g. ``"GET /api/chats/"``
+
+    Yields:
+        Profile: The profile, saved when the block exits, or None if another
+        capture is profiling this thread
+    """
+    if _is_profiling():
+        yield None
+        return
+
+    profile = Profile(user_id, target)
+    token = _current.set(profile)
+    started = time.perf_counter()
+    try:
+        with profile.attach():
+            yield profile
+    finally:
+        profile.duration_ms = (time.perf_counter() - started) * 1000
+        _current.reset(token)
+        profile.save()
+
+
+def traced(fn):
+    """
+    Make a sync function join the profile being captured, if any.
+
+    Wrap functions handed to ``database_sync_to_async`` from code that may
+    run under ``capture``: they run in another thread, which the capturing
+    thread's profiler and execute wrappers do not see.
+
+    Args:
+        fn: The function to run
+
+    Returns:
+        fn itself when no profile is being captured, else a wrapper
+    """
+    profile = _current.get()
+    if profile is None:
+        return fn
+
+    def run(*args, **kwargs):
+        with profile.attach():
+            return fn(*args, **kwargs)
+
+    return run
+
+
+class ProfilingMiddleware:
+    """
+    Middleware profiling requests that ask for it, for admins only.
+    """
+
+    def __init__(self, get_response):
+        if not settings.PROFILING_ENABLED:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if "HTTP_X_PROFILE" not in request.META and "profile" not in request.GET:
+            return self.get_response(request)
+
+        user = self._authenticate(request)
+        if not is_admin(user):
+            return self.get_response(request)
+
+        with capture(user.pk, f"{request.method} {request.path}") as profile:
+            response = self.get_response(request)
+        if profile is not None:
+            response["X-Profile-Id"] = profile.id
+        return response
+
+    def _authenticate(self, request):
+        """Authenticate the request the way the API views will."""
+        drf_request = Request(
+            request,
+            authenticators=[
+                auth() for auth in api_settings.DEFAULT_AUTHENTICATION_CLASSES
+            ],
+        )
+        try:
+            return drf_request.user
+        except APIException:
+            # Let the view reject the credentials
+            return None
+
+
+@api_view(["GET"])
+@permission_classes([IsAdmin])
+def profile_list(request):
+    """
+    List the recently captured profiles, newest first.
+
+    Method: GET
+    Permissions: IsAdmin
+
+    Returns:
+        200: Profile summaries (without queries and CPU statistics)
+    """
+    ids = cache.get(_INDEX_KEY) or []
+    stored = cache.get_many([profile_key(profile_id) for profile_id in ids])
+    results = []
+    for profile_id in ids:
+        profile = stored.get(profile_key(profile_id))
+        if profile is not None:
+            results.append(
+                {k: v for k, v in profile.items() if k not in ("queries", "stats")}
+            )
+    return Response(results)
+
+
+@api_view(["GET"])
+@permission_classes([IsAdmin])
+def profile_detail(request, profile_id):
+    """
+    Show a profile's slowest functions and its SQL queries.
+
+    Method: GET
+    Permissions: IsAdmin
+
+    Query Parameters:
+        - limit (int, optional): Number of functions to list (default 30)
+
+    Returns:
+        200: Profile with ``functions`` sorted by cumulative time
+        404: Unknown or expired profile
+    """
+    profile = cache.get(profile_key(profile_id))
+    if profile is None:
+        return Response(
+            {"detail": "Profile not found"}, status=status.HTTP_404_NOT_FOUND
+        )
+
+    try:
+        limit = max(1, int(request.query_params.get("limit", 30)))
+    except ValueError:
+        return Response(
+            {"detail": "limit must be an integer"},
+            status=status.HTTP_400_BAD_REQUEST,
+        )
+
+    stats = marshal.loads(profile.pop("stats"))
+    rows = sorted(stats.items(), key=lambda item: item[1][3], reverse=True)
+    profile["functions"] = [
+        {
+            "function": f"{filename}:{line}({name})",
+            "calls": nc,
+            "primitive_calls": cc,
+            "total_ms": round(tt * 1000, 3),
+            "cumulative_ms": round(ct * 1000, 3),
+        }
+        for (filename, line, name), (cc, nc, tt, ct, _) in rows[:limit]
+    ]
+    return Response(profile)
+
+
+@api_view(["GET"])
+@permission_classes([IsAdmin])
+def profile_download(request, profile_id):
+    """
+    Download a profile's CPU statistics as a ``.prof`` file.
+
+    The file loads with ``python -m pstats`` or snakeviz.
+
+    Method: GET
+    Permissions: IsAdmin
+
+    Returns:
+        200: The marshalled ``pstats`` data
+        404: Unknown or expired profile
+    """
+    profile = cache.get(profile_key(profile_id))
+    if profile is None:
+        return Response(
+            {"detail": "Profile not found"}, status=status.HTTP_404_NOT_FOUND
+        )
+
+    response = HttpResponse(profile["stats"], content_type="application/octet-stream")
+    response["Content-Disposition"] = f'attachment; filename="{profile_id}.prof"'
+    return response
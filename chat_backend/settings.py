@@ -56,6 +56,8 @@ MIDDLEWARE = [
     "django.middleware.common.CommonMiddleware",
     "django.middleware.csrf.CsrfViewMiddleware",
     "django.contrib.auth.middleware.AuthenticationMiddleware",
+    "chat_backend.profiling.ProfilingMiddleware",
+    "chat_backend.db_router.ReplicaPinningMiddleware",
     "django.contrib.messages.middleware.MessageMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
 ]
@@ -96,16 +98,202 @@ DATABASES = {
     }
 }
 
+# Connection management, selected with DB_POOL_MODE:
+# - "pool" (default): share a psycopg 3 connection pool between all threads
+#   of a process (requires psycopg[pool]). Under ASGI every request runs in
+#   its own thread, so this is the only mode that bounds connections there.
+# - "persistent": reuse each thread's connection for DB_CONN_MAX_AGE seconds
+#   (suited to WSGI workers with long-lived threads)
+# - "pgbouncer": persistent connections to a pgbouncer in transaction pooling
+#   mode, with server-side cursors disabled as transaction pooling requires
+# - "none": open and close a connection for every request
+DB_POOL_MODE = os.environ.get("DB_POOL_MODE", "pool")
+
+if DB_POOL_MODE == "pool":
+    DATABASES["default"]["OPTIONS"] = {
+        "pool": {
+            "min_size": int(os.environ.get("DB_POOL_MIN_SIZE", "2")),
+            "max_size": int(os.environ.get("DB_POOL_MAX_SIZE", "10")),
+            # Seconds to wait for a free connection before raising
+            "timeout": float(os.environ.get("DB_POOL_TIMEOUT", "10")),
+            # Seconds an idle connection above min_size is kept
+            "max_idle": float(os.environ.get("DB_POOL_MAX_IDLE", "300")),
+        }
+    }
+elif DB_POOL_MODE in ("persistent", "pgbouncer"):
+    DATABASES["default"]["CONN_MAX_AGE"] = int(
+        os.environ.get("DB_CONN_MAX_AGE", "60")
+    )
+    DATABASES["default"]["CONN_HEALTH_CHECKS"] = True
+    if DB_POOL_MODE == "pgbouncer":
+        DATABASES["default"]["DISABLE_SERVER_SIDE_CURSORS"] = True
+
+# Read replicas, e.g. POSTGRES_REPLICA_HOSTS=replica1:5432,replica2:5432
+# Each replica mirrors "default" in tests (chat_backend.settings_test adds
+# one when none is configured, so the router is always exercised).
+DATABASE_REPLICAS = []
+for index, host in enumerate(
+    filter(None, os.environ.get("POSTGRES_REPLICA_HOSTS", "").split(",")), start=1
+):
+    replica_host, _, replica_port = host.strip().partition(":")
+    alias = f"replica_{index}"
+    DATABASES[alias] = {
+        **DATABASES["default"],
+        "HOST": replica_host,
+        "PORT": replica_port or DATABASES["default"]["PORT"],
+        "TEST": {"MIRROR": "default"},
+    }
+    DATABASE_REPLICAS.append(alias)
+
+DATABASE_ROUTERS = ["chat_backend.db_router.ReplicaRouter"]
+
+# Seconds a user's reads stay on the primary after they write
+REPLICA_PIN_SECONDS = int(os.environ.get("REPLICA_PIN_SECONDS", "5"))
+# Seconds between health checks of each replica
+REPLICA_HEALTH_CHECK_SECONDS = int(os.environ.get("REPLICA_HEALTH_CHECK_SECONDS", "10"))
+# Replicas lagging further behind than this are skipped
+REPLICA_MAX_LAG_SECONDS = float(os.environ.get("REPLICA_MAX_LAG_SECONDS", "5"))
+
 AUTH_USER_MODEL = "users.User"
+AUTHENTICATION_BACKENDS = ["users.backends.PooledModelBackend"]
 
 REDIS_URL = os.environ.get("REDIS_URL", "redis://localhost:6379/1")
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.redis.RedisCache",
+        "LOCATION": REDIS_URL,
+    },
+}
+
+# Channel layer: chat groups are sharded across CHANNEL_REDIS_URLS (comma
+# separated, defaults to REDIS_URL) on a consistent hash ring. "core" queues
+# messages per channel in Redis lists; "pubsub" publishes them to the
+# subscribed processes directly, with lower fan-out latency.
+CHANNEL_REDIS_URLS = [
+    url.strip()
+    for url in os.environ.get("CHANNEL_REDIS_URLS", REDIS_URL).split(",")
+    if url.strip()
+]
+CHANNEL_LAYER_BACKEND = os.environ.get("CHANNEL_LAYER_BACKEND", "core")
+CHANNEL_LAYER_BACKENDS = {
+    "core": "chat_backend.channel_layers.ShardedRedisChannelLayer",
+    "pubsub": "chat_backend.channel_layers.ShardedRedisPubSubChannelLayer",
+}
 CHANNEL_LAYERS = {
     "default": {
-        "BACKEND": "channels_redis.core.RedisChannelLayer",
-        "CONFIG": {"hosts": [REDIS_URL]},
+        "BACKEND": CHANNEL_LAYER_BACKENDS[CHANNEL_LAYER_BACKEND],
+        "CONFIG": {"hosts": CHANNEL_REDIS_URLS},
     },
 }
 
+# Chat
+# Participant inbox rows are rewritten at most once per window per chat
+CHAT_ACTIVITY_COALESCE_SECONDS = int(
+    os.environ.get("CHAT_ACTIVITY_COALESCE_SECONDS", "2")
+)
+# Chats kept per user in the Redis inbox set; larger inboxes read from Postgres
+CHAT_INBOX_MAX_ENTRIES = int(os.environ.get("CHAT_INBOX_MAX_ENTRIES", "1000"))
+# Largest allowed group chat
+CHAT_GROUP_MAX_MEMBERS = int(os.environ.get("CHAT_GROUP_MAX_MEMBERS", "500"))
+# Participants embedded per chat in chat listings (the rest are paginated)
+CHAT_MEMBER_PREVIEW_SIZE = int(os.environ.get("CHAT_MEMBER_PREVIEW_SIZE", "5"))
+
+# Outbox dispatcher (python manage.py dispatch_outbox)
+CHAT_OUTBOX_BATCH_SIZE = int(os.environ.get("CHAT_OUTBOX_BATCH_SIZE", "100"))
+# Seconds a claimed batch stays reserved for one dispatcher
+CHAT_OUTBOX_LEASE_SECONDS = int(os.environ.get("CHAT_OUTBOX_LEASE_SECONDS", "30"))
+CHAT_OUTBOX_MAX_ATTEMPTS = int(os.environ.get("CHAT_OUTBOX_MAX_ATTEMPTS", "10"))
+CHAT_OUTBOX_MAX_BACKOFF_SECONDS = int(
+    os.environ.get("CHAT_OUTBOX_MAX_BACKOFF_SECONDS", "60")
+)
+# Idle wake-up interval when no NOTIFY arrives
+CHAT_OUTBOX_POLL_SECONDS = float(os.environ.get("CHAT_OUTBOX_POLL_SECONDS", "1"))
+
+# Replay buffer for resumed WebSocket sessions (events kept per chat, and
+# seconds they are kept after the chat's last broadcast)
+CHAT_REPLAY_BUFFER_SIZE = int(os.environ.get("CHAT_REPLAY_BUFFER_SIZE", "200"))
+CHAT_REPLAY_TTL_SECONDS = int(os.environ.get("CHAT_REPLAY_TTL_SECONDS", "300"))
+
+# Recent-message cache for first-page history reads: messages kept per chat,
+# chats kept in each process, and an optional Redis tier shared by processes
+CHAT_MESSAGE_CACHE_SIZE = int(os.environ.get("CHAT_MESSAGE_CACHE_SIZE", "50"))
+CHAT_MESSAGE_CACHE_CHATS = int(os.environ.get("CHAT_MESSAGE_CACHE_CHATS", "1000"))
+CHAT_MESSAGE_CACHE_REDIS = os.environ.get("CHAT_MESSAGE_CACHE_REDIS", "1") == "1"
+CHAT_MESSAGE_CACHE_TTL_SECONDS = int(
+    os.environ.get("CHAT_MESSAGE_CACHE_TTL_SECONDS", "600")
+)
+# Seconds a message's client_key is remembered in the cache; older retries
+# are still caught by the message_client_key_uniq constraint
+CHAT_IDEMPOTENCY_TTL_SECONDS = int(
+    os.environ.get("CHAT_IDEMPOTENCY_TTL_SECONDS", "600")
+)
+
+# Typing indicators: at most one broadcast per user and chat per interval;
+# clients drop an indicator that was not refreshed within the TTL
+CHAT_TYPING_INTERVAL_SECONDS = int(os.environ.get("CHAT_TYPING_INTERVAL_SECONDS", "3"))
+CHAT_TYPING_TTL_SECONDS = int(os.environ.get("CHAT_TYPING_TTL_SECONDS", "6"))
+
+# Batched WebSocket frames (clients opt in with the "chat.batch" subprotocol):
+# frames are held for up to the window, or until this many are waiting
+CHAT_WS_BATCH_WINDOW_MS = int(os.environ.get("CHAT_WS_BATCH_WINDOW_MS", "20"))
+CHAT_WS_BATCH_MAX_FRAMES = int(os.environ.get("CHAT_WS_BATCH_MAX_FRAMES", "50"))
+
+# WebSocket drain before deploys (see chat.drain): signal starting a drain
+# (empty to disable), seconds over which connections are closed, maximum
+# random reconnect delay given to clients, and seconds between checks for
+# drain requests made through /api/chats/drain/
+CHAT_DRAIN_SIGNAL = os.environ.get("CHAT_DRAIN_SIGNAL", "SIGUSR2")
+CHAT_DRAIN_WINDOW_SECONDS = int(os.environ.get("CHAT_DRAIN_WINDOW_SECONDS", "30"))
+CHAT_DRAIN_RECONNECT_SPREAD_MS = int(
+    os.environ.get("CHAT_DRAIN_RECONNECT_SPREAD_MS", "5000")
+)
+CHAT_DRAIN_POLL_SECONDS = int(os.environ.get("CHAT_DRAIN_POLL_SECONDS", "5"))
+
+# Attachments: stored on local disk under ATTACHMENT_ROOT (see chat.attachments),
+# uploaded in chunks of at most ATTACHMENT_CHUNK_MAX_SIZE bytes
+ATTACHMENT_ROOT = Path(os.environ.get("ATTACHMENT_ROOT", BASE_DIR / "attachments"))
+ATTACHMENT_MAX_SIZE = int(os.environ.get("ATTACHMENT_MAX_SIZE", str(100 * 2**20)))
+ATTACHMENT_CHUNK_MAX_SIZE = int(
+    os.environ.get("ATTACHMENT_CHUNK_MAX_SIZE", str(8 * 2**20))
+)
+CHAT_MESSAGE_MAX_ATTACHMENTS = int(os.environ.get("CHAT_MESSAGE_MAX_ATTACHMENTS", "10"))
+
+# Message enrichment (python manage.py enrich_messages, see chat.enrichment):
+# processors run off the send path and store their results in metadata
+CHAT_ENRICHMENT_ENABLED = os.environ.get("CHAT_ENRICHMENT_ENABLED", "1") == "1"
+CHAT_ENRICHMENT_PROCESSORS = [
+    "chat.processors.MentionProcessor",
+    "chat.processors.LinkProcessor",
+    "chat.processors.FlagProcessor",
+]
+CHAT_ENRICHMENT_BATCH_SIZE = int(os.environ.get("CHAT_ENRICHMENT_BATCH_SIZE", "50"))
+CHAT_ENRICHMENT_CONCURRENCY = int(os.environ.get("CHAT_ENRICHMENT_CONCURRENCY", "8"))
+# Seconds an unacknowledged entry waits before it is retried
+CHAT_ENRICHMENT_RETRY_SECONDS = int(
+    os.environ.get("CHAT_ENRICHMENT_RETRY_SECONDS", "30")
+)
+CHAT_ENRICHMENT_MAX_ATTEMPTS = int(os.environ.get("CHAT_ENRICHMENT_MAX_ATTEMPTS", "5"))
+CHAT_ENRICHMENT_POLL_SECONDS = float(
+    os.environ.get("CHAT_ENRICHMENT_POLL_SECONDS", "1")
+)
+# Entries kept in the Redis stream when no worker keeps up
+CHAT_ENRICHMENT_STREAM_MAXLEN = int(
+    os.environ.get("CHAT_ENRICHMENT_STREAM_MAXLEN", "100000")
+)
+# Message retention (python manage.py purge_messages, see chat.retention):
+# days messages are kept unless a chat sets its own (0 keeps them forever)
+CHAT_RETENTION_DAYS = int(os.environ.get("CHAT_RETENTION_DAYS", "0"))
+CHAT_RETENTION_BATCH_SIZE = int(os.environ.get("CHAT_RETENTION_BATCH_SIZE", "1000"))
+# Pause after each deleted batch, so replicas and writers keep up
+CHAT_RETENTION_PAUSE_MS = int(os.environ.get("CHAT_RETENTION_PAUSE_MS", "100"))
+
+# Comma-separated words that FlagProcessor reports in a message's "flags"
+CHAT_FLAGGED_TERMS = [
+    term.strip()
+    for term in os.environ.get("CHAT_FLAGGED_TERMS", "").split(",")
+    if term.strip()
+]
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -162,7 +350,7 @@ CORS_ALLOW_ALL_ORIGINS = not CORS_ALLOWED_ORIGINS
 # DRF
 REST_FRAMEWORK = {
     "DEFAULT_AUTHENTICATION_CLASSES": (
-        "rest_framework_simplejwt.authentication.JWTAuthentication",
+        "users.authentication.ClaimsJWTAuthentication",
     ),
     "DEFAULT_PERMISSION_CLASSES": ("rest_framework.permissions.IsAuthenticated",),
     "DEFAULT_PAGINATION_CLASS": "rest_framework.pagination.PageNumberPagination",
@@ -178,3 +366,26 @@ SIMPLE_JWT = {
     "SIGNING_KEY": SECRET_KEY,
     "AUTH_HEADER_TYPES": ("Bearer",),
 }
+
+# User profile cache behind ClaimsJWTAuthentication: seconds a cached
+# profile is trusted (the staleness bound for deactivation) and users
+# cached per process
+USER_CACHE_SECONDS = int(os.environ.get("USER_CACHE_SECONDS", "60"))
+USER_CACHE_MAX_ENTRIES = int(os.environ.get("USER_CACHE_MAX_ENTRIES", "10000"))
+
+# Distinct user IDs accepted by one bulk profile lookup (/api/users/lookup/)
+USERS_LOOKUP_MAX_IDS = int(os.environ.get("USERS_LOOKUP_MAX_IDS", "100"))
+
+# Password hashing pool (users.hashing): threads hashing passwords, and jobs
+# allowed to wait for one before requests are rejected with 429
+PASSWORD_HASH_WORKERS = int(os.environ.get("PASSWORD_HASH_WORKERS", "2"))
+PASSWORD_HASH_MAX_PENDING = int(os.environ.get("PASSWORD_HASH_MAX_PENDING", "8"))
+
+# On-demand profiling of requests and WebSocket frames for admins
+# (chat_backend.profiling): profiles are kept in the cache for
+# PROFILE_TTL_SECONDS, the newest PROFILE_INDEX_SIZE are listed, and at most
+# PROFILE_MAX_QUERIES queries are recorded per profile
+PROFILING_ENABLED = os.environ.get("PROFILING_ENABLED", "1") == "1"
+PROFILE_TTL_SECONDS = int(os.environ.get("PROFILE_TTL_SECONDS", "86400"))
+PROFILE_INDEX_SIZE = int(os.environ.get("PROFILE_INDEX_SIZE", "100"))
+PROFILE_MAX_QUERIES = int(os.environ.get("PROFILE_MAX_QUERIES", "1000"))
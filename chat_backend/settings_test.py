@@ -0,0 +1,55 @@
+"""
+Django settings for the test suite.
+
+``manage.py test`` loads this module instead of ``chat_backend.settings``.
+It keeps tests away from development data and makes them fast:
+
+- Redis (cache, inboxes, replay buffers, ...) uses its own database,
+  ``TEST_REDIS_URL``, which the tests flush between cases.
+- Channel layer groups live in memory, so WebSocket tests need no Redis
+  listener and see their own broadcasts.
+- Without ``POSTGRES_REPLICA_HOSTS``, a ``replica_1`` alias mirrors
+  ``default``: a second connection to the test database, so reads are
+  routed (and pinned) exactly as with a real replica.
+- WebSocket tests run their event loop off the main thread, where no
+  drain signal handler can be installed, so none is configured.
+- Passwords are hashed with a fast hasher, and tokens are signed with a
+  key long enough for HS256.
+"""
+
+import os
+
+from .settings import *  # noqa: F401,F403
+from .settings import DATABASE_REPLICAS, DATABASES, SIMPLE_JWT
+
+TESTING = True
+
+SECRET_KEY = "test-secret-key-used-only-by-the-test-suite"
+SIMPLE_JWT = {**SIMPLE_JWT, "SIGNING_KEY": SECRET_KEY}
+
+REDIS_URL = os.environ.get("TEST_REDIS_URL", "redis://localhost:6379/15")
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.redis.RedisCache",
+        "LOCATION": REDIS_URL,
+    },
+}
+
+if not DATABASE_REPLICAS:
+    DATABASES["replica_1"] = {
+        **DATABASES["default"],
+        # Plain connections: a pool of its own would keep sessions open on
+        # the test database and block its removal at the end of the run
+        "OPTIONS": {},
+        "TEST": {"MIRROR": "default"},
+    }
+    DATABASE_REPLICAS = ["replica_1"]
+
+CHANNEL_REDIS_URLS = [REDIS_URL]
+CHANNEL_LAYERS = {
+    "default": {"BACKEND": "channels.layers.InMemoryChannelLayer"},
+}
+
+CHAT_DRAIN_SIGNAL = ""
+
+PASSWORD_HASHERS = ["django.contrib.auth.hashers.MD5PasswordHasher"]
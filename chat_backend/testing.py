@@ -0,0 +1,159 @@
+"""
+Helpers shared by the test suites of the project's apps.
+
+Tests run with ``chat_backend.settings_test`` (selected by ``manage.py
+test``), so flushing Redis here only ever touches the test database.
+
+- ``CacheTestMixin`` empties Redis and the per-process caches before each
+  test, so cached profiles, messages and inboxes never leak between tests.
+- ``api_client`` returns a DRF test client authenticated with a JWT, the
+  way real clients authenticate.
+- ``WebSocketClient`` drives the chat WebSocket routes in-process (the
+  ``channels.testing`` communicators need daphne, which is not a dependency).
+"""
+
+import asyncio
+import json
+
+from asgiref.testing import ApplicationCommunicator
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from rest_framework.test import APIClient
+
+
+def reset_caches():
+    """
+    Empty the test Redis database and the per-process caches.
+
+    Raises:
+        ImproperlyConfigured: Outside of ``chat_backend.settings_test``
+    """
+    from chat import message_cache
+    from chat.utils import get_redis
+    from users import cache as user_cache
+
+    if not getattr(settings, "TESTING", False):
+        raise ImproperlyConfigured("Refusing to flush Redis outside of tests")
+    get_redis().flushdb()
+    with user_cache._lock:
+        user_cache._local.clear()
+    with message_cache._lock:
+        message_cache._local.clear()
+
+
+class CacheTestMixin:
+    """Test case mixin starting every test with empty caches."""
+
+    def setUp(self):
+        super().setUp()
+        reset_caches()
+
+
+def access_token(user) -> str:
+    """
+    Issue an access token for a user, as the token endpoint would.
+
+    Args:
+        user (User): The user
+
+    Returns:
+        str: Encoded access token
+    """
+    from rest_framework_simplejwt.tokens import RefreshToken
+
+    return str(RefreshToken.for_user(user).access_token)
+
+
+def api_client(user=None) -> APIClient:
+    """
+    Build an API test client, authenticated as ``user`` when given.
+
+    Args:
+        user (User, optional): The user to authenticate as
+
+    Returns:
+        APIClient: The client
+    """
+    client = APIClient()
+    if user is not None:
+        client.credentials(HTTP_AUTHORIZATION=f"Bearer {access_token(user)}")
+    return client
+
+
+class WebSocketClient(ApplicationCommunicator):
+    """
+    In-process client of the project's WebSocket routes.
+
+    Args:
+        path (str): Request path, e.g. ``/ws/chats/1/``
+        query (str): Query string without the leading ``?``
+        subprotocols (list): Subprotocols offered by the client
+    """
+
+    def __init__(self, path, query="", subprotocols=()):
+        from channels.routing import URLRouter
+
+        from chat.routing import websocket_urlpatterns
+
+        scope = {
+            "type": "websocket",
+            "path": path,
+            "raw_path": path.encode(),
+            "query_string": query.encode(),
+            "headers": [(b"host", b"testserver")],
+            "subprotocols": list(subprotocols),
+            "client": ("127.0.0.1", 50000),
+            "server": ("testserver", 80),
+        }
+        super().__init__(URLRouter(websocket_urlpatterns), scope)
+
+    async def connect(self, timeout=5):
+        """
+        Open the connection.
+
+        Returns:
+            dict: The ``websocket.accept`` or ``websocket.close`` message
+        """
+        await self.send_input({"type": "websocket.connect"})
+        return await self.receive_output(timeout)
+
+    async def send_json(self, content):
+        """Send a JSON text frame."""
+        await self.send_input(
+            {"type": "websocket.receive", "text": json.dumps(content)}
+        )
+
+    async def receive_json(self, timeout=5):
+        """
+        Wait for the next frame.
+
+        Returns:
+            dict: The decoded JSON frame
+
+        Raises:
+            AssertionError: If the server closed the connection instead
+        """
+        message = await self.receive_output(timeout)
+        if message["type"] != "websocket.send":
+            raise AssertionError(f"Expected a frame, got {message}")
+        return json.loads(message["text"])
+
+    async def receive_close(self, timeout=5):
+        """
+        Wait for the server to close the connection, skipping frames.
+
+        Returns:
+            int: The close code
+        """
+        while True:
+            message = await self.receive_output(timeout)
+            if message["type"] == "websocket.close":
+                return message.get("code", 1000)
+
+    async def disconnect(self, code=1000, timeout=5):
+        """Close the connection from the client side and wait for cleanup."""
+        await self.send_input({"type": "websocket.disconnect", "code": code})
+        try:
+            await self.wait(timeout)
+        except asyncio.TimeoutError:
+            pass
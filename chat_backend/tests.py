@@ -0,0 +1,354 @@
+"""
+Tests for the project-level building blocks in ``chat_backend``.
+
+The replica router tests read through the ``replica_1`` alias that
+``chat_backend.settings_test`` mirrors on ``default``. They run outside of
+a wrapping transaction (``TransactionTestCase``), since reads inside a
+transaction always stay on the primary.
+
+The channel layer tests shard over two addresses of the test Redis server,
+which the hash ring treats as two hosts.
+"""
+
+import asyncio
+import marshal
+import threading
+from collections import Counter
+from unittest import mock
+from urllib.parse import urlsplit
+
+from channels.db import database_sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.db import (
+    DEFAULT_DB_ALIAS,
+    OperationalError,
+    connections,
+    router,
+    transaction,
+)
+from django.test import (
+    SimpleTestCase,
+    TestCase,
+    TransactionTestCase,
+    override_settings,
+)
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from chat.models import Chat
+from users.models import User
+
+from .admin_tools import EstimatedCountPaginator
+from .channel_layers import (
+    HashRing,
+    ShardedRedisChannelLayer,
+    ShardedRedisPubSubChannelLayer,
+)
+from .db_router import ReplicaRouter, pin_key, routing_context
+from .profiling import Profile, capture, profile_key
+from .testing import CacheTestMixin, WebSocketClient, access_token, api_client
+
+REPLICA = "replica_1"
+
+
+class ReplicaRouterTests(CacheTestMixin, TransactionTestCase):
+    """Read routing, read-your-writes pinning and replica health."""
+
+    databases = "__all__"
+
+    def setUp(self):
+        super().setUp()
+        self.router = next(r for r in router.routers if isinstance(r, ReplicaRouter))
+        self.pool = self.router.pool
+        self.reset_pool()
+        self.addCleanup(self.reset_pool)
+        self.alice = User.objects.create_user(email="alice@example.com")
+        self.bob = User.objects.create_user(email="bob@example.com")
+
+    def reset_pool(self):
+        for stats in self.pool.stats.values():
+            stats.healthy = True
+            stats.checked_at = 0.0
+            stats.inflight = 0
+
+    def read_db(self):
+        return User.objects.all().db
+
+    def test_reads_go_to_the_replica_and_writes_to_the_primary(self):
+        self.assertEqual(self.pool.aliases, [REPLICA])
+        self.assertEqual(self.read_db(), REPLICA)
+        self.assertEqual(User.objects.filter(id=self.alice.id).count(), 1)
+        self.assertEqual(self.alice._state.db, DEFAULT_DB_ALIAS)
+
+    def test_reads_inside_a_transaction_stay_on_the_primary(self):
+        with transaction.atomic():
+            self.assertEqual(self.read_db(), DEFAULT_DB_ALIAS)
+        self.assertEqual(self.read_db(), REPLICA)
+
+    def test_a_request_reads_its_own_writes(self):
+        with routing_context(user_id=self.alice.id):
+            self.assertEqual(self.read_db(), REPLICA)
+            self.router.db_for_write(User)
+            self.assertEqual(self.read_db(), DEFAULT_DB_ALIAS)
+
+    def test_writers_are_pinned_to_the_primary_for_a_while(self):
+        with routing_context(user_id=self.alice.id):
+            self.router.db_for_write(User)
+
+        # Later units of work of the same user, not those of other users
+        with routing_context(user_id=self.alice.id):
+            self.assertEqual(self.read_db(), DEFAULT_DB_ALIAS)
+        with routing_context(user_id=self.bob.id):
+            self.assertEqual(self.read_db(), REPLICA)
+
+        # The pin expires after REPLICA_PIN_SECONDS
+        cache.delete(pin_key(self.alice.id))
+        with routing_context(user_id=self.alice.id):
+            self.assertEqual(self.read_db(), REPLICA)
+
+    def test_api_reads_after_a_write_skip_the_replica(self):
+        chat, _ = Chat.get_or_create_1to1(self.alice.id, self.bob.id)
+        url = reverse("messages", args=[chat.id])
+        alice, bob = api_client(self.alice), api_client(self.bob)
+
+        response = alice.post(url, {"chat": chat.id, "content": "hi"}, format="json")
+        self.assertEqual(response.status_code, 201)
+
+        with CaptureQueriesContext(connections[REPLICA]) as replica_queries:
+            self.assertEqual(alice.get(url).status_code, 200)
+        self.assertEqual(len(replica_queries), 0)
+
+        with CaptureQueriesContext(connections[REPLICA]) as replica_queries:
+            response = bob.get(url)
+        self.assertEqual(response.data["results"][0]["content"], "hi")
+        self.assertGreater(len(replica_queries), 0)
+
+    def test_replica_marked_down_falls_back_to_the_primary(self):
+        self.pool.mark_down(REPLICA)
+        self.assertEqual(self.read_db(), DEFAULT_DB_ALIAS)
+
+    def test_connection_errors_mark_the_replica_down(self):
+        def execute(sql, params, many, context):
+            raise OperationalError("server closed the connection")
+
+        wrapper = self.pool.execute_wrapper(REPLICA)
+        with self.assertRaises(OperationalError):
+            wrapper(execute, "SELECT 1", (), False, {})
+
+        self.assertEqual(self.read_db(), DEFAULT_DB_ALIAS)
+        self.assertEqual(self.pool.stats[REPLICA].inflight, 0)
+
+    @override_settings(REPLICA_MAX_LAG_SECONDS=-1)
+    def test_lagging_replica_is_skipped(self):
+        # Any lag (even 0s) exceeds the limit, so the health check fails
+        with self.assertLogs("chat_backend.db_router", "WARNING"):
+            self.assertEqual(self.read_db(), DEFAULT_DB_ALIAS)
+
+    @override_settings(REPLICA_HEALTH_CHECK_SECONDS=0)
+    def test_recovered_replica_returns_at_its_next_check(self):
+        self.pool.mark_down(REPLICA)
+        self.assertEqual(self.read_db(), REPLICA)
+
+
+class HashRingTests(SimpleTestCase):
+    """Placement of chat groups on the consistent hash ring."""
+
+    hosts = [{"address": f"redis://redis-{i}:6379/0"} for i in range(4)]
+    groups = [f"chat_{i}" for i in range(2000)]
+
+    def placement(self, hosts):
+        ring = HashRing(hosts)
+        return {group: hosts[ring.index(group)]["address"] for group in self.groups}
+
+    def test_placement_ignores_host_order(self):
+        self.assertEqual(
+            self.placement(self.hosts), self.placement(self.hosts[::-1])
+        )
+
+    def test_groups_are_spread_over_all_hosts(self):
+        counts = Counter(self.placement(self.hosts).values())
+
+        self.assertEqual(len(counts), 4)
+        # 128 virtual nodes per host keep every share near 1/4
+        self.assertTrue(all(300 < count < 700 for count in counts.values()))
+
+    def test_adding_a_host_only_moves_its_share(self):
+        before = self.placement(self.hosts)
+        after = self.placement([*self.hosts, {"address": "redis://redis-4:6379/0"}])
+
+        moved = [group for group in self.groups if before[group] != after[group]]
+        # About 1/5 of the groups move, all of them to the new host
+        self.assertLess(len(moved), len(self.groups) * 0.3)
+        self.assertEqual({after[group] for group in moved}, {"redis://redis-4:6379/0"})
+
+
+class ShardedChannelLayerTests(CacheTestMixin, SimpleTestCase):
+    """Group messages delivered through layers sharded over two hosts."""
+
+    def setUp(self):
+        super().setUp()
+        # Two addresses of the test Redis: distinct ring hosts, one server
+        url = urlsplit(settings.REDIS_URL)
+        self.hosts = [
+            settings.REDIS_URL,
+            url._replace(netloc=f"127.0.0.1:{url.port or 6379}").geturl(),
+        ]
+
+    async def round_trip(self, layer):
+        channel = await layer.new_channel()
+        for chat_id in range(20):
+            await layer.group_add(f"chat_{chat_id}", channel)
+        for chat_id in range(20):
+            await layer.group_send(
+                f"chat_{chat_id}", {"type": "chat.test", "chat_id": chat_id}
+            )
+        received = [
+            (await asyncio.wait_for(layer.receive(channel), 5))["chat_id"]
+            for _ in range(20)
+        ]
+        for chat_id in range(20):
+            await layer.group_discard(f"chat_{chat_id}", channel)
+        return received
+
+    async def test_core_layer(self):
+        layer = ShardedRedisChannelLayer(hosts=self.hosts, prefix="test")
+        self.assertEqual(
+            {layer.consistent_hash(f"chat_{i}") for i in range(20)}, {0, 1}
+        )
+
+        self.assertEqual(sorted(await self.round_trip(layer)), list(range(20)))
+        await layer.flush()
+
+    async def test_pubsub_layer(self):
+        layer = ShardedRedisPubSubChannelLayer(hosts=self.hosts, prefix="test")
+
+        try:
+            self.assertEqual(sorted(await self.round_trip(layer)), list(range(20)))
+        finally:
+            await layer.flush()
+
+
+class ProfilingTests(CacheTestMixin, TransactionTestCase):
+    """Profiles of single requests and frames, captured for admins."""
+
+    databases = "__all__"
+
+    def setUp(self):
+        super().setUp()
+        self.admin = User.objects.create_user(
+            email="admin@example.com", role=User.Roles.ADMIN
+        )
+        self.user = User.objects.create_user(email="user@example.com")
+        self.client = api_client(self.admin)
+
+    def test_admin_request_is_profiled(self):
+        response = self.client.get(reverse("users_list"), HTTP_X_PROFILE="1")
+
+        profile_id = response["X-Profile-Id"]
+        listed = self.client.get(reverse("profile_list")).data
+        self.assertEqual([profile["id"] for profile in listed], [profile_id])
+        self.assertEqual(listed[0]["target"], "GET /api/users/")
+
+        detail = self.client.get(reverse("profile_detail", args=[profile_id])).data
+        self.assertGreater(detail["query_count"], 0)
+        self.assertIn("FROM", detail["queries"][0]["sql"])
+        self.assertTrue(detail["functions"])
+
+        download = self.client.get(reverse("profile_download", args=[profile_id]))
+        self.assertTrue(marshal.loads(download.content))
+
+    def test_query_flag(self):
+        response = self.client.get(reverse("users_list"), {"profile": "1"})
+
+        self.assertIn("X-Profile-Id", response)
+
+    def test_unflagged_and_non_admin_requests_are_not_profiled(self):
+        self.assertNotIn("X-Profile-Id", self.client.get(reverse("users_list")))
+        response = api_client(self.user).get(reverse("users_list"), HTTP_X_PROFILE="1")
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn("X-Profile-Id", response)
+
+        self.assertEqual(self.client.get(reverse("profile_list")).data, [])
+        response = api_client(self.user).get(reverse("profile_list"))
+        self.assertEqual(response.status_code, 403)
+
+    async def test_admin_frame_is_profiled(self):
+        chat, _ = await database_sync_to_async(Chat.get_or_create_1to1)(
+            self.admin.id, self.user.id
+        )
+        token = await database_sync_to_async(access_token)(self.admin)
+        socket = WebSocketClient(f"/ws/chats/{chat.id}/", f"token={token}")
+        await socket.connect()
+
+        await socket.send_json(
+            {"type": "message.send", "content": "hi", "profile": True}
+        )
+        frame = await socket.receive_json()
+        await socket.disconnect()
+
+        self.assertEqual(frame["type"], "profile")
+        stored = await cache.aget(profile_key(frame["data"]["id"]))
+        self.assertEqual(stored["target"], f"WS chat {chat.id} message.send")
+        # SQL run in the thread-sensitive executor is included
+        self.assertGreater(stored["query_count"], 0)
+
+    def test_overlapping_captures_are_skipped(self):
+        with capture(self.admin.id, "outer") as outer:
+            with capture(self.admin.id, "inner") as inner:
+                self.assertIsNone(inner)
+            # A request asking for a profile while one is being captured
+            response = self.client.get(reverse("users_list"), HTTP_X_PROFILE="1")
+            self.assertEqual(response.status_code, 200)
+            self.assertNotIn("X-Profile-Id", response)
+
+        listed = self.client.get(reverse("profile_list")).data
+        self.assertEqual([profile["id"] for profile in listed], [outer.id])
+        self.assertGreater(cache.get(profile_key(outer.id))["query_count"], 0)
+
+    def test_queries_from_several_threads_are_all_counted(self):
+        profile = Profile(self.admin.id, "threads")
+        wrapper = profile._wrapper(DEFAULT_DB_ALIAS)
+
+        def run_queries():
+            for _ in range(1000):
+                wrapper(lambda *args: None, "SELECT 1", (), False, {})
+
+        threads = [threading.Thread(target=run_queries) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(profile.query_count, 8000)
+        self.assertEqual(len(profile.queries), settings.PROFILE_MAX_QUERIES)
+
+class EstimatedCountPaginatorTests(TestCase):
+    """Changelist counts that stop counting past a limit."""
+
+    def setUp(self):
+        for i in range(5):
+            User.objects.create_user(email=f"user{i}@example.com")
+
+    def count(self, queryset):
+        return EstimatedCountPaginator(queryset.order_by("id"), 2).count
+
+    def test_small_lists_are_counted_exactly(self):
+        self.assertEqual(self.count(User.objects.all()), 5)
+        self.assertEqual(self.count(User.objects.filter(email__startswith="user1")), 1)
+
+    def test_large_tables_use_the_planner_statistics(self):
+        with mock.patch.object(
+            EstimatedCountPaginator, "_table_estimate", return_value=50000
+        ):
+            with self.assertNumQueries(0):
+                self.assertEqual(self.count(User.objects.all()), 50000)
+            # Filtered lists are still counted
+            self.assertEqual(self.count(User.objects.filter(id__gt=0)), 5)
+
+    def test_large_filtered_lists_are_estimated(self):
+        with mock.patch("chat_backend.admin_tools.EXACT_COUNT_LIMIT", 3):
+            count = self.count(User.objects.filter(email__endswith="example.com"))
+
+        # Never less than the rows seen; the planner guesses the rest
+        self.assertGreaterEqual(count, 4)
@@ -17,6 +17,7 @@ Including another URLconf
 
 from django.contrib import admin
 from django.urls import path, include
+from chat_backend import profiling
 from rest_framework_simplejwt.views import (
     TokenObtainPairView,
     TokenRefreshView,
@@ -32,4 +33,16 @@ urlpatterns = [
     # users
     path("api/users/", include("users.urls")),
     path("api/chats/", include("chat.urls")),
+    # request profiles (admins)
+    path("api/profiles/", profiling.profile_list, name="profile_list"),
+    path(
+        "api/profiles/<str:profile_id>/",
+        profiling.profile_detail,
+        name="profile_detail",
+    ),
+    path(
+        "api/profiles/<str:profile_id>/download/",
+        profiling.profile_download,
+        name="profile_download",
+    ),
 ]
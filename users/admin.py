@@ -1,20 +1,25 @@
 from django.contrib import admin
+
+from chat_backend.admin_tools import LargeTableAdmin
+
 from .models import User
 
 # Django Admin Configuration for Users App
 #
 # This module configures the Django admin interface for the User model,
 # providing an intuitive interface for administrators to manage users.
+# The user table can hold millions of rows, so the list is built on
+# LargeTableAdmin: estimated counts and index-backed prefix search.
 
 
 @admin.register(User)
-class UserAdmin(admin.ModelAdmin):
+class UserAdmin(LargeTableAdmin):
     """
     Admin interface configuration for the User model.
 
     Provides a comprehensive admin interface with:
     - List view showing key user information
-    - Search functionality across email, full name, and nickname
+    - Search by user ID, or by the start of an email, full name or nickname
     - Filtering and sorting capabilities
     """
 
@@ -30,5 +35,13 @@ class UserAdmin(admin.ModelAdmin):
     )
 
     # Fields that can be searched in the admin interface
-    # Enables quick user lookup by email, name, or nickname
-    search_fields = ("email", "full_name", "nickname")
+    # Prefix lookups, served by the *_prefix_idx indexes (icontains would
+    # scan the whole table)
+    search_fields = ("^email", "^full_name", "^nickname")
+    search_help_text = "User ID, or the start of an email, full name or nickname"
+
+    # Sidebar filters on low-cardinality fields
+    list_filter = ("role", "is_active", "is_staff")
+
+    # Newest users first, read from the primary key index
+    ordering = ("-id",)
@@ -18,3 +18,9 @@ class UsersConfig(AppConfig):
 
     # The app's module name/path
     name = "users"
+
+    def ready(self):
+        """
+        Connect the signal handlers that keep the user profile cache fresh.
+        """
+        from . import signals  # noqa: F401
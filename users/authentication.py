@@ -0,0 +1,52 @@
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+
+from .cache import get_profile
+from .models import ClaimsUser
+
+# Authentication Classes for Users App
+#
+# This module defines the JWT authentication used by the REST API.
+
+
+class ClaimsJWTAuthentication(JWTAuthentication):
+    """
+    JWT authentication that does not load the user from the database.
+
+    The request user is a ClaimsUser built from the token's ``user_id``
+    claim and the role in the user profile cache; any other field is loaded
+    lazily from the same cache on first access. Whether the user still
+    exists and is active is checked against the cache too, so a deactivated
+    or demoted user loses access within USER_CACHE_SECONDS.
+    """
+
+    def get_user(self, validated_token):
+        """
+        Build the request user from a validated token.
+
+        Args:
+            validated_token: The access token of the request
+
+        Returns:
+            ClaimsUser: The authenticated user
+
+        Raises:
+            InvalidToken: If the token carries no user ID
+            AuthenticationFailed: If the user does not exist or is inactive
+        """
+        try:
+            user_id = validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError as e:
+            raise InvalidToken(
+                _("Token contained no recognizable user identification")
+            ) from e
+
+        profile = get_profile(user_id)
+        if profile is None:
+            raise AuthenticationFailed(_("User not found"), code="user_not_found")
+        if api_settings.CHECK_USER_IS_ACTIVE and not profile["is_active"]:
+            raise AuthenticationFailed(_("User is inactive"), code="user_inactive")
+
+        return ClaimsUser.from_claims(user_id, profile["role"])
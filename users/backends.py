@@ -0,0 +1,66 @@
+from django.contrib.auth import get_user_model
+from django.contrib.auth.backends import ModelBackend
+from rest_framework.request import Request
+
+from .hashing import PasswordHashingBusy, check_user_password, hash_password
+
+# Authentication Backends for Users App
+#
+# This module defines the backend used by email + password logins (the JWT
+# token endpoint and the admin site).
+
+# Get the custom User model
+User = get_user_model()
+
+
+class PooledModelBackend(ModelBackend):
+    """
+    ModelBackend that hashes passwords on the bounded hashing pool.
+
+    Behaves like ModelBackend, including hashing once for unknown users so
+    that response times do not reveal which emails exist, but the hashing
+    runs on users.hashing's pool. When the pool is saturated, API logins
+    get PasswordHashingBusy (429); other logins, such as the admin site's,
+    which would turn the DRF exception into a 500, are rejected instead.
+    """
+
+    def authenticate(self, request, username=None, password=None, **kwargs):
+        """
+        Authenticate a user by email and password.
+
+        Args:
+            request: The current request (may be None)
+            username (str): Email of the user
+            password (str): Password to check
+
+        Returns:
+            User: The authenticated user, or None
+
+        Raises:
+            PasswordHashingBusy: If the hashing pool is saturated during an
+                API request
+        """
+        if username is None:
+            username = kwargs.get(User.USERNAME_FIELD)
+        if username is None or password is None:
+            return None
+
+        try:
+            return self._authenticate(username, password)
+        except PasswordHashingBusy:
+            if isinstance(request, Request):
+                raise
+            return None
+
+    def _authenticate(self, username, password):
+        """Check the credentials on the hashing pool."""
+        try:
+            user = User._default_manager.get_by_natural_key(username)
+        except User.DoesNotExist:
+            # Run the hasher anyway to keep timing uniform (Django #20760)
+            hash_password(password)
+            return None
+
+        if check_user_password(user, password) and self.user_can_authenticate(user):
+            return user
+        return None
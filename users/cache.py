@@ -0,0 +1,131 @@
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS
+
+from .models import User
+
+# User Profile Cache
+#
+# Caches the concrete fields of users (except the password hash) so that
+# request authentication and serializers do not read the users table on
+# every request. Profiles are kept in two tiers:
+#
+# - a per-process dict of at most USER_CACHE_MAX_ENTRIES users, each entry
+#   trusted for USER_CACHE_SECONDS;
+# - the shared Django cache, also for USER_CACHE_SECONDS.
+#
+# Saving or deleting a user drops its shared entry (see users.signals), so
+# changes such as deactivation reach every process within USER_CACHE_SECONDS.
+# get_profiles loads many users at once (one cache round trip, at most one
+# query); serializers render public profiles from it (see
+# PublicUserSerializer.from_cache).
+
+# Fields stored in a profile
+PROFILE_FIELDS = [
+    field.attname
+    for field in User._meta.concrete_fields
+    if field.attname != "password"
+]
+
+_local = OrderedDict()
+_lock = threading.Lock()
+
+
+def profile_key(user_id):
+    """
+    Build the shared cache key of a user's profile.
+
+    Args:
+        user_id (int): ID of the user
+
+    Returns:
+        str: Cache key
+    """
+    return f"users:profile:{user_id}"
+
+
+def get_profile(user_id):
+    """
+    Return the cached profile of a user, loading it if needed.
+
+    Args:
+        user_id (int): ID of the user
+
+    Returns:
+        dict: Field values by attribute name, or None if the user does not exist
+    """
+    user_id = int(user_id)
+    return get_profiles([user_id]).get(user_id)
+
+
+def get_profiles(user_ids):
+    """
+    Return the cached profiles of several users, loading missing ones.
+
+    Profiles missing from this process are read from the shared cache in
+    one round trip, and those missing there from the primary database in
+    one query.
+
+    Args:
+        user_ids (iterable): IDs of the users
+
+    Returns:
+        dict: Profiles by user ID; users that do not exist are left out
+    """
+    now = time.monotonic()
+    profiles = {}
+    missing = set()
+    with _lock:
+        for user_id in map(int, user_ids):
+            entry = _local.get(user_id)
+            if entry is not None and entry[0] > now:
+                profiles[user_id] = entry[1]
+            else:
+                missing.add(user_id)
+    if not missing:
+        return profiles
+
+    found = {
+        profile["id"]: profile
+        for profile in cache.get_many([profile_key(i) for i in missing]).values()
+    }
+    missing -= found.keys()
+    if missing:
+        # Read from the primary: a lagging replica could hand back a profile
+        # saved (and invalidated) moments ago, cached for USER_CACHE_SECONDS
+        rows = (
+            User.objects.using(DEFAULT_DB_ALIAS)
+            .filter(id__in=missing)
+            .values(*PROFILE_FIELDS)
+        )
+        loaded = {profile["id"]: profile for profile in rows}
+        cache.set_many(
+            {profile_key(i): profile for i, profile in loaded.items()},
+            settings.USER_CACHE_SECONDS,
+        )
+        found.update(loaded)
+
+    with _lock:
+        for user_id, profile in found.items():
+            _local[user_id] = (now + settings.USER_CACHE_SECONDS, profile)
+            _local.move_to_end(user_id)
+        while len(_local) > settings.USER_CACHE_MAX_ENTRIES:
+            _local.popitem(last=False)
+    profiles.update(found)
+    return profiles
+
+
+def invalidate(user_id):
+    """
+    Drop a user's profile from the shared cache and this process.
+
+    Args:
+        user_id (int): ID of the user
+    """
+    with _lock:
+        _local.pop(int(user_id), None)
+    cache.delete(profile_key(user_id))
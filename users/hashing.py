@@ -0,0 +1,110 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.contrib.auth.hashers import check_password, make_password
+from rest_framework.exceptions import Throttled
+
+# Bounded Password Hashing Pool
+#
+# Password hashing (PBKDF2) is deliberately slow. Run in request threads, a
+# burst of sign-ups or logins would take every thread of the shared ASGI
+# sync executor, which also serves chat requests and WebSocket consumers.
+#
+# Hashes are therefore computed on a dedicated pool of PASSWORD_HASH_WORKERS
+# threads (hashlib releases the GIL, so they run in parallel). At most
+# PASSWORD_HASH_MAX_PENDING further jobs may wait for a worker; beyond that,
+# requests fail fast with 429 instead of queueing, which bounds the number of
+# request threads an auth spike can hold.
+
+
+class PasswordHashingBusy(Throttled):
+    """
+    Raised when the hashing pool and its queue are full (HTTP 429).
+    """
+
+    default_detail = "Too many authentication requests, please retry shortly."
+
+
+_executor = None
+_slots = None
+_init_lock = threading.Lock()
+
+
+def _pool():
+    global _executor, _slots
+    if _executor is None:
+        with _init_lock:
+            if _executor is None:
+                workers = settings.PASSWORD_HASH_WORKERS
+                _slots = threading.BoundedSemaphore(
+                    workers + settings.PASSWORD_HASH_MAX_PENDING
+                )
+                _executor = ThreadPoolExecutor(
+                    max_workers=workers, thread_name_prefix="password-hash"
+                )
+    return _executor, _slots
+
+
+def run_hashing(fn, *args):
+    """
+    Run a hashing function on the pool and wait for its result.
+
+    Args:
+        fn: Function doing the hashing (must not use the database)
+        *args: Arguments for fn
+
+    Returns:
+        The return value of fn
+
+    Raises:
+        PasswordHashingBusy: If every worker is busy and the queue is full
+    """
+    executor, slots = _pool()
+    if not slots.acquire(blocking=False):
+        raise PasswordHashingBusy(wait=1)
+    try:
+        return executor.submit(fn, *args).result()
+    finally:
+        slots.release()
+
+
+def hash_password(raw_password):
+    """
+    Hash a password on the pool.
+
+    Args:
+        raw_password (str): The password to hash
+
+    Returns:
+        str: The encoded password, ready for User.password
+    """
+    return run_hashing(make_password, raw_password)
+
+
+def check_user_password(user, raw_password):
+    """
+    Check a user's password on the pool.
+
+    When the stored hash uses outdated parameters, the password is rehashed
+    on the pool as part of the check and saved here, like
+    AbstractBaseUser.check_password does.
+
+    Args:
+        user (User): The user to check
+        raw_password (str): The password to verify
+
+    Returns:
+        bool: True if the password is correct
+    """
+    upgraded = []
+
+    def setter(raw):
+        # Called on the pool thread when the hash needs upgrading
+        upgraded.append(make_password(raw))
+
+    valid = run_hashing(check_password, raw_password, user.password, setter)
+    if valid and upgraded:
+        user.password = upgraded[0]
+        user.save(update_fields=["password"])
+    return valid
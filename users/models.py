@@ -1,7 +1,8 @@
 from django.db import models
 from django.contrib.auth.base_user import BaseUserManager, AbstractBaseUser
 from django.contrib.auth.models import PermissionsMixin
-from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.indexes import GinIndex, OpClass
+from django.db.models.functions import Upper
 
 
 # Custom User Models and Manager
@@ -159,6 +160,19 @@ class User(AbstractBaseUser, PermissionsMixin):
         indexes = [
             # GIN index for efficient JSON field queries in PostgreSQL
             GinIndex(fields=["other_info"], name="users_other_info_gin"),
+            # Case-insensitive prefix searches of the admin user list
+            models.Index(
+                OpClass(Upper("email"), name="varchar_pattern_ops"),
+                name="users_email_prefix_idx",
+            ),
+            models.Index(
+                OpClass(Upper("full_name"), name="varchar_pattern_ops"),
+                name="users_full_name_prefix_idx",
+            ),
+            models.Index(
+                OpClass(Upper("nickname"), name="varchar_pattern_ops"),
+                name="users_nickname_prefix_idx",
+            ),
         ]
 
     def __str__(self):
@@ -169,3 +183,62 @@ class User(AbstractBaseUser, PermissionsMixin):
             str: The user's email address
         """
         return self.email
+
+
+class ClaimsUser(User):
+    """
+    User built from the claims of an access token, without a database read.
+
+    Only ``id`` and ``role`` are set when the instance is created; every other
+    field is deferred. The first access to a deferred field fills all of them
+    at once from the user profile cache (see users.cache), so requests that
+    only need the user's ID or role never read the users table.
+
+    Being a proxy of User, instances can be assigned to foreign keys and
+    compare equal to the full User with the same ID.
+    """
+
+    class Meta:
+        """
+        Meta options for the ClaimsUser proxy model.
+        """
+
+        proxy = True
+
+    @classmethod
+    def from_claims(cls, user_id, role):
+        """
+        Create a user from token claims.
+
+        Args:
+            user_id: ID of the user
+            role (str): Role of the user
+
+        Returns:
+            ClaimsUser: The user, with every other field deferred
+        """
+        return cls.from_db(None, ["id", "role"], [int(user_id), role])
+
+    def refresh_from_db(self, using=None, fields=None, from_queryset=None):
+        """
+        Load deferred fields from the profile cache instead of the database.
+
+        Fields the cache does not hold (the password hash) and full reloads
+        still go to the database.
+        """
+        from .cache import get_profile
+
+        deferred = self.get_deferred_fields()
+        if fields is None or not deferred.intersection(fields):
+            return super().refresh_from_db(using, fields, from_queryset)
+
+        profile = get_profile(self.pk)
+        if profile is None:
+            raise self.DoesNotExist("User no longer exists")
+        for attname, value in profile.items():
+            if attname in deferred:
+                setattr(self, attname, value)
+
+        remaining = [field for field in fields if field in self.get_deferred_fields()]
+        if remaining:
+            super().refresh_from_db(using, remaining, from_queryset)
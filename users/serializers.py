@@ -1,5 +1,7 @@
 from rest_framework import serializers
 from django.contrib.auth import get_user_model
+from .cache import get_profiles
+from .hashing import hash_password
 
 # Get the custom User model
 User = get_user_model()
@@ -50,9 +52,12 @@ class UserSerializer(serializers.ModelSerializer):
         Returns:
             User: The newly created user instance
 
+        Raises:
+            PasswordHashingBusy: If the password hashing pool is saturated (429)
+
         Note:
-            The password is properly hashed using Django's set_password method
-            before saving to ensure security.
+            The password is hashed on the bounded hashing pool (see
+            users.hashing) rather than in the request thread.
         """
         # Extract password to handle separately
         password = validated_data.pop("password")
@@ -61,7 +66,7 @@ class UserSerializer(serializers.ModelSerializer):
         user = User(**validated_data)
 
         # Hash and set the password securely
-        user.set_password(password)
+        user.password = hash_password(password)
         user.save()
 
         return user
@@ -78,6 +83,7 @@ class PublicUserSerializer(serializers.ModelSerializer):
     - User listings
     - Public profiles
     - Search results
+    - Bulk profile lookups and embedded senders/participants (from_cache)
     - Any context where sensitive data should not be exposed
     """
 
@@ -85,3 +91,20 @@ class PublicUserSerializer(serializers.ModelSerializer):
         model = User
         # Only include safe, public fields
         fields = ["id", "email", "full_name", "nickname"]
+
+    @classmethod
+    def from_cache(cls, user_ids):
+        """
+        Serialize users from the profile cache instead of the database.
+
+        Args:
+            user_ids (iterable): IDs of the users
+
+        Returns:
+            dict: Public data by user ID; users that do not exist are left out
+        """
+        return {
+            user_id: {field: profile[field] for field in cls.Meta.fields}
+            for user_id, profile in get_profiles(user_ids).items()
+        }
+
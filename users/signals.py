@@ -0,0 +1,24 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .cache import invalidate
+from .models import ClaimsUser, User
+
+# Signal Handlers for Users App
+#
+# Keeps the user profile cache in step with writes to the users table.
+
+
+@receiver(post_save, sender=User)
+@receiver(post_save, sender=ClaimsUser)
+@receiver(post_delete, sender=User)
+@receiver(post_delete, sender=ClaimsUser)
+def invalidate_profile(sender, instance, **kwargs):
+    """
+    Drop the cached profile of a saved or deleted user.
+
+    Args:
+        sender: The User model class
+        instance (User): The saved or deleted user
+    """
+    invalidate(instance.pk)
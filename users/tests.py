@@ -1,32 +1,227 @@
-from django.test import TestCase
+import threading
+from unittest import mock
+
+from django.contrib.auth.hashers import make_password
+from django.db import connections
+from django.test import Client, TestCase, TransactionTestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework_simplejwt.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.tokens import AccessToken
+
+from chat_backend.testing import CacheTestMixin, api_client
+
+from . import hashing
+from .authentication import ClaimsJWTAuthentication
+from .cache import get_profile, get_profiles, invalidate
+from .models import ClaimsUser, User
 
 # Unit Tests for Users App
 #
-# This module contains test cases for the users application.
-# Currently empty but should be expanded to include comprehensive tests for:
-#
-# Model Tests:
-# - User model creation and validation
-# - UserManager methods (create_user, create_superuser)
-# - Email uniqueness constraints
-# - Role assignment and validation
-# - JSONField functionality
+# Grouped by feature; every test starts with empty caches (see
+# chat_backend.testing):
 #
-# Serializer Tests:
-# - UserSerializer validation and creation
-# - PublicUserSerializer field exposure
-# - Password handling and security
-#
-# View Tests:
-# - User registration endpoint
-# - User listing and search functionality
-# - Authentication and permission requirements
-# - API response formats and status codes
-#
-# Permission Tests:
-# - IsAdmin permission class behavior
-# - Role-based access control
-#
-# TODO: Implement comprehensive test coverage for all components
+# - ClaimsAuthenticationTests: request users built from token claims and
+#   the profile cache
+# - UserSearchTests: listing users filtered on other_info
+# - PasswordHashingTests: sign-ups and logins on the bounded hashing pool
+# - UserAdminTests: primary key and prefix search in the admin
+# - ProfileCacheRoutingTests: profile cache misses read from the primary
+
+
+def make_user(name, **extra):
+    """Create a user whose email and nickname derive from ``name``."""
+    return User.objects.create_user(
+        email=f"{name}@example.com",
+        password="password",
+        full_name=name.title(),
+        nickname=name,
+        **extra,
+    )
+
+
+class ClaimsAuthenticationTests(CacheTestMixin, TestCase):
+    """Request users built from token claims and the profile cache."""
+
+    def setUp(self):
+        super().setUp()
+        self.admin = make_user("admin", role=User.Roles.ADMIN)
+        self.token = AccessToken.for_user(self.admin)
+
+    def authenticate(self):
+        return ClaimsJWTAuthentication().get_user(self.token)
+
+    def test_cached_user_needs_no_query(self):
+        get_profile(self.admin.id)
+
+        with self.assertNumQueries(0):
+            user = self.authenticate()
+            self.assertIsInstance(user, ClaimsUser)
+            self.assertEqual((user.id, user.role), (self.admin.id, "admin"))
+            # Other fields come from the profile cache too
+            self.assertEqual(user.email, "admin@example.com")
+
+    def test_deactivated_user_is_rejected(self):
+        self.authenticate()
+        self.admin.is_active = False
+        self.admin.save()
+
+        with self.assertRaises(AuthenticationFailed):
+            self.authenticate()
+
+    def test_role_comes_from_the_profile(self):
+        self.assertEqual(self.authenticate().role, "admin")
+        User.objects.filter(id=self.admin.id).update(role=User.Roles.USER)
+        invalidate(self.admin.id)
+
+        self.assertEqual(self.authenticate().role, "user")
+
+    def test_demoted_admin_loses_admin_endpoints(self):
+        client = api_client(self.admin)
+        self.assertEqual(client.get(reverse("profile_list")).status_code, 200)
+
+        self.admin.role = User.Roles.USER
+        self.admin.save()
+
+        # Same token, issued while the user was an admin
+        self.assertEqual(client.get(reverse("profile_list")).status_code, 403)
+
+
+class UserSearchTests(CacheTestMixin, TestCase):
+    """Listing users filtered on ``other_info``."""
+
+    def setUp(self):
+        super().setUp()
+        make_user("alice", other_info={"team": "core", "timezone": "UTC"})
+        make_user("bob", other_info={"team": "web"})
+        self.client = api_client(make_user("carol"))
+
+    def nicknames(self, params):
+        response = self.client.get(reverse("users_list"), params)
+        self.assertEqual(response.status_code, 200)
+        return [user["nickname"] for user in response.data]
+
+    def test_containment(self):
+        self.assertEqual(self.nicknames({"other_info": '{"team": "core"}'}), ["alice"])
+
+    def test_key_existence(self):
+        self.assertEqual(self.nicknames({"other_info_has": "team"}), ["alice", "bob"])
+        self.assertEqual(self.nicknames({"other_info_has": "timezone"}), ["alice"])
+
+    def test_value_must_be_a_json_object(self):
+        response = self.client.get(reverse("users_list"), {"other_info": '"core"'})
+
+        self.assertEqual(response.status_code, 400)
+
+
+class PasswordHashingTests(CacheTestMixin, TestCase):
+    """Sign-ups and logins hashing passwords on the bounded pool."""
+
+    def setUp(self):
+        super().setUp()
+        self.client = api_client()
+
+    def register(self, email="dave@example.com"):
+        return self.client.post(
+            reverse("register"),
+            {"email": email, "password": "password", "full_name": "Dave"},
+            format="json",
+        )
+
+    def login(self, password="password"):
+        return self.client.post(
+            reverse("token_obtain_pair"),
+            {"email": "dave@example.com", "password": password},
+            format="json",
+        )
+
+    def test_passwords_are_hashed_on_the_pool(self):
+        threads = []
+
+        def tracked(*args, **kwargs):
+            threads.append(threading.current_thread().name)
+            return make_password(*args, **kwargs)
+
+        with mock.patch("users.hashing.make_password", tracked):
+            self.assertEqual(self.register().status_code, 201)
+
+        self.assertTrue(threads[0].startswith("password-hash"))
+        user = User.objects.get(email="dave@example.com")
+        self.assertTrue(user.check_password("password"))
+
+    def test_login(self):
+        self.register()
+
+        self.assertEqual(self.login().status_code, 200)
+        self.assertEqual(self.login("wrong-password").status_code, 401)
+
+    def test_full_pool_answers_429(self):
+        self.register()
+        executor, _ = hashing._pool()
+
+        # Every worker and queue slot taken
+        with mock.patch.object(
+            hashing, "_pool", return_value=(executor, threading.Semaphore(0))
+        ):
+            self.assertEqual(self.register("erin@example.com").status_code, 429)
+            self.assertEqual(self.login().status_code, 429)
+
+        self.assertFalse(User.objects.filter(email="erin@example.com").exists())
+
+    def test_full_pool_rejects_admin_logins(self):
+        User.objects.create_superuser(email="staff@example.com", password="pw")
+        executor, _ = hashing._pool()
+
+        with mock.patch.object(
+            hashing, "_pool", return_value=(executor, threading.Semaphore(0))
+        ):
+            response = Client().post(
+                reverse("admin:login"),
+                {"username": "staff@example.com", "password": "pw"},
+            )
+
+        # The login form again, with its error, rather than a server error
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.context["form"].errors)
+
+
+class UserAdminTests(CacheTestMixin, TestCase):
+    """Searching users in the admin."""
+
+    def setUp(self):
+        super().setUp()
+        self.alice = make_user("alice")
+        self.bob = make_user("bob")
+        staff = User.objects.create_superuser(email="staff@example.com", password="pw")
+        self.client.force_login(staff)
+
+    def search(self, term):
+        url = reverse("admin:users_user_changelist")
+        response = self.client.get(url, {"q": term})
+        self.assertEqual(response.status_code, 200)
+        return list(response.context["cl"].result_list)
+
+    def test_search_by_id(self):
+        self.assertEqual(self.search(str(self.bob.id)), [self.bob])
+
+    def test_search_by_prefix(self):
+        self.assertEqual(self.search("ALI"), [self.alice])
+        self.assertEqual(self.search("bob@"), [self.bob])
+        # Not a prefix of any searched field
+        self.assertEqual(self.search("lice"), [])
+
+
+class ProfileCacheRoutingTests(CacheTestMixin, TransactionTestCase):
+    """Profile cache misses loaded from the primary."""
+
+    databases = "__all__"
+
+    def test_misses_are_read_from_the_primary(self):
+        alice = make_user("alice")
+        invalidate(alice.id)
+
+        with CaptureQueriesContext(connections["replica_1"]) as replica_queries:
+            profiles = get_profiles([alice.id])
 
-# Create your tests here.
+        self.assertEqual(profiles[alice.id]["email"], "alice@example.com")
+        self.assertEqual(len(replica_queries), 0)
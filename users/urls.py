@@ -13,6 +13,10 @@ urlpatterns = [
     # Query params: ?q=search_term (optional)
     # Permissions: IsAuthenticated (requires login)
     path("", views.list_users, name="users_list"),
+    # Bulk profile lookup endpoint
+    # GET /users/lookup/?ids=1,2,3 - Public profiles of the given users
+    # Permissions: IsAuthenticated (requires login)
+    path("lookup/", views.lookup_users, name="users_lookup"),
     # User registration endpoint
     # POST /users/register/ - Create a new user account
     # Permissions: AllowAny (public endpoint)
@@ -1,9 +1,11 @@
+from django.conf import settings
 from django.shortcuts import render
 from django.contrib.auth import get_user_model
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework.permissions import AllowAny, IsAuthenticated
 from rest_framework.response import Response
 from rest_framework import status
+from chat_backend.json_filters import json_filter
 from .serializers import UserSerializer, PublicUserSerializer
 
 # User Management Views
@@ -63,6 +65,9 @@ def list_users(request):
 
     Query Parameters:
         - q (str, optional): Search query to filter users by full_name, nickname, or email
+        - other_info (str, optional): JSON object the user's other_info must contain
+        - other_info_has (str, optional): Top-level other_info key the user must
+          have (repeatable)
 
     Search Logic:
         The search is case-insensitive and matches partial strings in:
@@ -70,8 +75,11 @@ def list_users(request):
         - nickname (contains search term)
         - email (contains search term)
 
+    The other_info filters are served by the users_other_info_gin index.
+
     Returns:
         200: List of users (public information only)
+        400: other_info is not a JSON object
         401: Authentication required
 
     Note:
@@ -92,5 +100,62 @@ def list_users(request):
             | qs.filter(email__icontains=q)
         )
 
+    # Apply the JSON filters on other_info
+    try:
+        qs = qs.filter(json_filter(request.query_params, "other_info", "other_info"))
+    except ValueError as e:
+        return Response({"detail": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
     # Return only public user information
     return Response(PublicUserSerializer(qs, many=True).data)
+
+
+@api_view(["GET"])
+@permission_classes([IsAuthenticated])
+def lookup_users(request):
+    """
+    Look up the public profiles of several users by ID.
+
+    Lets clients resolve the user IDs they hold (senders, participants) in
+    one request. Profiles come from the shared user profile cache; users
+    missing from it are loaded in a single query.
+
+    Method: GET
+    Permissions: IsAuthenticated (requires valid authentication)
+
+    Query Parameters:
+        - ids (str): Comma-separated user IDs (repeatable), at most
+          USERS_LOOKUP_MAX_IDS distinct IDs
+
+    Returns:
+        200: Public information of the users found, in request order
+        400: ids is missing, malformed or lists too many users
+        401: Authentication required
+    """
+    try:
+        ids = [
+            int(part)
+            for value in request.query_params.getlist("ids")
+            for part in value.split(",")
+            if part.strip()
+        ]
+    except ValueError:
+        return Response(
+            {"detail": "ids must be comma-separated integers"},
+            status=status.HTTP_400_BAD_REQUEST,
+        )
+
+    # Keep the first occurrence of each ID
+    ids = list(dict.fromkeys(ids))
+    if not ids:
+        return Response(
+            {"detail": "ids is required"}, status=status.HTTP_400_BAD_REQUEST
+        )
+    if len(ids) > settings.USERS_LOOKUP_MAX_IDS:
+        return Response(
+            {"detail": f"At most {settings.USERS_LOOKUP_MAX_IDS} ids per request"},
+            status=status.HTTP_400_BAD_REQUEST,
+        )
+
+    profiles = PublicUserSerializer.from_cache(ids)
+    return Response([profiles[user_id] for user_id in ids if user_id in profiles])